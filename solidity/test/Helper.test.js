@@ -0,0 +1,30 @@
+const toWei = web3.toWei;
+const chai =require('chai');
+chai.use(require('chai-as-promised')); // Order is important
+chai.should();
+
+const Helper = artifacts.require('Helper');
+
+
+contract('Helper', function(accounts) {
+
+    // same vectors are computed off-chain by autoranker (utils/autoranker/commit_journal.py, commit_hash)
+    // keccak256 of abi.encodePacked(direction, stake, salt) as three uint256
+    let vectors = [
+        [0, toWei(100), 1, '0xc0d6d13f20541242e91f0c659f5eea80bbdd2195ba50707f4849bb3f46e2a171'],
+        [1, toWei(183), 2, '0xb7e2e1dcb21ee58d491cfccf4da1529f0a6c17af8b0527af5b996e9c93bb4188'],
+        [1, toWei(20), 99999999, '0xf756fe663c429f80e01ba577bb6d045124ecfac35c8164fd7ec94d6a83ca9560'],
+    ];
+
+    describe('getCommitHash', function() {
+        before(async function() {
+            this.helper = await Helper.new();
+        });
+
+        it('matches off-chain commit hashes', async function() {
+            for (let [direction, stake, salt, expected] of vectors) {
+                await this.helper.getCommitHash(direction, stake, salt).should.eventually.be.equal(expected);
+            }
+        });
+    });
+});
@@ -4,6 +4,7 @@ from __future__ import print_function
 import os
 import sys
 import time
+import threading
 import argparse
 from queue import Queue
 from urllib.request import urlopen, Request
@@ -22,7 +23,6 @@ from web3 import Web3, HTTPProvider, TestRPCProvider
 from web3.contract import ConciseContract
 from web3.middleware import geth_poa_middleware
 from web3.exceptions import BadFunctionCallOutput
-from web3.utils.events import get_event_data
 
 # from eth_abi import encode_abi, decode_abi, encode_single, decode_single
 
@@ -37,6 +37,25 @@ from ecdsa import SigningKey, SECP256k1
 import logging
 logger = logging.getLogger('autoranker')
 
+from rpc_batch import BatchCaller, RpcCounter, DEFAULT_BATCH_SIZE
+from nonce_manager import NonceManager, is_nonce_error, is_known_tx_error, is_underpriced_error
+from play_engine import PlayEngine
+from event_index import EventIndex
+from rank_trajectory import RankTrajectories
+from ranking_mirror import RankingMirror
+from catalog_snapshot import CatalogSnapshot
+from view_cache import ViewCache
+from receipt_tracker import ReceiptTracker
+from failover_provider import FailoverHTTPProvider
+from rate_limiter import RateLimiter, LANE_BULK
+from metrics import Metrics
+from fee_engine import FeeEngine
+from gas_model import GasModel
+from commit_journal import CommitJournal, commit_hash
+from voting_keeper import VotingKeeper
+from unstake_keeper import UnstakeKeeper
+from commission_model import CommissionModel
+
 
 INIT_RANK = 300000000000000000000
 
@@ -49,14 +68,28 @@ class Autoranker(object):
     def __init__(self, config, dapps):
         self.config = config
         self.dapps = dapps
-        self.web3 = Web3(Web3.HTTPProvider(config['eth_http_node']))
+        # first node is primary, transactions are sent only through it
+        # rpc_rate - requests per second budget of provider (None - unlimited)
+        self.rpc_limiter = RateLimiter(config.get('rpc_rate'), config.get('rpc_burst'))
+        self.provider = FailoverHTTPProvider(config['eth_http_nodes'],
+                                             pool_size=config.get('rpc_pool_size', 32),
+                                             health_check_interval=config.get('rpc_health_check_interval', 60),
+                                             limiter=self.rpc_limiter)
+        self.web3 = Web3(self.provider)
         # need for Rinkeby network
         self.web3.middleware_stack.inject(geth_poa_middleware, layer=0)
+        self.rpc_counter = RpcCounter()
+        self.web3.middleware_stack.add(self.rpc_counter.middleware, 'rpc_counter')
+        self.metrics = Metrics()
+        for abi_name in ('tcrank_abi', 'faucet_abi', 'helper_abi'):
+            self.metrics.add_abi(config[abi_name])
+        self.web3.middleware_stack.add(self.metrics.middleware, 'metrics')
+        self.batch_caller = BatchCaller(self.provider, config.get('rpc_batch_size', DEFAULT_BATCH_SIZE), self.metrics)
 
         if (not self.web3.isConnected()):
-            raise Exception("[ERROR] Web3 is not connected to {}: {}".format(config['eth_http_node'], self.web3))
+            raise Exception("[ERROR] Web3 is not connected to {}: {}".format(', '.join(config['eth_http_nodes']), self.web3))
 
-        logger.debug("Connected to node, provider: {}".format(config['eth_http_node']))
+        logger.debug("Connected to node, provider: {}".format(self.provider))
         if (not config.get('accounts')):
             raise Exception("[ERROR] Accounts was not loaded from file '{}'".format(config['keys_file']))
         
@@ -64,6 +97,26 @@ class Autoranker(object):
         sk = SigningKey.from_string(bytes().fromhex(self.private_key), curve=SECP256k1)
         self.public_key = self.config['accounts'][0]['public_key']
         self.address = self.web3.toChecksumAddress(self.config['accounts'][0]['address'])
+        # every account of keys pack signs its own votes with its own nonce stream, first one is also faucet
+        for account in self.config['accounts']:
+            account['address'] = self.web3.toChecksumAddress(account['address'])
+        self.nonce_manager = NonceManager(self.web3)
+        self.receipt_tracker = ReceiptTracker(self.web3,
+                                              confirmations=config.get('tx_confirmations', 0),
+                                              poll_interval=config.get('receipt_poll_interval', 2))
+        self.view_cache = ViewCache(self.web3, config.get('view_cache_block_poll_interval', 1.0))
+        self.fee_engine = FeeEngine(self.web3,
+                                    history_blocks=config.get('fee_history_blocks', 20),
+                                    max_price=self.web3.toWei(config.get('max_gas_price_gwei', 50), 'gwei'),
+                                    replace_interval=config.get('tx_replace_interval', 60))
+        self.max_replacements = config.get('tx_max_replacements', 5)
+        self.commit_journal = CommitJournal(config.get('commit_journal_file', '/tmp/autoranker_commits_{}.jsonl'.format(config['tcrank_address'].lower())))
+        self.gas_model = GasModel(config.get('gas_model_file', '/tmp/autoranker_gas_{}.jsonl'.format(config['tcrank_address'].lower())),
+                                  margin=config.get('gas_margin', 1.3))
+        self.event_index = None
+        self.ranking_mirror = None
+        self.commission_model = None
+        self.commission_model_at = 0
         
         self.tcrank = self.web3.eth.contract(address=self.web3.toChecksumAddress(config['tcrank_address']), abi=config['tcrank_abi'])
         self.faucet = self.web3.eth.contract(address=self.web3.toChecksumAddress(config['faucet_address']), abi=config['faucet_abi'])
@@ -82,6 +135,8 @@ class Autoranker(object):
         self.play_params = {
             'up_probability': 0.5, # probability to push item up or dawn
             'max_push_stake': 20, # max voting power for pushing item
+            'stake_sizing': config.get('play_stake_sizing', False), # stake with best expected profit by fee model instead of random one
+            'win_probability': 0.5, # expected chance of our vote to win (stake sizing)
             'accumulator': { 'simple_profit': 0,
                            }
         }
@@ -90,7 +145,7 @@ class Autoranker(object):
         result_dapp = {}
         
         try:
-            dapp = self.tcrank.functions.getItem(self.to_uint256(dapp_id)).call()
+            dapp = self.view_cache.call(self.tcrank.functions.getItem(self.to_uint256(dapp_id)), [('item', int(dapp_id))])
         except web3.exceptions.BadFunctionCallOutput:
             # returned b''
             return None
@@ -106,29 +161,48 @@ class Autoranker(object):
         result_dapp['voting_id'] = dapp[3]
         result_dapp['movings_ids'] = dapp[4]
     
-        item_state_id = self.tcrank.functions.getItemState(self.to_uint256(dapp_id)).call()
+        item_state_id = self.view_cache.call(self.tcrank.functions.getItemState(self.to_uint256(dapp_id)), [('item', int(dapp_id))])
         result_dapp['item_state'] = self.item_states[item_state_id]
         # ARRAY_JOPA (FIXME)
         voting_id = dapp[3]
         if (voting_id != 0):
-            result_dapp['voting'] = self.tcrank.functions.getVoting(voting_id).call()
-            voting_state_id = self.tcrank.functions.getVotingState(voting_id).call()
+            result_dapp['voting'] = self.view_cache.call(self.tcrank.functions.getVoting(voting_id), [('item', int(dapp_id))])
+            voting_state_id = self.view_cache.call(self.tcrank.functions.getVotingState(voting_id), [('item', int(dapp_id))])
             result_dapp['voting_state'] = self.voting_states[voting_state_id]
 
         # print("Working dapp:\n{}".format(json.dumps(result_dapp, sort_keys=True, indent=4)))
         return result_dapp
 
 
-    def show_ranking(self):
+    def voting_info(self, v, curts):
+        # v[4] - start
+        # v[2] - commit pahse length
+        # v[3] - reveal phase length
+        if (curts < v[4]):
+            return "voting: not started yet(strange), {} sec left".format(int(v[4] - curts))
+        elif (curts >= v[4] and curts < v[4] + v[2]):
+            return "voting: commit phase, {} sec left".format(int(v[4] + v[2] - curts))
+        elif (curts >= v[4] + v[2] and curts < v[4] + v[2] + v[3]):
+            return "voting: reveal phase, {} sec left".format(int(v[4] + v[2] + v[3] - curts))
+        return "voting: finish phase, {} sec waiting for finish".format(int(curts - (v[4] + v[2] + v[3])))
+
+
+    def get_ranking_table(self, batched=False, limit=None):
         ranking = {}
         stats = { 'total':0, 'dno': 0, 'moving':0, 'commit':0, 'reveal':0, 'unfinished':0 }
         res = [[],[]]
+        block = 'latest'
         try:
-            res = self.tcrank.functions.getItemsWithRank().call()
+            if batched:
+                # pin whole snapshot to one block, so items and votings are consistent
+                block = self.batch_caller.block_number()
+                res = self.batch_caller.call_many(self.tcrank, 'getItemsWithRank', [[]], block)[0] or [[],[]]
+            else:
+                res = self.tcrank.functions.getItemsWithRank().call()
         except BadFunctionCallOutput as e:
             print("Error calling getItemsWithRank(), nothing returned from contract at {}: {}".format(self.config['tcrank_address'], repr(e)))
 
-        i = 0
+        listed = []
         for (id, rank) in zip(res[0], res[1]):
             stats['total'] += 1
             # FIXME correctly UPDATE RANKS HERE (not actual beacuse of default INIT_RANK (I just skip this items), it's wrong
@@ -136,39 +210,42 @@ class Autoranker(object):
                 stats['dno'] += 1
                 continue
 
-
             if (self.dapps.get(str(id)) is None):
                 # print("Dapp [{}] not found in self.dapps, strange".format(id))
                 continue
 
+            listed.append((id, rank))
+            if limit is not None and len(listed) >= limit:
+                break
+
+        if batched:
+            items = self.batch_caller.call_many(self.tcrank, 'getItem', [[id] for (id, rank) in listed], block)
+        else:
+            items = [self.tcrank.functions.getItem(self.to_uint256(id)).call() for (id, rank) in listed]
+
+        # ARRAY JOPA (FIXME)
+        voting_ids = [int(dapp_item[3]) for dapp_item in items if dapp_item is not None and int(dapp_item[3]) != 0]
+        if batched:
+            votings = dict(zip(voting_ids, self.batch_caller.call_many(self.tcrank, 'getVoting', [[v] for v in voting_ids], block)))
+        else:
+            votings = dict((v, self.tcrank.functions.getVoting(self.to_uint256(v)).call()) for v in voting_ids)
+
+        curts = time.time()
+        for (id, rank), dapp_item in zip(listed, items):
             name = self.dapps[str(id)].get('name')
             dapp = {'rank': rank, 'name': name, 'info': 'idle'}
-
-            dapp_item = self.tcrank.functions.getItem(self.to_uint256(id)).call()
-            # ARRAY JOPA (FIXME)
-            if (int(dapp_item[3]) != 0):
-                v = self.tcrank.functions.getVoting(self.to_uint256(dapp_item[3])).call()
-                # dapp['voting'] = v
+            if (dapp_item is not None and votings.get(int(dapp_item[3])) is not None):
                 # [29517632169067660389, 1000000000000000000, 30, 30, 1538397188, 29517632169067660389, 296125441696112863068, ['0x6290C445A720E8E77dd8527694030028D1762073']]
-                curts = time.time()
-                # v[4] - start
-                # v[2] - commit pahse length
-                # v[3] - reveal phase length
-    
-                if (curts < v[4]):
-                    dapp['info'] = "voting: not started yet(strange), {} sec left".format(int(v[4] - curts))
-                elif (curts >= v[4] and curts < v[4] + v[2]):
-                    dapp['info'] = "voting: commit phase, {} sec left".format(int(v[4] + v[2] - curts))
-                elif (curts >= v[4] + v[2] and curts < v[4] + v[2] + v[3]):
-                    dapp['info'] = "voting: reveal phase, {} sec left".format(int(v[4] + v[2] + v[3] - curts))
-                elif (curts >= v[4] + v[2] + v[3]):
-                    dapp['info'] = "voting: finish phase, {} sec waiting for finish".format(int(curts - (v[4] + v[2] + v[3])))
-
-                  # aotin_id = dapp_item.get('votingId')
-            # iaf (not voting_id):
-                
+                dapp['info'] = self.voting_info(votings[int(dapp_item[3])], curts)
             ranking[id] = dapp
 
+        return ranking, stats
+
+
+    def show_ranking(self, batched=False):
+        with self.rpc_limiter.lane(LANE_BULK):
+            ranking, stats = self.get_ranking_table(batched)
+
         i = 0
         for dapp_id in sorted(ranking, key=lambda x: ranking[x]['rank'], reverse=True):
             d = ranking[dapp_id]
@@ -177,12 +254,59 @@ class Autoranker(object):
  
         # print(json.dumps(ranking, indent=4, sort_keys=True))
         # print(repr(stats))
+
+
+    def benchmark_show_ranking(self, item_counts=(10, 100, 1000, None)):
+        # compares sequential and batched reads of ranking table, None in item_counts means all items
+        results = []
+        for n in item_counts:
+            for batched in (False, True):
+                self.rpc_counter.reset()
+                batch_round_trips = self.batch_caller.round_trips
+                start = time.time()
+                with self.rpc_limiter.lane(LANE_BULK):
+                    ranking, stats = self.get_ranking_table(batched, limit=n)
+                elapsed = time.time() - start
+                round_trips = self.rpc_counter.requests + self.batch_caller.round_trips - batch_round_trips
+                results.append({'mode': 'batched' if batched else 'sequential',
+                                'items': len(ranking),
+                                'round_trips': round_trips,
+                                'wall_time': round(elapsed, 3),
+                                'time_per_item': round(elapsed / max(len(ranking), 1), 5)})
+                print("{:>10}: items: {:>5},    round trips: {:>6},    wall time: {:>8.3f}s,    per item: {:.5f}s"
+                      .format(results[-1]['mode'], results[-1]['items'], round_trips, elapsed, results[-1]['time_per_item']))
+        return results
         
-    def get_random_push_params(self, dapp_id, current_ts):
+    def get_commission_model(self):
+        # global fee parameters change with every reveal (avgStake) and finish (maxRank), reread after ttl
+        if self.commission_model is None or time.time() - self.commission_model_at > self.config.get('commission_params_ttl', 60):
+            self.commission_model = CommissionModel.from_contract(self.tcrank, self.batch_caller)
+            self.commission_model_at = time.time()
+        return self.commission_model
+
+    def size_stake(self, dapp):
+        # best of whole-CRN stakes up to max_push_stake, fees are computed offline from cached parameters
+        model = self.get_commission_model()
+        stakes = [self.web3.toWei(i, 'ether') for i in range(1, self.play_params['max_push_stake'] + 1)]
+        voting = dapp.get('voting')
+        if voting is not None:
+            # fee, prize pool and avgStake are fixed in voting, other committed voters are expected to stake avgStake
+            (fixed_fee, total_prize, avg_stake, other_stake) = (voting[0], voting[5], voting[6], voting[6] * len(voting[7]))
+        else:
+            rank = self.view_cache.call(self.tcrank.functions.getCurrentRank(self.to_uint256(dapp['id'])), [('item', int(dapp['id']))])
+            (fixed_fee, total_prize, avg_stake, other_stake) = (model.fixed_fee(rank)[0], dapp['balance'], None, 0)
+        (stake, profit) = model.best_stake(stakes, fixed_fee, total_prize, other_stake, self.play_params['win_probability'], avg_stake)
+        logger.debug("DApp [{}], stake {} CRN, expected profit {} CRN".format(dapp['id'], self.web3.fromWei(stake, 'ether'), round(profit / 1e18, 4)))
+        return int(self.web3.fromWei(stake, 'ether'))
+
+    def get_random_push_params(self, dapp_id, current_ts, account=None, dapp=None):
         # generate same push params for same dapp_id in range of two minutes minute (to reconstruct reveal info)
         seed_str = str(dapp_id) + '_' + str(current_ts - (current_ts % 30))
         # random.seed(seed_str)
-        impulse = int(self.play_params['max_push_stake'] * random.uniform(0, 1))
+        if dapp is not None and self.play_params['stake_sizing']:
+            impulse = self.size_stake(dapp)
+        else:
+            impulse = int(self.play_params['max_push_stake'] * random.uniform(0, 1))
         salt = int(random.randint(0,100000000)) # FIXME
 
         isup = 0
@@ -196,36 +320,34 @@ class Autoranker(object):
         elif (impulse < 0):
             push_force = -1 * push_force
 
-        # commit_hash = self.web3.soliditySha3(['uint256','uint256', 'uint256'], [ isup, push_force, salt]).hex()
-        # print("ours   : {}".format(self.web3.soliditySha3(['uint256','uint256', 'uint256'], [ isup, push_force, salt]).hex()))
-        commit_hash = self.helper.functions.getCommitHash(isup, push_force, salt).call().hex()
-        # print("helpers: {}".format(commit_hash))
+        # same as helper.getCommitHash(isup, push_force, salt), without eth_call
+        commitment = commit_hash(isup, push_force, salt)
+
+        if account is None:
+            account = random.choice(self.config['accounts'])
 
-        account = random.choice(self.config['accounts'])
-        # FIXME 
-        account['address'] = self.web3.toChecksumAddress(account['address'])
-      
         return {'account': account, 
                 'isup': isup,
                 'push_force': push_force,
                 'impulse': impulse,
                 'salt': salt,
-                'commit_hash': commit_hash,
+                'commit_hash': commitment,
                 'seed_str': seed_str }
         
     
 
-    def push_selected_dapp(self, dapp_id):
+    def plan_actions(self, dapp, push_params, current_ts):
         actions = []
-        dapp = self.get_dapp_from_contract(dapp_id)
-            
-        current_ts = int(time.time())
-        # get random params for push - impulse, random salt, calculate commit hash
-        push_params = self.get_random_push_params(dapp['id'], current_ts)        
         acc = push_params['account']
-
-        acc['eth_balance'] = self.web3.eth.getBalance(acc['address'])
-        acc['crn_balance'] = self.tcrank.functions.balanceOf(acc['address']).call()
+        # journaled before commit is sent, so reveal can be replayed after restart
+        commitment = {'direction': push_params['isup'],
+                      'stake': push_params['push_force'],
+                      'salt': push_params['salt'],
+                      'commit_hash': push_params['commit_hash'],
+                      'voting_id': dapp.get('voting_id') or None}
+
+        acc['eth_balance'] = self.view_cache.get_balance(acc['address'])
+        acc['crn_balance'] = self.view_cache.call(self.tcrank.functions.balanceOf(acc['address']), [('address', acc['address'])])
         print("Plan to use addr: {}, eth balance: {}, CRN balance: {}".format(acc['address'], self.web3.fromWei(acc['eth_balance'], 'ether'), self.web3.fromWei(acc['crn_balance'], 'ether')))
         faucet_addr = self.config['accounts'][0]['address']
 
@@ -235,19 +357,25 @@ class Autoranker(object):
             print("No ether on address {}, sending {} eth it from {}".format(acc['address'], eth_amount, faucet_addr))
             actions.append({'action': 'giveEther',
                                 'params': [{'to': acc['address'], 'from': faucet_addr, 'amount': eth_amount}],
-                                'wait': 3});
+                                'wait': 0,
+                                'pipeline': True});
 
         if acc['crn_balance'] == 0:
             crn_amount = 100
             print("No CRN tokens on address {}, sending {} CRN from {}".format(acc['address'], crn_amount, faucet_addr))
             actions.append({'action': 'giveTokens',
                                 'params': [{'to': acc['address'], 'from': faucet_addr, 'amount': crn_amount}],
-                                'wait': 3});
+                                'wait': 0,
+                                'pipeline': True});
 
 
 
-        commit_ttl = self.tcrank.functions.currentCommitTtl().call()
-        reveal_ttl = self.tcrank.functions.currentRevealTtl().call() 
+        if actions:
+            # voting account is funded from other account, so funding has to be mined before its first vote
+            actions[-1]['pipeline'] = False
+
+        commit_ttl = self.view_cache.call(self.tcrank.functions.currentCommitTtl())
+        reveal_ttl = self.view_cache.call(self.tcrank.functions.currentRevealTtl()) 
         voting_active = False
 
         if (dapp.get('voting') is not None):
@@ -264,18 +392,26 @@ class Autoranker(object):
         if (not voting_active):
             print("DApp [{}], rank: {}, current time {}, no active voting, plan full cycle"
                   .format(dapp['id'], dapp.get('rank'), current_ts))
+            # voting starts with our commit, phase deadlines are estimated from now
             actions.append({'action': 'voteCommit',
                             'params': [dapp['id'], push_params['commit_hash']],
-                            'wait': commit_ttl}); # FIXME - calculate
+                            'commitment': commitment,
+                            'account': acc,
+                            'wait': commit_ttl,
+                            'deadline': current_ts + commit_ttl}); # FIXME - calculate
             actions.append({'action': 'voteReveal',
                             'params': [dapp['id'],
                                        push_params['isup'],                                                                                             
                                        push_params['push_force'],                                                                                       
                                        push_params['salt']],
-                            'wait': reveal_ttl}); # FIXME - calculate
+                            'commitment': commitment,
+                            'account': acc,
+                            'wait': reveal_ttl,
+                            'deadline': current_ts + commit_ttl + reveal_ttl}); # FIXME - calculate
 
             actions.append({'action': 'finishVoting',
                             'params': [dapp['id']],
+                            'account': acc,
                             'wait': 0}); # FIXME - calculate
             
             print("DApp [{}] {}, plan to push with impulse: {}, seed: {}"
@@ -296,16 +432,23 @@ class Autoranker(object):
 
                 actions.append({'action': 'voteCommit',
                                 'params': [dapp['id'], push_params['commit_hash']],
-                                'wait': seconds_left});
+                                'commitment': commitment,
+                                'account': acc,
+                                'wait': seconds_left,
+                                'deadline': start_ts + commit_ttl});
                 actions.append({'action': 'voteReveal',
                                 'params': [dapp['id'],                                                                                       
                                            push_params['isup'],
                                            push_params['push_force'],                                                                                       
                                            push_params['salt']],
-                                'wait': reveal_ttl}); # FIXME - calculate
+                                'commitment': commitment,
+                                'account': acc,
+                                'wait': reveal_ttl,
+                                'deadline': start_ts + commit_ttl + reveal_ttl}); # FIXME - calculate
 
                 actions.append({'action': 'finishVoting',
                                 'params': [dapp['id']],
+                                'account': acc,
                                 'wait': 0});
 
             ############ REVEAL PHASE ##################
@@ -318,10 +461,14 @@ class Autoranker(object):
                                            push_params['isup'],
                                            push_params['push_force'],                                                                                       
                                            push_params['salt']],
-                                'wait': seconds_left });
+                                'commitment': commitment,
+                                'account': acc,
+                                'wait': seconds_left,
+                                'deadline': start_ts + commit_ttl + reveal_ttl});
 
                 actions.append({'action': 'finishVoting',
                                 'params': [dapp['id']],
+                                'account': acc,
                                 'wait': 0});
             ############### FINISH PHASE #################
             elif (current_ts > (start_ts + commit_ttl + reveal_ttl)):
@@ -329,103 +476,409 @@ class Autoranker(object):
                       .format(dapp['id'], current_ts, current_ts - start_ts - commit_ttl - reveal_ttl))
                 actions.append({'action': 'finishVoting',
                                 'params': [dapp['id']],
+                                'account': acc,
                                 'wait': 0});
 
+        return actions
+
+
+    def push_selected_dapp(self, dapp_id):
+        dapp = self.get_dapp_from_contract(dapp_id)
+            
+        current_ts = int(time.time())
+        # get random params for push - impulse, random salt, calculate commit hash
+        push_params = self.get_random_push_params(dapp['id'], current_ts, dapp=dapp)
+        actions = self.plan_actions(dapp, push_params, current_ts)
+
         ################## ACTIONS READY ########################
+        in_flight = []
         for a in actions:
             dapp = self.get_dapp_from_contract(dapp['id'])
             print("DApp [{}], performing '{}' action".format(dapp['id'], a['action']))
-            args = a.get('params', [])
-            tx = None
-
-            if (a['action'] == 'giveEther'):
-                params = args[0] # passed as "{ from: '0x....', amount: 0.3 }"
-                tx = {
-                    'from': params['from'],
-                    'to': params['to'],
-                    'value': self.web3.toWei(params['amount'], 'ether'),
-                    'gas': 1000000,
-                    'gasPrice': self.web3.toWei('1.5', 'gwei'),
-                    'nonce': self.web3.eth.getTransactionCount(self.address),
-                }
-
-            elif (a['action'] == 'giveTokens'):
-                params = args[0] # passed as "{ from: '0x....', amount: 0.3 }"
-                tx = self.tcrank.functions.transfer(params['to'], self.web3.toWei(params['amount'], 'ether'))\
-                                               .buildTransaction({
-                                                                    'gas': 1000000,
-                                                                    'gasPrice': self.web3.toWei('1', 'gwei'),
-                                                                    'nonce': self.web3.eth.getTransactionCount(self.address)
-                                                                })
-            elif (a['action'] == 'voteCommit'):
-                tx = self.tcrank.functions.voteCommit(*args)\
-                                               .buildTransaction({
-                                                                    'gas': 3000000,
-                                                                    'gasPrice': self.web3.toWei('2', 'gwei'),
-                                                                    'nonce': self.web3.eth.getTransactionCount(self.address)
-                                                                })
-
-            elif (a['action'] == 'voteReveal'):
-                tx = self.tcrank.functions.voteReveal(*args)\
-                                               .buildTransaction({
-                                                                    'gas': 4000000,
-                                                                    'gasPrice': self.web3.toWei('2', 'gwei'),
-                                                                    'nonce': self.web3.eth.getTransactionCount(self.address)
-                                                                })
-
-            elif (a['action'] == 'finishVoting'):
-                tx = self.tcrank.functions.finishVoting(*args)\
-                                               .buildTransaction({
-                                                                    'gas': 7300000,
-                                                                    'gasPrice': self.web3.toWei('5', 'gwei'),
-                                                                    'nonce': self.web3.eth.getTransactionCount(self.address)
-                                                                })
 
-            else:
+            tx = self.build_action_tx(a)
+            if tx is None:
                 print("DApp [{}]. Error: unknown action '{}'".format(dapp['id'], a['action']))
                 continue
 
-            tx_hash = None
-
             try:
-                signed_tx = self.web3.eth.account.signTransaction(tx, private_key=self.private_key)
-                a['tx_hash'] = self.web3.toHex(signed_tx.get('hash'))
-                tx_hash = self.web3.eth.sendRawTransaction(signed_tx.rawTransaction)
-                print("DApp [{}], transaction {}() sent, waiting. tx_hash: {}".format(dapp['id'], a['action'], a['tx_hash']))
-                self.web3.eth.waitForTransactionReceipt(tx_hash)
-                print("DApp [{}], transaction {}() done, tx_hash: {}".format(dapp['id'], a['action'], a['tx_hash']))
-                a['completed'] = True
-            except ValueError as e:
-                print("DApp [{}], transaction {}(), exception: {}".format(dapp['id'], a['action'], repr(e)))
-                if (str(e.args[0]['code']) == '-32000'): # already processing tx
-                    print("DApp [{}], transaction {}() is active, tx_hash: {}".format(dapp['id'], a['action'], a['tx_hash']))
-                    try:
-                        self.web3.eth.waitForTransactionReceipt(a['tx_hash'])
-                        a['completed'] = True
-                    except Exception as e:
-                        print("DApp [{}], error calling {}() function: {}".format(dapp['id'], a['action'], repr(e)))
-                        
+                a['tx_hash'] = self.send_action(a, tx)
+                print("DApp [{}], transaction {}() sent. tx_hash: {}".format(dapp['id'], a['action'], a['tx_hash']))
+                in_flight.append(a)
             except Exception as e:
                 print("DApp [{}], error calling {}() function: {}".format(dapp['id'], a['action'], repr(e)))
-              
-            
-            if a.get('completed') is None:
                 print("DApp [{}], error, transaction was not executed, breakin action queue".format(dapp['id']))
                 break
 
+            # independent transactions are broadcasted back-to-back, confirmations are awaited together
+            if a.get('pipeline'):
+                continue
+
+            receipts = self.wait_for_receipts([x['tx_hash'] for x in in_flight])
+            for x in in_flight:
+                receipt = receipts.get(x['tx_hash'])
+                self.action_done(x, receipt)
+                if receipt is not None and receipt.get('status', 1) != 0:
+                    print("DApp [{}], transaction {}() done, tx_hash: {}".format(dapp['id'], x['action'], x['tx_hash']))
+                    x['completed'] = True
+            failed = [x for x in in_flight if x.get('completed') is None]
+            in_flight = []
+
+            if failed:
+                print("DApp [{}], error, transactions ({}) were not executed, breakin action queue"
+                      .format(dapp['id'], ', '.join(x['action'] for x in failed)))
+                break
+
             print("DApp [{}], sleeping {} sec (taken from 'wait' action parameter)".format(dapp['id'], a['wait']))
             time.sleep(a['wait'])
 
+        logger.debug("View cache stats: {}, RPC lanes: {}".format(repr(self.view_cache.stats()), repr(self.rpc_limiter.stats())))
         return True
 
 
+    def invalidate_action_state(self, a):
+        # drop cached view calls touched by our own transaction
+        if a['action'] in ('giveEther', 'giveTokens'):
+            self.view_cache.invalidate(('address', a['params'][0]['to']))
+        else:
+            self.view_cache.invalidate(('item', int(a['params'][0])))
+        self.view_cache.invalidate(('address', self.action_signer(a)[1]))
+
+    def send_action(self, a, tx):
+        # commitment is fsync'd to journal before commit transaction leaves us
+        (private_key, address) = self.action_signer(a)
+        c = a.get('commitment')
+        if c is not None:
+            a['journal_key'] = self.commit_journal.key(a['params'][0], address, c['commit_hash'])
+            if a['action'] == 'voteCommit':
+                self.commit_journal.commit(a['params'][0], c['voting_id'], address, c['direction'], c['stake'], c['salt'], c['commit_hash'])
+        try:
+            return self.send_transaction(tx, private_key, address, a.get('deadline'))
+        except Exception:
+            if a['action'] == 'voteCommit' and a.get('journal_key'):
+                self.commit_journal.close(a['journal_key'], 'abandoned')
+            raise
+
+    def action_done(self, a, receipt):
+        # receipt is None if transaction was not confirmed in time, it may be still mined
+        self.invalidate_action_state(a)
+        self.record_gas(a, receipt)
+        if a.get('journal_key') is None or receipt is None:
+            return
+        if a['action'] == 'voteCommit' and receipt.get('status', 1) == 0:
+            self.commit_journal.close(a['journal_key'], 'abandoned')
+        elif a['action'] == 'voteReveal' and receipt.get('status', 1) != 0:
+            self.commit_journal.close(a['journal_key'], 'revealed')
+
+    def replay_reveals(self, wait=True, keys=None):
+        # reveals pending journaled commitments (e.g. after crash), item and voting states are read in batches.
+        # Commitments in commit phase are revealed when reveal phase begins if wait is set.
+        # keys - replay only these commitments
+        pending = self.commit_journal.pending()
+        if keys is not None:
+            pending = [c for c in pending if c['key'] in keys]
+        if not pending:
+            return {}
+        accounts = dict((a['address'].lower(), a) for a in self.config['accounts'])
+        item_ids = sorted(set(c['item_id'] for c in pending))
+        block = self.batch_caller.block_number()
+        items = dict(zip(item_ids, self.batch_caller.call_many(self.tcrank, 'getItem', [[i] for i in item_ids], block)))
+        voting_ids = sorted(set(int(item[3]) for item in items.values() if item is not None and int(item[3]) != 0))
+        votings = dict(zip(voting_ids, self.batch_caller.call_many(self.tcrank, 'getVoting', [[v] for v in voting_ids], block)))
+
+        now = time.time()
+        results = {}
+        reveals = []
+        for c in pending:
+            item = items.get(c['item_id'])
+            voting_id = int(item[3]) if item is not None else 0
+            voting = votings.get(voting_id)
+            voters = [v.lower() for v in voting[7]] if voting is not None else []
+            if voting is None or (c['voting_id'] is not None and c['voting_id'] != voting_id) or c['account'].lower() not in voters:
+                # voting is finished or our commit was never mined
+                self.commit_journal.close(c['key'], 'expired')
+                results[c['key']] = 'expired'
+                continue
+            reveal_start = voting[4] + voting[2]
+            reveal_end = reveal_start + voting[3]
+            if now > reveal_end or (now < reveal_start and not wait):
+                results[c['key']] = 'expired' if now > reveal_end else 'pending'
+                if now > reveal_end:
+                    self.commit_journal.close(c['key'], 'expired')
+                continue
+            if c['account'].lower() not in accounts:
+                logger.error("No key for account {} in keys file, cannot reveal {}".format(c['account'], c['key']))
+                results[c['key']] = 'no_key'
+                continue
+            # gas model features from the same batched read, no per-vote state calls
+            reveals.append((reveal_start, reveal_end, c, self.gas_model.features(len(voting[7]), len(item[4]))))
+
+        sent = []
+        for (reveal_start, reveal_end, c, features) in sorted(reveals, key=lambda r: r[0]):
+            # margin for node's block timestamp
+            delay = reveal_start + 2 - time.time()
+            if delay > 0:
+                print("Waiting {}s for reveal phase of DApp [{}]".format(int(delay), c['item_id']))
+                time.sleep(delay)
+            a = {'action': 'voteReveal',
+                 'params': [c['item_id'], c['direction'], c['stake'], c['salt']],
+                 'commitment': c,
+                 'account': accounts[c['account'].lower()],
+                 'features': features,
+                 'deadline': reveal_end}
+            try:
+                a['tx_hash'] = self.send_action(a, self.build_action_tx(a))
+                sent.append(a)
+            except Exception as e:
+                logger.error("Replayed reveal {} failed: {}".format(c['key'], repr(e)))
+                results[c['key']] = 'failed'
+
+        receipts = self.wait_for_receipts([a['tx_hash'] for a in sent])
+        for a in sent:
+            receipt = receipts.get(a['tx_hash'])
+            self.action_done(a, receipt)
+            results[a['commitment']['key']] = 'revealed' if (receipt is not None and receipt.get('status', 1) != 0) else 'failed'
+        print("Replayed reveals: {}".format(', '.join("{}: {}".format(k, v) for (k, v) in sorted(results.items()))))
+        return results
+
+    def action_signer(self, a):
+        # (private_key, address) - votes are signed by voting account, transfers by faucet account
+        account = a.get('account')
+        if account is None:
+            return (self.private_key, self.address)
+        return (account['private_key'], account['address'])
+
+
+    def action_features(self, a):
+        # gas model features: voters of item's voting (including our commit) and item's movings
+        if a['action'] in ('giveEther', 'giveTokens'):
+            return self.gas_model.features(0, 0)
+        dapp = self.get_dapp_from_contract(a['params'][0])
+        if dapp is None:
+            return self.gas_model.features(0, 0)
+        voters = len(dapp['voting'][7]) if dapp.get('voting') is not None else 0
+        if a['action'] == 'voteCommit':
+            voters += 1
+        return self.gas_model.features(voters, len(dapp['movings_ids']))
+
+    def record_gas(self, a, receipt):
+        # gas model learns from estimates of transactions which succeeded, out of gas failures widen margin
+        if receipt is None or a.get('features') is None:
+            return
+        if receipt.get('status', 1) == 0:
+            if receipt['gasUsed'] >= a['gas']:
+                self.gas_model.out_of_gas(a['action'])
+            return
+        if a.get('gas_estimate') is not None:
+            self.gas_model.record(a['action'], a['features'], a['gas_estimate'])
+
+    def estimate_action_gas(self, a, tx):
+        # required gas before refunds, sets a['gas_estimate'] and raises tx gas limit if it is below
+        (private_key, address) = self.action_signer(a)
+        call = dict((k, v) for (k, v) in tx.items() if k in ('to', 'data', 'value'))
+        call['from'] = address
+        try:
+            a['gas_estimate'] = self.web3.eth.estimateGas(call)
+        except Exception as e:
+            logger.debug("Cannot estimate gas of '{}': {}".format(a['action'], repr(e)))
+            return tx
+        needed = min(int(a['gas_estimate'] * self.gas_model.margin), self.gas_model.max_gas)
+        if needed > tx['gas']:
+            a['gas'] = tx['gas'] = needed
+        return tx
+
+    def build_action_tx(self, a):
+        # nonce is not set here - it is allocated from local nonce manager right before signing
+        # gas price is taken from recent blocks, higher when action's phase deadline is close,
+        # gas limit is predicted by per-action gas model, sampled transactions are also estimated
+        if a.get('features') is None:
+            a['features'] = self.action_features(a)
+        a['gas'] = self.gas_model.limit(a['action'], a['features'])
+        tx = self.build_action_call(a, self.fee_engine.gas_price(a.get('deadline')))
+        if tx is not None and self.gas_model.wants_sample(a['action']):
+            tx = self.estimate_action_gas(a, tx)
+        return tx
+
+    def build_action_call(self, a, gas_price):
+        args = a.get('params', [])
+
+        if (a['action'] == 'giveEther'):
+            params = args[0] # passed as "{ from: '0x....', amount: 0.3 }"
+            return {
+                'from': params['from'],
+                'to': params['to'],
+                'value': self.web3.toWei(params['amount'], 'ether'),
+                'gas': a['gas'],
+                'gasPrice': gas_price,
+            }
+
+        elif (a['action'] == 'giveTokens'):
+            params = args[0] # passed as "{ from: '0x....', amount: 0.3 }"
+            return self.tcrank.functions.transfer(params['to'], self.web3.toWei(params['amount'], 'ether'))\
+                                           .buildTransaction({
+                                                                'gas': a['gas'],
+                                                                'gasPrice': gas_price,
+                                                            })
+        elif (a['action'] == 'voteCommit'):
+            return self.tcrank.functions.voteCommit(*args)\
+                                           .buildTransaction({
+                                                                'gas': a['gas'],
+                                                                'gasPrice': gas_price,
+                                                            })
+
+        elif (a['action'] == 'voteReveal'):
+            return self.tcrank.functions.voteReveal(*args)\
+                                           .buildTransaction({
+                                                                'gas': a['gas'],
+                                                                'gasPrice': gas_price,
+                                                            })
+
+        elif (a['action'] == 'finishVoting'):
+            return self.tcrank.functions.finishVoting(*args)\
+                                           .buildTransaction({
+                                                                'gas': a['gas'],
+                                                                'gasPrice': gas_price,
+                                                            })
+
+        elif (a['action'] == 'unstake'):
+            return self.tcrank.functions.unstake(*args)\
+                                           .buildTransaction({
+                                                                'gas': a['gas'],
+                                                                'gasPrice': gas_price,
+                                                            })
+
+        return None
+
+
+    def send_transaction(self, tx, private_key=None, address=None, deadline=None):
+        # signs transaction with locally allocated nonce and broadcasts it, does not wait for receipt.
+        # If it is not mined in time (sooner when deadline is close) it is replaced with bumped gas price
+        private_key = private_key or self.private_key
+        address = address or self.address
+        # contract function name by selector, plain ether transfers have no data
+        labels = {'function': self.metrics.function_name('eth_call', [tx]) or 'ether'}
+
+        for attempt in range(2):
+            with self.metrics.timer('tx_stage_seconds', dict(labels, stage='nonce')):
+                tx['nonce'] = self.nonce_manager.allocate(address)
+            with self.metrics.timer('tx_stage_seconds', dict(labels, stage='sign')):
+                signed_tx = self.web3.eth.account.signTransaction(tx, private_key=private_key)
+            tx_hash = self.web3.toHex(signed_tx.get('hash'))
+            # tracked before broadcast, so receipt tracker can not miss its block
+            replacer = self.stuck_tx_replacer(tx, private_key, address, deadline, labels)
+            future = self.receipt_tracker.track(tx_hash, timeout=self.fee_engine.replace_after(deadline),
+                                                on_timeout=replacer, check_mined=False)
+            try:
+                with self.metrics.timer('tx_stage_seconds', dict(labels, stage='broadcast')):
+                    self.web3.eth.sendRawTransaction(signed_tx.rawTransaction)
+                self.observe_confirmation(future, labels)
+                return tx_hash
+            except ValueError as e:
+                if is_known_tx_error(e):
+                    # already processing this tx
+                    self.metrics.inc('tx_send_errors_total', dict(labels, kind='known_tx'))
+                    self.observe_confirmation(future, labels)
+                    return tx_hash
+                self.receipt_tracker.untrack(tx_hash)
+                # new transaction can not be underpriced replacement unless local nonce is taken by pending one
+                nonce_taken = is_nonce_error(e) or is_underpriced_error(e)
+                self.metrics.inc('tx_send_errors_total', dict(labels, kind='nonce' if nonce_taken else 'rejected'))
+                if nonce_taken and attempt == 0:
+                    logger.debug("Nonce {} for {} rejected: {}, resync and retry".format(tx['nonce'], address, repr(e)))
+                    self.nonce_manager.sync(address)
+                    continue
+                self.nonce_manager.release(address, tx['nonce'])
+                raise
+            except Exception:
+                self.receipt_tracker.untrack(tx_hash)
+                self.metrics.inc('tx_send_errors_total', dict(labels, kind='exception'))
+                self.nonce_manager.release(address, tx['nonce'])
+                raise
+
+
+    def stuck_tx_replacer(self, tx, private_key, address, deadline, labels):
+        # on_timeout callback of receipt tracker, returns seconds till next check or None to give up
+        state = {'tx': dict(tx), 'replacements': 0}
+
+        def replace(tx_hash):
+            if state['replacements'] >= self.max_replacements:
+                logger.error("Transaction {} is not mined after {} replacements, giving up".format(tx_hash, state['replacements']))
+                return None
+            new_price = self.fee_engine.bump_price(state['tx']['gasPrice'], deadline)
+            if new_price is None:
+                logger.error("Transaction {} is stuck, gas price can not be bumped over limit".format(tx_hash))
+                return None
+            new_tx = dict(state['tx'], gasPrice=new_price)
+            signed_tx = self.web3.eth.account.signTransaction(new_tx, private_key=private_key)
+            new_tx_hash = self.web3.toHex(signed_tx.get('hash'))
+            self.receipt_tracker.replace(tx_hash, new_tx_hash)
+            try:
+                self.web3.eth.sendRawTransaction(signed_tx.rawTransaction)
+            except ValueError as e:
+                if is_nonce_error(e):
+                    # original transaction (or earlier replacement) is already mined, tracker will find it
+                    self.receipt_tracker.untrack(new_tx_hash)
+                    logger.debug("Replacement of {} rejected, nonce already used: {}".format(tx_hash, repr(e)))
+                    return self.fee_engine.replace_after(deadline)
+                if is_underpriced_error(e):
+                    # node keeps a pricier one of ours (e.g. sent before restart), next bump starts from
+                    # attempted price and counts as replacement, so it is not retried forever
+                    self.receipt_tracker.untrack(new_tx_hash)
+                    state['tx'] = new_tx
+                    state['replacements'] += 1
+                    logger.error("Replacement of {} rejected as underpriced at {} gwei: {}"
+                                 .format(tx_hash, self.web3.fromWei(new_price, 'gwei'), repr(e)))
+                    return self.fee_engine.replace_after(deadline)
+                if not is_known_tx_error(e):
+                    self.receipt_tracker.untrack(new_tx_hash)
+                    logger.error("Replacement of {} rejected: {}".format(tx_hash, repr(e)))
+                    return self.fee_engine.replace_after(deadline)
+            state['tx'] = new_tx
+            state['replacements'] += 1
+            self.metrics.inc('tx_replacements_total', labels)
+            logger.info("Transaction {} (nonce {} from {}) replaced with {}, gas price {} -> {} gwei"
+                        .format(tx_hash, new_tx['nonce'], address, new_tx_hash,
+                                self.web3.fromWei(tx['gasPrice'], 'gwei'), self.web3.fromWei(new_price, 'gwei')))
+            return self.fee_engine.replace_after(deadline)
+        return replace
+
+    def observe_confirmation(self, future, labels):
+        # time from broadcast to receipt with required confirmations
+        sent_at = time.time()
+
+        def done(f):
+            if f.cancelled():
+                return
+            if f.exception() is not None:
+                self.metrics.inc('tx_confirm_timeouts_total', labels)
+                return
+            self.metrics.observe('tx_stage_seconds', time.time() - sent_at, dict(labels, stage='confirm'))
+            if f.result().get('status', 1) == 0:
+                self.metrics.inc('tx_reverted_total', labels)
+        future.add_done_callback(done)
+
+
+    def wait_for_receipts(self, tx_hashes, timeout=600):
+        # all waiters share one block watcher instead of polling receipt of every transaction
+        return self.receipt_tracker.wait(tx_hashes, timeout)
+
 
     def start_moving_dapps(self, single_dapp_id, n_dapps=1900):
         print("Start to play, play_params: {}".format(repr(self.play_params)))
-        n = 0
+
+        # reveals of votes committed before restart: ones in reveal phase are sent now, the rest are
+        # revealed in background when their reveal phase begins, so play does not wait for them
+        results = self.replay_reveals(wait=False)
+        waiting = set(k for (k, v) in results.items() if v == 'pending')
+        replayer = None
+        if waiting:
+            replayer = threading.Thread(target=self.replay_reveals, kwargs={'keys': waiting}, name='reveal-replay', daemon=True)
+            replayer.start()
 
         if (single_dapp_id):
             self.push_selected_dapp(single_dapp_id)
+            if replayer is not None:
+                replayer.join()
             return
 
 
@@ -434,25 +887,49 @@ class Autoranker(object):
             # if (int(dapp_id) % 17 == 0):
             chosen_dapps.append(int(dapp_id))
 
-        while n < n_dapps:
-            n += 1
-            chosen_id = random.choice(chosen_dapps)
-            self.push_selected_dapp(int(chosen_id))
+        # votings are played concurrently, each one wakes up only at its phase boundaries
+        engine = PlayEngine(self,
+                            max_votings=self.config.get('play_max_votings', 200),
+                            max_rpc=self.config.get('play_max_rpc', 16))
+        engine.run(chosen_dapps, n_dapps)
+        if replayer is not None:
+            replayer.join()
+
+
+    def finish_expired_votings(self, watch=False):
+        # keeper: finishes votings left open by any process (e.g. died after commit)
+        keeper = VotingKeeper(self,
+                              max_in_flight=self.config.get('keeper_max_in_flight', 16))
+        return keeper.run(watch, self.config.get('keeper_interval', 60))
+
+
+    def unstake_won_stakes(self, watch=False):
+        # keeper: claims unlocked stakes of our winning votes from all accounts of keys pack
+        keeper = UnstakeKeeper(self,
+                               threshold=self.web3.toWei(self.config.get('unstake_threshold', 1), 'ether'),
+                               max_in_flight=self.config.get('keeper_max_in_flight', 16))
+        return keeper.run(watch, self.config.get('keeper_interval', 60))
 
 
     def update_ranks_from_contract(self):
-        ranks = None
+        # ranks are computed locally from materialized view, kept current by contract events
+        mirror = self.get_ranking_mirror()
         try:
-            ranks = self.tcrank.functions.getItemsWithRank().call()
+            mirror.refresh(self.dapps.keys())
         except Exception as e:
-            logger.error("Error calling getItemsWithRank() function: {}".format(repr(e)))
+            logger.error("Error refreshing ranking mirror: {}".format(repr(e)))
             raise
 
-        for id, new_rank in zip(ranks[0], ranks[1]):
+        ranks = mirror.current_ranks(int(time.time()))
+        for dapp_id in self.dapps:
+            if (ranks.get(int(dapp_id)) is None):
+                # print("DApp [{}] not exists in contract - contract and local dapps not sync".format(dapp_id))
+                self.dapps[dapp_id]['sync'] = False
+
+        for id, new_rank in ranks.items():
             dapp_id = str(id)
             if (self.dapps.get(dapp_id) is None):
                 # print("DApp [{}] with rank {} not exists in self.dapps - contract and local dapps not sync".format(dapp_id, new_rank))
-                self.dapps[dapp_id]['sync'] = False
                 continue
             self.dapps[dapp_id]['sync'] = True
             if (int(self.dapps[dapp_id]['rank']) != int(new_rank)):
@@ -466,14 +943,52 @@ class Autoranker(object):
         return None
 
 
+    def get_ranking_mirror(self):
+        if self.ranking_mirror is None:
+            self.ranking_mirror = RankingMirror(self.tcrank, self.batch_caller, self.get_event_index())
+        return self.ranking_mirror
+
+
+
+    def get_existing_items(self, dapp_ids):
+        # one batched read of public Items() getter, unlike getItem() it does not revert on unknown id
+        items = self.batch_caller.call_many(self.tcrank, 'Items', [[int(dapp_id)] for dapp_id in dapp_ids])
+        existing = {}
+        for dapp_id, item in zip(dapp_ids, items):
+            if item is not None and int(item[1], 16) != 0:
+                existing[dapp_id] = {'id': dapp_id, 'address': item[1], 'rank': item[2], 'balance': item[3], 'voting_id': item[4]}
+        return existing
+
+
+    def get_items_pack_size(self, ids, ranks, default_size, block_fill=0.5):
+        # pack size from gas estimation of 1 and 2 items pack: gas = base + n * per_item,
+        # pack must use no more than block_fill part of block gas limit
+        # returns (pack_size, gas for pack of n items function)
+        gas_limit = self.web3.eth.getBlock('latest')['gasLimit']
+        default_gas = lambda n: min(5000000, gas_limit)
+        if len(ids) < 2:
+            return default_size, default_gas
+
+        try:
+            gas_one = self.tcrank.functions.newItemsWithRanks(_ids=ids[:1], _ranks=ranks[:1]).estimateGas({'from': self.address})
+            gas_two = self.tcrank.functions.newItemsWithRanks(_ids=ids[:2], _ranks=ranks[:2]).estimateGas({'from': self.address})
+        except Exception as e:
+            logger.error("Error estimating gas for 'newItemsWithRanks', using pack size {}: {}".format(default_size, repr(e)))
+            return default_size, default_gas
+
+        per_item = max(gas_two - gas_one, 1)
+        base = max(gas_one - per_item, 0)
+        pack_size = max(int((gas_limit * block_fill - base) // per_item), 1)
+        logger.info("Gas for 'newItemsWithRanks': base {}, per item {}, block gas limit {}, pack size {}".format(base, per_item, gas_limit, pack_size))
+        return pack_size, lambda n: min(int((base + n * per_item) * 1.2), gas_limit)
+
 
-    def load_dapps_to_contract(self, single_dapp_id):
+    def load_dapps_to_contract(self, single_dapp_id, only_ids=None):
+        # only_ids - limit sync to these dapps (delta from catalog snapshot), returns {dapp_id: on-chain status}
         PACKSIZE = 32
         
-        ids_pack = []
-        ranks_pack = []
-        new_dapps_ids = []
-        rank_updates = []
+        start = time.time()
+        dapps_ids = []
         for dapp_id in self.dapps:
             dapp = self.dapps[dapp_id]
             
@@ -482,66 +997,84 @@ class Autoranker(object):
                     continue
                 
                 print("Working with single dapp: [{}] {}".format(dapp_id, dapp.get('name')))
+            elif only_ids is not None and dapp_id not in only_ids:
+                continue
+            dapps_ids.append(dapp_id)
 
-            existing = self.get_dapp_from_contract(dapp_id)
+        existing_items = self.get_existing_items(dapps_ids)
+        statuses = {}
+        new_dapps_ids = []
+        for dapp_id in dapps_ids:
+            dapp = self.dapps[dapp_id]
+            existing = existing_items.get(dapp_id)
             if existing is not None:
                 logger.info("DApp [{}] {}, already exists in contract with rank: {}, local rank: {}".format(dapp_id, dapp.get('name'), existing['rank'], dapp['rank']))
                 # DISABLE RANK UPDATES
                 # if (str(dapp['rank']) != str(existing['rank'])):
                 #     logger.info("DApp [{}] {}, need to update rank from {} to {}".format(dapp_id, dapp.get('name'), existing['rank'], dapp['rank']))
                 #     rank_updates.append([dapp_id, dapp['rank'], existing['rank']])
+                statuses[dapp_id] = 'exists'
                 continue
             
             new_dapps_ids.append(dapp_id)
 
-        i = 0
-        for dapp_id in new_dapps_ids:
-            i +=1
-            ids_pack.append(self.to_uint256(dapp_id))
-            ranks_pack.append(self.to_uint256(self.dapps[dapp_id]['rank']))
+        ids = [self.to_uint256(dapp_id) for dapp_id in new_dapps_ids]
+        ranks = [self.to_uint256(self.dapps[dapp_id]['rank']) for dapp_id in new_dapps_ids]
+        pack_size, pack_gas = self.get_items_pack_size(ids, ranks, PACKSIZE, self.config.get('sync_block_fill', 0.5))
 
-            if (i % PACKSIZE) != 0 and i < len(new_dapps_ids):
-                continue
+        tx_hashes = []
+        packs = {}
+        for offset in range(0, len(ids), pack_size):
+            ids_pack = ids[offset:offset + pack_size]
+            ranks_pack = ranks[offset:offset + pack_size]
 
-            # pack are full, push them
+            # packs are independent, so they are sent back-to-back with local nonces, without waiting for receipts
             logger.info("DApps ({}) adding to contract with ranks({})".format(', '.join(str(x) for x in ids_pack), ', '.join(str(x) for x in ranks_pack)))
             tx = self.tcrank.functions.newItemsWithRanks(_ids=ids_pack,
                                                          _ranks=ranks_pack).buildTransaction({
-                                'gas': 5000000,
-                                'gasPrice': self.web3.toWei('2', 'gwei'),
-                                                        'nonce': self.web3.eth.getTransactionCount(self.address)
+                                'gas': pack_gas(len(ids_pack)),
+                                'gasPrice': self.fee_engine.gas_price(),
                                                         })
-            signed_tx = self.web3.eth.account.signTransaction(tx, private_key=self.private_key)
-            tx_hash = self.web3.eth.sendRawTransaction(signed_tx.rawTransaction)
-            self.web3.eth.waitForTransactionReceipt(tx_hash)
-            logger.debug("Transaction 'newItemsWithRanks' sent, sleeping")
-            time.sleep(30)
-            ids_pack = []
-            ranks_pack = []
-
-        return None
-
-        # update ranks for changed ranks
-        for u in sorted(rank_updates, key = lambda r: r[1], reverse=True):
-            
-            dapp_id = u[0]
-            new_rank = u[1]
-            old_rank = u[2]
-            logger.info("DApp [{}] {}, SKIIIPPP updating rank from {} to {}".format(dapp_id, self.dapps.get(dapp_id, {}).get('name'), old_rank, new_rank))
-            continue
-            tx = self.tcrank.functions.setItemLastRank(_itemId=self.to_uint256(dapp_id),
-                                                       _rank=self.to_uint256(new_rank)).buildTransaction({
-                                'gas': 3000000,
-                                'gasPrice': self.web3.toWei('2', 'gwei'),
-                                                        'nonce': self.web3.eth.getTransactionCount(self.address)
-                                                         })
-            signed_tx = self.web3.eth.account.signTransaction(tx, private_key=self.private_key)
-            tx_hash = self.web3.eth.sendRawTransaction(signed_tx.rawTransaction)
-            self.web3.eth.waitForTransactionReceipt(tx_hash)
-            logger.debug("Transaction 'setItemLastRank' sent, sleeping")
-            time.sleep(30)
-
-        return None
+            tx_hashes.append(self.send_transaction(tx))
+            packs[tx_hashes[-1]] = new_dapps_ids[offset:offset + pack_size]
+            logger.debug("Transaction 'newItemsWithRanks' sent, tx_hash: {}".format(tx_hashes[-1]))
+
+        receipts = self.wait_for_receipts(tx_hashes)
+        for tx_hash in tx_hashes:
+            status = 'added'
+            if receipts.get(tx_hash) is None or receipts[tx_hash].get('status', 1) == 0:
+                logger.error("Transaction 'newItemsWithRanks' {} failed".format(tx_hash))
+                status = 'failed'
+            for dapp_id in packs[tx_hash]:
+                statuses[dapp_id] = status
+
+        elapsed = time.time() - start
+        print("Synced {} dapps ({} new) in {} packs, {}s, {} items/s"
+              .format(len(dapps_ids), len(new_dapps_ids), len(tx_hashes), round(elapsed, 2), round(len(new_dapps_ids) / max(elapsed, 0.001), 2)))
+        return statuses
+
+
+    def sync_catalog(self, single_dapp_id, full_sync=False):
+        # pushes to contract only dapps added since last synced catalog snapshot
+        path = self.config.get('catalog_snapshot_file', '/tmp/autoranker_catalog_{}.json'.format(self.config['tcrank_address'].lower()))
+        snapshot = CatalogSnapshot(path)
+        delta = snapshot.diff(self.dapps)
+        print("Catalog changes since last sync: added: {}, removed: {}, reranked: {}, renamed: {}, unchanged: {}"
+              .format(len(delta['added']), len(delta['removed']), len(delta['reranked']), len(delta['renamed']), len(delta['unchanged'])))
+        for dapp_id in delta['removed']:
+            logger.info("DApp [{}] {}, removed from catalog, no contract action".format(dapp_id, snapshot.dapps[dapp_id].get('name')))
+        for dapp_id in delta['reranked']:
+            # rank updates are disabled in load_dapps_to_contract, only reported
+            logger.info("DApp [{}] {}, rank changed {} -> {}".format(dapp_id, self.dapps[dapp_id].get('name'), snapshot.dapps[dapp_id].get('rank'), self.dapps[dapp_id]['rank']))
+
+        only_ids = None if (full_sync or single_dapp_id is not None) else set(delta['added'])
+        # sends still use transaction lane
+        with self.rpc_limiter.lane(LANE_BULK):
+            statuses = self.load_dapps_to_contract(single_dapp_id, only_ids)
+
+        snapshot.update(self.dapps, statuses)
+        snapshot.save()
+        return delta
 
 
     def tx_to_json(tx):
@@ -568,99 +1101,52 @@ class Autoranker(object):
 
 
 
-    def ranking_history(self, single_dapp_id, output_file):
-
-        MOVING_EVENT_NAME = 'MovingStarted'
-
-        event_abi = None
-        for i in self.config['tcrank_abi']:
-            if i['type'] == 'event' and i['name'] == MOVING_EVENT_NAME:
-                event_abi = i
-                break
+    def ranking_history(self, single_dapp_id, output_file, points=2000):
+        with self.rpc_limiter.lane(LANE_BULK):
+            return self.plot_ranking_history(single_dapp_id, output_file, points)
 
-        if event_abi is None:
-            raise KeyError("No abi for event '{}' was found in ranking.abi".format(MOVING_EVENT_NAME))
+    def plot_ranking_history(self, single_dapp_id, output_file, points=2000):
 
-        addr = self.web3.toChecksumAddress(self.config['tcrank_address'])
-        
-        # from eth_utils.abi import event_abi_to_log_topic
-	# event_signature_topic = event_abi_to_log_topic(myContract.events.Transfer.abi)
-        event_signature = self.web3.sha3(text='MovingStarted(uint256,uint256,uint256,uint256,uint256,uint256,uint256)').hex()
-        logs = []
+        # only new tail of logs is fetched from node, older ones are taken from on-disk index
+        event_index = self.get_event_index()
         try:
-            logs = self.web3.eth.getLogs(
-                                    {
-                                        'address': addr, 
-                                        'fromBlock': int(self.config['tcrank_deploy_block_no']), 
-                                        'toBlock':'latest', 
-                                        'topics':[event_signature]
-                                    })
+            event_index.sync()
         except Exception as e:
-            print("Error in 'getLogs', requesting topic {} in logs from addr: {}, block: {}".format(event_signature, addr, int(self.config['tcrank_deploy_block_no'])))
-
-
-        objects_moves = {}
-        min_ts = int(time.time())
-        max_ts = 0
-        last_rank = None
-        for log in logs:
-            m = get_event_data(event_abi, log).args
-            if (single_dapp_id is not None and str(m.itemId) != str(single_dapp_id)):
-                continue
-
-            if (objects_moves.get(m.itemId) is None):
-                objects_moves[m.itemId] = []
-
-            # no optimizations now
-            index_where_to_insert = 0
-            for prev_move in objects_moves[m.itemId]:
-                if (m.startTime >= prev_move['start']):
-                    index_where_to_insert += 1
-
-            if (m.speed) == 0:
-                continue
-            
-            if (m.distance) == 0:
-                continue
-           
-            signed_speed = m.speed
-            if m.direction == 0:
-                signed_speed = (-1 * signed_speed)
-
-            objects_moves[m.itemId].insert(index_where_to_insert, {
-                                                            'start': m.startTime,
-                                                            'speed': signed_speed/1000000000000000000,
-                                                            'distance': m.distance/1000000000000000000,
-                                                            'moving_time': m.distance/abs(signed_speed)
-                                                            })
-            if (m.startTime < min_ts):
-                min_ts = m.startTime
-            
-            min_ts -= 3600
+            print("Error syncing event index from addr: {}, using already indexed events: {}".format(self.config['tcrank_address'], repr(e)))
+        movings = [e['args'] for e in event_index.get_events(['MovingStarted'], item_id=single_dapp_id)]
+        removed_ids = [e['args']['movingId'] for e in event_index.get_events(['MovingRemoved'], item_id=single_dapp_id)]
+
+        item_ids = sorted(set(int(m['itemId']) for m in movings))
+        # read at checkpoint block, so lastRank includes exactly the removals that are indexed
+        (checkpoint, _) = event_index.checkpoint()
+        items = self.batch_caller.call_many(self.tcrank, 'getItem', [[item_id] for item_id in item_ids], checkpoint)
+        last_ranks = dict((item_id, item[1]) for item_id, item in zip(item_ids, items) if item is not None)
+
+        trajectories = RankTrajectories().load(movings, last_ranks, removed_ids)
+        (min_ts, max_ts) = trajectories.time_range()
+        if min_ts is None:
+            print("No movings found, nothing to plot")
+            return
 
-            plan_end = m.startTime + round(m.distance/m.speed)
-            if (plan_end > max_ts):
-                max_ts = plan_end
+        # shared time grid for all items, an hour before first moving and till end of the last one
+        min_ts -= 3600
+        step = max(1, (max_ts - min_ts) // points)
+        grid = np.arange(min_ts, max_ts + step, step, dtype=np.int64)
+        ranks = np.round(trajectories.to_tokens(trajectories.evaluate(grid)))
+        x_series = grid.astype('datetime64[s]')
 
         data = []
-        # MUST be sorted by start time
-        for item_id in objects_moves:
-            mvs = objects_moves[item_id]            
-            item = self.tcrank.functions.getItem(item_id).call()
-            last_rank = round(item[1]/1000000000000000000)
-            # print("DApp [{}], last_rank: {}".format(m.itemId, last_rank))
-            (x_series, y_series) = self.gen_xy_for_object(objects_moves[item_id], last_rank, min_ts, max_ts)
+        for row, item_id in enumerate(trajectories.item_ids.tolist()):
             dapp = self.dapps.get(str(item_id))
             if (dapp is None):
                 print("No object with id:{} in local dapps".format(item_id))
                 continue
-            name = self.dapps.get(str(item_id), {}).get('name')
+            name = dapp.get('name')
             data.append(go.Scatter(x=x_series, 
-                                   y=y_series,
+                                   y=ranks[row],
                                    name="[{}] {}".format(item_id, name),
                                    line=dict(shape='linear'),
                                   ))
-            i = 0
         
         layout = { 'title': 'Dapps ranks',
                  }
@@ -669,51 +1155,14 @@ class Autoranker(object):
         print("Saved output plot to '{}'".format(output_file))
         return
 
-    
-    def gen_xy_for_object(self, moves, last_rank, min_ts, max_ts):
-
-        x_series = [] # np.arange(zero_ts, max_ts, 60)
-        y_series = []
-
-        first = True
-        # if (len(moves) == 0):
-        #     return ([min_ts, max_ts], [last_rank, last_rank])
-
-        cur_x = min_ts
-        # print(json.dumps(moves, sort_keys=True, indent=4))
-        xa = []
-        ya = []
-        cur_rank = 0
-        for m in moves: # sorted and neperesekay-time
-            if first:
-                xa.append(cur_x)
-                ya.append(cur_rank)
-                first = False
-            cur_x = m['start']
-            xa.append(cur_x)
-            ya.append(cur_rank)
-            delta_x = abs(m['distance'] / m['speed'])
-            delta_rank = m['distance'] if m['speed'] >= 0 else -1 * m['distance']
-            # print("speed: {}, deltarank: {}".format(m['speed'], delta_rank))
-            cur_x += delta_x
-            cur_rank += delta_rank
-            xa.append(cur_x)
-            ya.append(cur_rank)
-
-
-        xa.append(max_ts)
-        ya.append(cur_rank)
-
-        # patch rank
-        diff = last_rank - cur_rank
-        ya = [(r + diff) for r in ya]
- 
-        # xa.append(max_ts)
-        # ya.append(last_rank)
-       
-        for x,y in zip(xa, ya):
-            x_series.append(datetime.utcfromtimestamp(round(x)))
-            y_series.append(round(y))
-            # print("{}, {}".format(x, round(y)))
-        return(x_series, y_series)
 
+    def get_event_index(self):
+        if self.event_index is None:
+            db_path = self.config.get('event_index_db', '/tmp/autoranker_events_{}.sqlite'.format(self.config['tcrank_address'].lower()))
+            self.event_index = EventIndex(self.web3,
+                                          self.web3.toChecksumAddress(self.config['tcrank_address']),
+                                          self.config['tcrank_abi'],
+                                          self.config['tcrank_deploy_block_no'],
+                                          db_path,
+                                          confirmations=self.config.get('event_index_confirmations', 6))
+        return self.event_index
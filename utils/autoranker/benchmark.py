@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+"""
+Benchmarks autoranker commands against local ganache chain.
+
+For every scale contracts are deployed from truffle artifacts, seeded with N items (load_dapps_to_contract
+is measured as the seeding step) and M movings (votings played with evm_increaseTime), then
+show_ranking, ranking_history and push_selected_dapp are measured. Wall time, JSON-RPC requests and
+peak memory of every command are saved into JSON results file, --compare prints ratios to older results.
+
+    python benchmark.py --scales 100,1000,10000 --output bench.json --compare bench_prev.json
+"""
+
+from __future__ import print_function
+import os
+import re
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import resource
+import tempfile
+import tracemalloc
+import subprocess
+
+from web3 import Web3
+
+from autoranker import Autoranker
+from main import generate_keypair_and_address
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+SOLIDITY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'solidity')
+
+# same as solidity/migrations/3_deploy.js
+# dynamicFeeLinearRate, dynamicFeeLinearPrecision, maxOverStakeFactor,
+# maxFixedFeeRate, maxFixedFeePrecision, unstakeSpeed,
+# currentCommitTtl, currentRevealTtl, initialAvgStake
+RANKING_PARAMS = [1, 100, 100, 1, 10, Web3.toWei(0.05, 'ether'), 30, 30, Web3.toWei(300, 'ether')]
+FAUCET_SIZE = Web3.toWei(1000, 'ether')
+FAUCET_CHARSET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+# 3_deploy.js sends whole supply to faucet, here deployer keeps tokens for seeding votes
+FAUCET_SUPPLY = Web3.toWei(100000, 'ether')
+
+ACCOUNT_BALANCE = Web3.toWei(100000000, 'ether')
+# truffle 4 library placeholder: '__' + library name padded with '_' to 40 chars
+LIBRARY_PLACEHOLDER = re.compile(r'__[A-Za-z0-9_:./]{36}__')
+
+
+def compile_contracts(solidity_dir):
+    build_dir = os.path.join(solidity_dir, 'build', 'contracts')
+    if not os.path.isdir(build_dir):
+        print("No contract artifacts in '{}', running truffle compile".format(build_dir))
+        subprocess.check_call(['make', 'build'], cwd=solidity_dir)
+    return build_dir
+
+
+def load_artifact(build_dir, name):
+    with open(os.path.join(build_dir, name + '.json')) as f:
+        return json.load(f)
+
+
+def link_bytecode(bytecode, libraries):
+    # libraries - {name: address}
+    def replace(m):
+        name = m.group(0).strip('_').split(':')[-1].split('/')[-1].replace('.sol', '')
+        if name not in libraries:
+            raise KeyError("Library '{}' is not deployed, cannot link".format(name))
+        return libraries[name][2:].lower()
+    return LIBRARY_PLACEHOLDER.sub(replace, bytecode)
+
+
+def start_ganache(solidity_dir, port, accounts, log_file):
+    binary = os.path.join(solidity_dir, 'node_modules', '.bin', 'ganache-cli')
+    if not os.path.isfile(binary):
+        subprocess.check_call(['npm', 'install'], cwd=solidity_dir)
+    cmd = [binary, '--port', str(port), '--gasLimit', '10000000000000', '--gasPrice', '200']
+    for a in accounts:
+        cmd.append('--account=0x{},{}'.format(a['private_key'], ACCOUNT_BALANCE))
+    return subprocess.Popen(cmd, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+def wait_for_node(web3, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if web3.isConnected():
+                return
+        except Exception:
+            pass
+        time.sleep(0.5)
+    raise Exception("Local node is not up after {}s".format(timeout))
+
+
+class LocalChain(object):
+    # Contracts deployed from truffle artifacts to local node, linked as in solidity/migrations
+
+    def __init__(self, web3, build_dir, deployer):
+        self.web3 = web3
+        self.build_dir = build_dir
+        self.deployer = deployer
+        self.contracts = {}
+        self.deploy_block = None
+
+    def rpc(self, method, params):
+        return self.web3.manager.request_blocking(method, params)
+
+    def transact(self, contract_function):
+        tx_hash = contract_function.transact({'from': self.deployer, 'gas': 8000000})
+        receipt = self.web3.eth.waitForTransactionReceipt(tx_hash)
+        if receipt.get('status', 1) == 0:
+            raise Exception("Transaction {} failed".format(self.web3.toHex(tx_hash)))
+        return receipt
+
+    def deploy(self, name, args=(), libraries=None):
+        artifact = load_artifact(self.build_dir, name)
+        bytecode = link_bytecode(artifact['bytecode'], libraries or {})
+        factory = self.web3.eth.contract(abi=artifact['abi'], bytecode=bytecode)
+        receipt = self.transact(factory.constructor(*args))
+        contract = self.web3.eth.contract(address=receipt['contractAddress'], abi=artifact['abi'])
+        self.contracts[name] = contract
+        logger.debug("{} deployed at {}".format(name, contract.address))
+        return contract
+
+    def deploy_all(self):
+        self.deploy_block = self.web3.eth.blockNumber
+        attribute_store = self.deploy('AttributeStore')
+        voting = self.deploy('Voting', libraries={'AttributeStore': attribute_store.address})
+        helper = self.deploy('Helper')
+        admin = self.deploy('Admin')
+        ranking = self.deploy('Ranking', [admin.address], libraries={'Helper': helper.address})
+        faucet = self.deploy('Faucet', [admin.address])
+
+        self.transact(ranking.functions.init(voting.address, *RANKING_PARAMS))
+        self.transact(faucet.functions.init(ranking.address))
+        self.transact(faucet.functions.setFaucetSize(FAUCET_SIZE))
+        self.transact(faucet.functions.setCharset(FAUCET_CHARSET))
+        self.transact(ranking.functions.transfer(faucet.address, FAUCET_SUPPLY))
+
+    def increase_time(self, seconds):
+        self.rpc('evm_increaseTime', [seconds])
+        self.rpc('evm_mine', [])
+
+    def seed_movings(self, item_ids, n_movings, rng):
+        # plays votings of up to len(item_ids) items at once, phases are skipped with evm_increaseTime
+        ranking = self.contracts['Ranking']
+        helper = self.contracts['Helper']
+        commit_ttl = ranking.functions.currentCommitTtl().call()
+        reveal_ttl = ranking.functions.currentRevealTtl().call()
+        done = 0
+        while done < n_movings:
+            items = rng.sample(item_ids, min(len(item_ids), n_movings - done))
+            votes = []
+            for item_id in items:
+                direction = rng.randint(0, 1)
+                stake = Web3.toWei(rng.randint(1, 20), 'ether')
+                salt = rng.randint(0, 100000000)
+                commit_hash = helper.functions.getCommitHash(direction, stake, salt).call()
+                self.transact(ranking.functions.voteCommit(item_id, commit_hash))
+                votes.append((item_id, direction, stake, salt))
+            self.increase_time(commit_ttl + 1)
+            for (item_id, direction, stake, salt) in votes:
+                self.transact(ranking.functions.voteReveal(item_id, direction, stake, salt))
+            self.increase_time(reveal_ttl + 1)
+            for (item_id, direction, stake, salt) in votes:
+                self.transact(ranking.functions.finishVoting(item_id))
+            done += len(votes)
+            print("Seeded {} of {} movings".format(done, n_movings))
+
+    def set_ttl(self, commit_ttl, reveal_ttl):
+        self.transact(self.contracts['Ranking'].functions.setTtl(commit_ttl, reveal_ttl))
+
+
+def measure(autoranker, command, fn):
+    autoranker.rpc_counter.reset()
+    batch_round_trips = autoranker.batch_caller.round_trips
+    tracemalloc.start()
+    start = time.time()
+    error = None
+    try:
+        fn()
+    except Exception as e:
+        logger.exception("Benchmark command {} failed".format(command))
+        error = repr(e)
+    wall_time = time.time() - start
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {'command': command,
+              'wall_time': round(wall_time, 3),
+              'rpc_requests': autoranker.rpc_counter.requests + autoranker.batch_caller.round_trips - batch_round_trips,
+              'rpc_by_method': dict(autoranker.rpc_counter.by_method),
+              'peak_memory_bytes': peak,
+              # process-wide high watermark, includes everything before this command
+              'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              'error': error}
+    print("{:>24}: wall time: {:>9.3f}s,    RPC requests: {:>7},    peak memory: {:>8.1f} MiB{}"
+          .format(command, wall_time, result['rpc_requests'], peak / 1048576.0, ',    FAILED' if error else ''))
+    return result
+
+
+def make_dapps(n_items, rng):
+    dapps = {}
+    for item_id in range(1, n_items + 1):
+        dapps[str(item_id)] = {'id': str(item_id),
+                               'name': 'bench-dapp-{}'.format(item_id),
+                               'their_rank': item_id,
+                               'rank': Web3.toWei(rng.randint(1, 600), 'ether')}
+    return dapps
+
+
+def make_config(chain, rpc_url, accounts, tmp_dir):
+    config = {'eth_http_nodes': [rpc_url],
+              'accounts': accounts,
+              'keys_file': None,
+              'tcrank_address': chain.contracts['Ranking'].address,
+              'tcrank_deploy_block_no': chain.deploy_block,
+              'faucet_address': chain.contracts['Faucet'].address,
+              'helper_address': chain.contracts['Helper'].address,
+              'event_index_db': os.path.join(tmp_dir, 'events.sqlite'),
+              'event_index_confirmations': 0,
+              'catalog_snapshot_file': os.path.join(tmp_dir, 'catalog.json')}
+    for (key, abi_file) in (('tcrank_abi', 'ranking.abi'), ('faucet_abi', 'faucet.abi'), ('helper_abi', 'helper.abi')):
+        with open(os.path.join(SOLIDITY_DIR, 'smartz', abi_file)) as f:
+            config[key] = json.load(f)
+    return config
+
+
+def run_scale(web3, rpc_url, build_dir, accounts, n_items, n_movings, commands, push_ttl, rng):
+    print("\n=== {} items, {} movings ===".format(n_items, n_movings))
+    deployer = web3.toChecksumAddress(accounts[0]['address'])
+    chain = LocalChain(web3, build_dir, deployer)
+    chain.deploy_all()
+
+    tmp_dir = tempfile.mkdtemp(prefix='autoranker_bench_')
+    autoranker = Autoranker(make_config(chain, rpc_url, accounts, tmp_dir), make_dapps(n_items, rng))
+    results = []
+
+    def add(command, fn):
+        r = measure(autoranker, command, fn)
+        r.update({'items': n_items, 'movings': n_movings})
+        results.append(r)
+
+    # items are needed by all other commands
+    add('load_dapps_to_contract', lambda: autoranker.load_dapps_to_contract(None))
+    chain.seed_movings([int(i) for i in autoranker.dapps], n_movings, rng)
+
+    if 'show_ranking' in commands:
+        add('show_ranking', lambda: autoranker.show_ranking(False))
+        add('show_ranking_batched', lambda: autoranker.show_ranking(True))
+    if 'ranking_history' in commands:
+        output_file = os.path.join(tmp_dir, 'history.html')
+        add('ranking_history', lambda: autoranker.ranking_history(None, output_file))
+        # second run reads indexed events from disk
+        add('ranking_history_indexed', lambda: autoranker.ranking_history(None, output_file))
+    if 'push_selected_dapp' in commands:
+        # push waits for voting phases in real time, short phases keep it bounded
+        chain.set_ttl(push_ttl, push_ttl)
+        # seeding transactions were sent by node from the same account
+        autoranker.nonce_manager.sync(deployer)
+        add('push_selected_dapp', lambda: autoranker.push_selected_dapp(rng.choice(list(autoranker.dapps))))
+
+    autoranker.receipt_tracker.stop()
+    return results
+
+
+def compare(results, baseline_file):
+    with open(baseline_file) as f:
+        baseline = dict(((r['command'], r['items']), r) for r in json.load(f)['results'])
+    print("\n{:>24} {:>7} {:>12} {:>12} {:>12}".format('command', 'items', 'wall time', 'RPC', 'memory'))
+    for r in results:
+        b = baseline.get((r['command'], r['items']))
+        if b is None:
+            continue
+        ratios = [(r[k] / b[k]) if b[k] else float('nan') for k in ('wall_time', 'rpc_requests', 'peak_memory_bytes')]
+        print("{:>24} {:>7} {:>11.2f}x {:>11.2f}x {:>11.2f}x".format(r['command'], r['items'], *ratios))
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=SOLIDITY_DIR).decode().strip()
+    except Exception:
+        return None
+
+
+def main(arguments):
+    logging.basicConfig(filename='/tmp/autoranker_bench.log', level=logging.DEBUG)
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=str, default='100,1000,10000', help="comma separated numbers of items")
+    parser.add_argument('--movings', type=int, help="movings seeded per scale (default: 10%% of items, at least 10)")
+    parser.add_argument('--commands', type=str, default='show_ranking,ranking_history,push_selected_dapp', help="comma separated commands to measure")
+    parser.add_argument('--port', type=int, default=8555, help="ganache-cli port")
+    parser.add_argument('--push-ttl', type=int, default=5, help="commit and reveal phase length for push_selected_dapp")
+    parser.add_argument('--seed', type=int, default=1, help="random seed of generated items and votes")
+    parser.add_argument('--output', type=str, default='autoranker_benchmark.json', help="results file")
+    parser.add_argument('--compare', type=str, help="results file of previous run to compare with")
+    args = parser.parse_args(arguments)
+
+    rng = random.Random(args.seed)
+    accounts = [generate_keypair_and_address() for i in range(4)]
+    build_dir = compile_contracts(SOLIDITY_DIR)
+
+    rpc_url = 'http://127.0.0.1:{}'.format(args.port)
+    ganache = start_ganache(SOLIDITY_DIR, args.port, accounts, open('/tmp/autoranker_bench_ganache.log', 'w'))
+
+    results = []
+    try:
+        web3 = Web3(Web3.HTTPProvider(rpc_url))
+        wait_for_node(web3)
+        for n_items in [int(x) for x in args.scales.split(',')]:
+            n_movings = args.movings if args.movings is not None else max(10, n_items // 10)
+            results += run_scale(web3, rpc_url, build_dir, accounts, n_items, n_movings,
+                                 args.commands.split(','), args.push_ttl, rng)
+    finally:
+        ganache.terminate()
+        ganache.wait()
+
+    with open(args.output, 'w') as f:
+        json.dump({'revision': git_revision(),
+                   'timestamp': int(time.time()),
+                   'python': platform.python_version(),
+                   'node': 'ganache-cli',
+                   'results': results}, f, indent=4)
+    print("Results saved to '{}'".format(args.output))
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
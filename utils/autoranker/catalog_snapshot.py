@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import json
+import tempfile
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+class CatalogSnapshot(object):
+    # Last synced dapps catalog persisted on disk: {id: {name, their_rank, rank, status}},
+    # status is on-chain status after last sync ('exists', 'added', 'failed').
+    # Diff with fresh export gives only dapps that need contract work
+
+    def __init__(self, path):
+        self.path = path
+        self.dapps = {}
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r') as f:
+                    self.dapps = json.load(f).get('dapps', {})
+            except Exception as e:
+                logger.error("cannot load catalog snapshot from '{}', starting from empty: {}".format(path, repr(e)))
+
+    def diff(self, dapps):
+        result = {'added': [], 'removed': [], 'reranked': [], 'renamed': [], 'unchanged': []}
+        for dapp_id in dapps:
+            prev = self.dapps.get(dapp_id)
+            # dapps not confirmed on-chain last time are pushed again
+            if prev is None or prev.get('status') not in ('exists', 'added'):
+                result['added'].append(dapp_id)
+            elif str(prev.get('rank')) != str(dapps[dapp_id].get('rank')):
+                result['reranked'].append(dapp_id)
+            elif prev.get('name') != dapps[dapp_id].get('name'):
+                result['renamed'].append(dapp_id)
+            else:
+                result['unchanged'].append(dapp_id)
+
+        for dapp_id in self.dapps:
+            if dapp_id not in dapps:
+                result['removed'].append(dapp_id)
+
+        return result
+
+    def update(self, dapps, statuses):
+        # statuses - {dapp_id: on-chain status} for dapps processed in this sync, others keep old status
+        snapshot = {}
+        for dapp_id in dapps:
+            d = dapps[dapp_id]
+            status = statuses.get(dapp_id, self.dapps.get(dapp_id, {}).get('status'))
+            snapshot[dapp_id] = {'id': dapp_id,
+                                 'name': d.get('name'),
+                                 'their_rank': d.get('their_rank'),
+                                 'rank': str(d.get('rank')),
+                                 'status': status}
+        self.dapps = snapshot
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + '.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'dapps': self.dapps}, f, indent=4, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except Exception:
+            os.unlink(tmp)
+            raise
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+import numpy as np
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+# public state of Ranking contract used by fee formulas
+COMMISSION_PARAMS = ('avgStake', 'maxRank', 'totalSupply',
+                     'dynamicFeeLinearRate', 'dynamicFeeLinearPrecision', 'maxOverStakeFactor',
+                     'maxFixedFeeRate', 'maxFixedFeePrecision')
+
+
+def isqrt(x):
+    # Helper.sqrt()
+    if x == 0:
+        return 0
+    if x <= 3:
+        return 1
+    z = (x + 1) // 2
+    y = x
+    while z < y:
+        y = z
+        z = (x // z + z) // 2
+    return y
+
+
+class CommissionModel(object):
+    # Vectorized port of Ranking.getFixedCommission, Ranking.getDynamicCommission and Helper.calculatePrize,
+    # every formula takes arrays of candidate stakes (or ranks), so stake can be sized without eth_call per candidate.
+    # exact=True keeps wei values as Python ints in object arrays (same integer rounding as contract),
+    # exact=False uses float64, faster for wide scans but only approximately equal to contract
+
+    def __init__(self, params, exact=True):
+        # params - {name: value} of COMMISSION_PARAMS
+        self.params = dict((k, int(v)) for (k, v) in params.items())
+        self.exact = exact
+
+    @classmethod
+    def from_contract(cls, tcrank, batch_caller, block='latest', exact=True):
+        # all parameters in one batch, pinned to one block
+        values = batch_caller.call_each(tcrank, [(name, []) for name in COMMISSION_PARAMS], block)
+        missing = [name for (name, v) in zip(COMMISSION_PARAMS, values) if v is None]
+        if missing:
+            raise ValueError("Cannot read commission parameters '{}' from contract".format(', '.join(missing)))
+        return cls(dict(zip(COMMISSION_PARAMS, values)), exact)
+
+    def array(self, values):
+        if self.exact:
+            return np.array([int(v) for v in np.atleast_1d(values)], dtype=object)
+        return np.atleast_1d(np.asarray(values, dtype=np.float64))
+
+    def fixed_fee(self, ranks):
+        # fixed fee of voting started at item's current rank
+        p = self.params
+        ranks = self.array(ranks)
+        max_fee = p['avgStake'] * p['maxFixedFeeRate'] // p['maxFixedFeePrecision']
+        max_rank = p['maxRank']
+        if max_rank == 0:
+            return self.array([max_fee] * len(ranks))
+        d_rank = max_rank - ranks
+        return np.where(ranks >= max_rank, max_fee, max_fee - max_fee * d_rank // max_rank)
+
+    def over_stake_factor(self, avg_stake):
+        # (k, kPrecision) of quadratic part, contract reverts on zero denominators, so does this
+        p = self.params
+        max_k = isqrt(p['totalSupply'] - avg_stake)
+        x = p['maxOverStakeFactor'] * avg_stake
+        if max_k > x:
+            return (max_k // x, 1)
+        return (1, x // max_k)
+
+    def dynamic_fee(self, stakes, avg_stake=None):
+        # avg_stake - voting's avgStake (snapshot of global one at voting start)
+        p = self.params
+        avg_stake = p['avgStake'] if avg_stake is None else int(avg_stake)
+        stakes = self.array(stakes)
+        linear = stakes * p['dynamicFeeLinearRate'] // p['dynamicFeeLinearPrecision']
+        if not np.any(stakes > avg_stake):
+            return linear
+        (k, k_precision) = self.over_stake_factor(avg_stake)
+        fee = avg_stake * p['dynamicFeeLinearRate'] // p['dynamicFeeLinearPrecision']
+        over_stake = np.where(stakes > avg_stake, stakes - avg_stake, 0)
+        return np.where(stakes > avg_stake, fee + (k * over_stake // k_precision) ** 2, linear)
+
+    def prize(self, overall_prize, overall_stake, voter_stakes):
+        # Helper.calculatePrize(), sent to winner at finishVoting
+        voter_stakes = self.array(voter_stakes)
+        overall_stake = self.array(overall_stake)
+        overall_prize = self.array(overall_prize)
+        safe_stake = np.where(overall_stake > 0, overall_stake, 1)
+        return np.where(overall_stake > 0, overall_prize * voter_stakes // safe_stake, 0)
+
+    def expected_profit(self, stakes, fixed_fee, total_prize, other_stake, win_probability=0.5, avg_stake=None):
+        # Expected tokens gained by committing and revealing each of stakes: prize with win_probability minus fees.
+        # Stake itself comes back either way (losers at finish, winners by unstake).
+        # total_prize - prize pool before our vote (voting's totalPrize or item balance for new voting),
+        # other_stake - expected stake revealed by other voters
+        stakes = self.array(stakes)
+        fees = self.dynamic_fee(stakes, avg_stake) + int(fixed_fee)
+        prizes = self.prize(int(total_prize) + fees, int(other_stake) + stakes, stakes)
+        if self.exact:
+            return np.array([float(v) for v in prizes], dtype=np.float64) * win_probability - np.array([float(v) for v in fees], dtype=np.float64)
+        return prizes * win_probability - fees
+
+    def best_stake(self, stakes, fixed_fee, total_prize, other_stake, win_probability=0.5, avg_stake=None):
+        # (stake, expected profit) with largest expected profit, smaller stake on ties
+        stakes = self.array(stakes)
+        profits = self.expected_profit(stakes, fixed_fee, total_prize, other_stake, win_probability, avg_stake)
+        best = int(np.argmax(profits))
+        return (int(stakes[best]), float(profits[best]))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import json
+import time
+import tempfile
+import threading
+
+from eth_utils import keccak
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+def commit_hash(direction, stake, salt):
+    # same as Helper.getCommitHash: keccak256(abi.encodePacked(uint, uint, uint)), checked by solidity/test/Helper.test.js
+    return '0x' + keccak(b''.join(int(x).to_bytes(32, 'big') for x in (direction, stake, salt))).hex()
+
+
+class CommitJournal(object):
+    # Append-only JSON-lines journal of vote commitments, fsync'd before commit transaction is sent.
+    # Record of commit: {event: 'commit', key, item_id, voting_id (None for new voting), account,
+    # direction, stake, salt, commit_hash, ts}, later closed by {event: 'revealed'|'abandoned'|'expired', key}.
+    # Commitments without closing record are pending reveal, journal is compacted to them on open
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.commits = {}
+        self.closed = {}
+        damaged = False
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        r = json.loads(line)
+                    except ValueError:
+                        # last line may be cut by crash, its commit transaction was not sent
+                        damaged = True
+                        continue
+                    if r['event'] == 'commit':
+                        self.commits[r['key']] = r
+                    else:
+                        self.closed[r['key']] = r['event']
+            self.compact(damaged)
+
+    def key(self, item_id, account, commit_hash):
+        return "{}:{}:{}".format(int(item_id), account.lower(), commit_hash)
+
+    def append(self, record):
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def commit(self, item_id, voting_id, account, direction, stake, salt, commit_hash):
+        record = {'event': 'commit',
+                  'key': self.key(item_id, account, commit_hash),
+                  'item_id': int(item_id),
+                  'voting_id': voting_id,
+                  'account': account,
+                  'direction': int(direction),
+                  'stake': int(stake),
+                  'salt': int(salt),
+                  'commit_hash': commit_hash,
+                  'ts': int(time.time())}
+        self.append(record)
+        self.commits[record['key']] = record
+        return record['key']
+
+    def close(self, key, event):
+        if key not in self.commits or key in self.closed:
+            return
+        self.append({'event': event, 'key': key})
+        self.closed[key] = event
+
+    def pending(self):
+        # snapshot, commits may be journaled from other threads meanwhile
+        return [c for (k, c) in list(self.commits.items()) if k not in self.closed]
+
+    def compact(self, force=False):
+        pending = self.pending()
+        if len(pending) == len(self.commits) and not force:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + '.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                for c in pending:
+                    f.write(json.dumps(c) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+        self.commits = dict((c['key'], c) for c in pending)
+        self.closed = {}
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import json
+import time
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from eth_utils import event_abi_to_log_topic
+from web3.utils.events import get_event_data
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+# Ranking.sol events, ERC20 Transfer/Approval are not indexed
+INDEXED_EVENTS = ('VotingStarted', 'VoteCommit', 'VoteReveal', 'VotingFinished', 'MovingStarted', 'MovingRemoved')
+
+
+class EventIndex(object):
+    # Incremental on-disk index of Ranking contract logs.
+    # Logs are fetched in block-range chunks by several threads, chunk size adapts to provider limits
+    # (halved when provider rejects range, doubled while ranges come back fine).
+    # Only blocks deeper than `confirmations` are stored, so shallow reorgs never reach the index,
+    # deeper ones are detected by stored checkpoint block hash and rewound.
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS events (
+               block_number INTEGER NOT NULL,
+               log_index INTEGER NOT NULL,
+               tx_hash TEXT NOT NULL,
+               event TEXT NOT NULL,
+               item_id INTEGER,
+               args TEXT NOT NULL,
+               PRIMARY KEY (block_number, log_index))""",
+        "CREATE INDEX IF NOT EXISTS events_event_item ON events (event, item_id)",
+        """CREATE TABLE IF NOT EXISTS checkpoint (
+               address TEXT PRIMARY KEY,
+               block_number INTEGER NOT NULL,
+               block_hash TEXT NOT NULL)""",
+    ]
+
+    def __init__(self, web3, address, abi, deploy_block, db_path,
+                 confirmations=6, chunk_size=5000, min_chunk_size=10, max_chunk_size=100000, workers=4):
+        self.web3 = web3
+        self.address = address
+        self.deploy_block = int(deploy_block)
+        self.confirmations = confirmations
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.workers = workers
+
+        self.event_abis = {}
+        for i in abi:
+            if i['type'] == 'event' and i['name'] in INDEXED_EVENTS:
+                self.event_abis[event_abi_to_log_topic(i)] = i
+        missing = set(INDEXED_EVENTS) - set(i['name'] for i in self.event_abis.values())
+        if missing:
+            raise KeyError("No abi for events '{}' was found in ranking.abi".format(', '.join(sorted(missing))))
+
+        self.db = sqlite3.connect(db_path)
+        for stmt in self.SCHEMA:
+            self.db.execute(stmt)
+        self.db.commit()
+
+    def checkpoint(self):
+        row = self.db.execute("SELECT block_number, block_hash FROM checkpoint WHERE address = ?", (self.address,)).fetchone()
+        if row is None:
+            return self.deploy_block - 1, None
+        return row[0], row[1]
+
+    def rewind(self, block_number):
+        # forget everything after block_number
+        self.db.execute("DELETE FROM events WHERE block_number > ?", (block_number,))
+        block = self.web3.eth.getBlock(block_number)
+        self.db.execute("INSERT OR REPLACE INTO checkpoint (address, block_number, block_hash) VALUES (?, ?, ?)",
+                        (self.address, block_number, self.web3.toHex(block['hash'])))
+        self.db.commit()
+
+    def check_reorg(self):
+        # returns last indexed block that is still in canonical chain
+        last_block, last_hash = self.checkpoint()
+        while last_hash is not None:
+            block = self.web3.eth.getBlock(last_block)
+            if block is not None and self.web3.toHex(block['hash']) == last_hash:
+                break
+            new_last = max(last_block - 2 * max(self.confirmations, 1), self.deploy_block - 1)
+            logger.info("Reorg detected at indexed block {}, rewinding to {}".format(last_block, new_last))
+            if new_last < self.deploy_block:
+                self.db.execute("DELETE FROM events")
+                self.db.execute("DELETE FROM checkpoint WHERE address = ?", (self.address,))
+                self.db.commit()
+            else:
+                self.rewind(new_last)
+            last_block, last_hash = self.checkpoint()
+        return last_block
+
+    def fetch_range(self, from_block, to_block):
+        try:
+            logs = self.web3.eth.getLogs({'address': self.address,
+                                          'fromBlock': from_block,
+                                          'toBlock': to_block,
+                                          'topics': [list(self.web3.toHex(t) for t in self.event_abis)]})
+            return (from_block, to_block, logs, None)
+        except Exception as e:
+            return (from_block, to_block, None, e)
+
+    def store(self, logs, to_block):
+        rows = []
+        for log in logs:
+            event_abi = self.event_abis.get(bytes(log['topics'][0]))
+            if event_abi is None:
+                continue
+            args = dict(get_event_data(event_abi, log).args)
+            item_id = args.get('itemId', args.get('_itemId'))
+            rows.append((log['blockNumber'], log['logIndex'], self.web3.toHex(log['transactionHash']),
+                         event_abi['name'], item_id, json.dumps(args)))
+
+        block = self.web3.eth.getBlock(to_block)
+        self.db.executemany("INSERT OR REPLACE INTO events (block_number, log_index, tx_hash, event, item_id, args) VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.db.execute("INSERT OR REPLACE INTO checkpoint (address, block_number, block_hash) VALUES (?, ?, ?)",
+                        (self.address, to_block, self.web3.toHex(block['hash'])))
+        self.db.commit()
+        return len(rows)
+
+    def sync(self):
+        # fetches only new tail since last checkpoint, returns number of new events
+        start = time.time()
+        safe_head = self.web3.eth.blockNumber - self.confirmations
+        next_block = self.check_reorg() + 1
+        if next_block > safe_head:
+            return 0
+
+        planned = next_block
+        retry = []
+        done = {}
+        total = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while next_block <= safe_head:
+                ranges = retry[:self.workers]
+                retry = retry[self.workers:]
+                while len(ranges) < self.workers and planned <= safe_head:
+                    to_block = min(planned + self.chunk_size - 1, safe_head)
+                    ranges.append((planned, to_block))
+                    planned = to_block + 1
+
+                for (from_block, to_block, logs, error) in executor.map(lambda r: self.fetch_range(*r), ranges):
+                    if error is None:
+                        done[from_block] = (to_block, logs)
+                        if len(logs) < 1000:
+                            self.chunk_size = min(self.chunk_size * 2, self.max_chunk_size)
+                        continue
+
+                    # provider rejected the range (too many results or too wide), split it
+                    if to_block == from_block:
+                        raise error
+                    logger.debug("getLogs {}..{} failed: {}, splitting".format(from_block, to_block, repr(error)))
+                    self.chunk_size = max(self.chunk_size // 2, self.min_chunk_size)
+                    middle = (from_block + to_block) // 2
+                    retry += [(from_block, middle), (middle + 1, to_block)]
+
+                # checkpoint moves only over contiguous fetched ranges
+                while next_block in done:
+                    (to_block, logs) = done.pop(next_block)
+                    total += self.store(logs, to_block)
+                    next_block = to_block + 1
+
+        logger.info("Indexed {} events up to block {} in {}s".format(total, safe_head, round(time.time() - start, 2)))
+        return total
+
+    def get_events(self, names, item_id=None, from_block=None):
+        query = "SELECT block_number, log_index, tx_hash, event, args FROM events WHERE event IN ({})".format(', '.join('?' * len(names)))
+        params = list(names)
+        if item_id is not None:
+            query += " AND item_id = ?"
+            params.append(int(item_id))
+        if from_block is not None:
+            query += " AND block_number >= ?"
+            params.append(from_block)
+        query += " ORDER BY block_number, log_index"
+
+        return [{'block_number': r[0], 'log_index': r[1], 'tx_hash': r[2], 'event': r[3], 'args': json.loads(r[4])}
+                for r in self.db.execute(query, params)]
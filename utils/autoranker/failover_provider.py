@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import json
+import time
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3.providers.base import JSONBaseProvider
+
+from rate_limiter import RateLimiter, LANE_TX, LANE_BULK
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+# sent only to primary endpoint, other nodes may not know our pending nonces
+BROADCAST_METHODS = ('eth_sendRawTransaction', 'eth_sendTransaction')
+# go to bulk lane of rate limiter unless caller set other lane
+BULK_METHODS = ('eth_getLogs',)
+
+
+def pinned_to_primary(method, params):
+    # broadcasts and 'pending' nonce reads (NonceManager.fetch) depend on primary's mempool,
+    # other endpoint may return nonce of our transaction which is already pending
+    if method in BROADCAST_METHODS:
+        return True
+    return method == 'eth_getTransactionCount' and 'pending' in (params or [])
+
+
+class EndpointDown(IOError):
+    pass
+
+
+class FailoverHTTPProvider(JSONBaseProvider):
+    # Web3 provider over several JSON-RPC endpoints sharing one pooled keep-alive session.
+    # Reads go to the healthy endpoint with the lowest latency (EWMA of request times), endpoint is
+    # marked down for down_interval seconds on transport/HTTP error and request is retried on next one.
+    # Endpoints are health checked with eth_blockNumber every health_check_interval seconds, endpoints
+    # lagging more than max_block_lag blocks behind the best one are not used for reads.
+    # Transactions are broadcast and pending nonces are read only through primary (first) endpoint.
+    # Every request (including retries and health checks) takes tokens from rate limiter first
+
+    def __init__(self, endpoints, timeout=60, pool_size=32, ewma_alpha=0.3, down_interval=30,
+                 health_check_interval=60, max_block_lag=3, limiter=None):
+        super().__init__()
+        if isinstance(endpoints, str):
+            endpoints = [endpoints]
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        self.endpoints = list(endpoints)
+        self.primary = self.endpoints[0]
+        self.timeout = timeout
+        self.ewma_alpha = ewma_alpha
+        self.down_interval = down_interval
+        self.health_check_interval = health_check_interval
+        self.max_block_lag = max_block_lag
+        self.lock = threading.Lock()
+        self.health = dict((e, {'latency': None, 'down_until': 0, 'block': None, 'errors': 0, 'requests': 0})
+                           for e in self.endpoints)
+        self.health_checked_at = 0
+        self.limiter = limiter if limiter is not None else RateLimiter()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+    def __str__(self):
+        return "RPC connection {}".format(', '.join(self.endpoints))
+
+    def record(self, endpoint, latency=None, error=None):
+        with self.lock:
+            h = self.health[endpoint]
+            h['requests'] += 1
+            if error is not None:
+                h['errors'] += 1
+                h['down_until'] = time.time() + self.down_interval
+                return
+            h['down_until'] = 0
+            if h['latency'] is None:
+                h['latency'] = latency
+            else:
+                h['latency'] = self.ewma_alpha * latency + (1 - self.ewma_alpha) * h['latency']
+
+    def ranked_endpoints(self):
+        # healthy endpoints by latency, then lagging and down ones as last resort
+        now = time.time()
+        with self.lock:
+            best_block = max([h['block'] for h in self.health.values() if h['block'] is not None] or [None])
+
+            def key(e):
+                h = self.health[e]
+                lagging = best_block is not None and h['block'] is not None and best_block - h['block'] > self.max_block_lag
+                return (h['down_until'] > now, lagging, h['latency'] if h['latency'] is not None else 0)
+            return sorted(self.endpoints, key=key)
+
+    def post_to(self, endpoint, payload, lane=None, cost=1):
+        self.limiter.acquire(cost, lane)
+        start = time.time()
+        try:
+            res = self.session.post(endpoint, data=payload, timeout=self.timeout)
+            res.raise_for_status()
+            response = res.json()
+        except (requests.RequestException, ValueError) as e:
+            self.record(endpoint, error=e)
+            logger.error("RPC endpoint {} failed: {}".format(endpoint, repr(e)))
+            raise EndpointDown("RPC endpoint {} failed: {}".format(endpoint, repr(e)))
+        self.record(endpoint, time.time() - start)
+        return response
+
+    def health_check(self, lane=None):
+        self.health_checked_at = time.time()
+        payload = json.dumps({'jsonrpc': '2.0', 'id': 0, 'method': 'eth_blockNumber', 'params': []})
+        for endpoint in self.endpoints:
+            try:
+                response = self.post_to(endpoint, payload, lane)
+                block = int(response['result'], 16)
+            except (EndpointDown, KeyError, TypeError, ValueError):
+                continue
+            with self.lock:
+                self.health[endpoint]['block'] = block
+        logger.debug("RPC endpoints health: {}".format(repr(self.health)))
+
+    def post(self, payload, method=None, params=None):
+        # payload - request dict or list of them (batch), returns decoded response
+        cost = 1
+        if method in BROADCAST_METHODS:
+            lane = LANE_TX
+        elif method in BULK_METHODS or isinstance(payload, list):
+            lane = self.limiter.current_lane(LANE_BULK)
+            cost = len(payload) if isinstance(payload, list) else 1
+        else:
+            lane = self.limiter.current_lane()
+        batch = payload if isinstance(payload, list) else [payload] if isinstance(payload, dict) else []
+        pinned = pinned_to_primary(method, params) or any(pinned_to_primary(r.get('method'), r.get('params')) for r in batch)
+        if not isinstance(payload, (str, bytes)):
+            payload = json.dumps(payload)
+
+        if pinned:
+            return self.post_to(self.primary, payload, lane, cost)
+
+        if len(self.endpoints) > 1 and time.time() - self.health_checked_at > self.health_check_interval:
+            self.health_check(lane)
+
+        error = None
+        for endpoint in self.ranked_endpoints():
+            try:
+                return self.post_to(endpoint, payload, lane, cost)
+            except EndpointDown as e:
+                error = e
+        raise error
+
+    def make_request(self, method, params):
+        return self.post(self.encode_rpc_request(method, params), method, params)
+
+    def stats(self):
+        with self.lock:
+            return dict((e, {'latency': round(h['latency'], 3) if h['latency'] is not None else None,
+                             'requests': h['requests'],
+                             'errors': h['errors'],
+                             'block': h['block']})
+                        for (e, h) in self.health.items())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import time
+import math
+import threading
+
+import numpy as np
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+class FeeEngine(object):
+    # Gas prices from recent block history instead of fixed per-action prices.
+    # For every of last history_blocks blocks the lowest gas price that got included is kept (fetched
+    # once per block), price is a percentile over these minimums: base_percentile for transactions without
+    # deadline, growing to urgent_percentile when less than urgency_blocks blocks are left till deadline.
+    # Stuck transactions are replaced with same nonce and price bumped at least by `bump` (nodes require +10%)
+
+    def __init__(self, web3, history_blocks=20, base_percentile=50, urgent_percentile=95, urgency_blocks=10,
+                 min_price=None, max_price=None, bump=1.125, replace_interval=60, refresh_interval=5):
+        self.web3 = web3
+        self.history_blocks = history_blocks
+        self.base_percentile = base_percentile
+        self.urgent_percentile = urgent_percentile
+        self.urgency_blocks = urgency_blocks
+        self.min_price = min_price if min_price is not None else web3.toWei('1', 'gwei')
+        self.max_price = max_price if max_price is not None else web3.toWei('50', 'gwei')
+        self.bump = bump
+        self.replace_interval = replace_interval
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        # block number -> (timestamp, lowest gas price or None for empty block)
+        self.blocks = {}
+        self.refreshed_at = 0
+
+    def refresh(self):
+        with self.lock:
+            if time.time() - self.refreshed_at < self.refresh_interval:
+                return
+            self.refreshed_at = time.time()
+            head = self.web3.eth.blockNumber
+            for n in range(max(head - self.history_blocks + 1, 0), head + 1):
+                if n in self.blocks:
+                    continue
+                block = self.web3.eth.getBlock(n, True)
+                if block is None:
+                    continue
+                prices = [tx['gasPrice'] for tx in block['transactions'] if tx.get('gasPrice')]
+                self.blocks[n] = (block['timestamp'], min(prices) if prices else None)
+            for n in [n for n in self.blocks if n <= head - self.history_blocks]:
+                del self.blocks[n]
+
+    def block_time(self):
+        numbers = sorted(self.blocks)
+        if len(numbers) < 2:
+            return 15.0
+        return max((self.blocks[numbers[-1]][0] - self.blocks[numbers[0]][0]) / float(numbers[-1] - numbers[0]), 1.0)
+
+    def urgency(self, deadline, now=None):
+        # 0 - no hurry, 1 - deadline is less than a block away
+        if deadline is None:
+            return 0.0
+        left = deadline - (now or time.time())
+        horizon = self.urgency_blocks * self.block_time()
+        return min(max(1.0 - left / horizon, 0.0), 1.0)
+
+    def gas_price(self, deadline=None):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error("Cannot refresh gas price history: {}".format(repr(e)))
+
+        percentile = self.base_percentile + (self.urgent_percentile - self.base_percentile) * self.urgency(deadline)
+        # empty blocks mean any price is accepted
+        minimums = [p if p is not None else self.min_price for (ts, p) in self.blocks.values()]
+        if minimums:
+            price = int(np.percentile(minimums, percentile))
+        else:
+            price = self.web3.eth.gasPrice
+        return int(min(max(price, self.min_price), self.max_price))
+
+    def bump_price(self, old_price, deadline=None):
+        # price of same-nonce replacement, None if it would exceed max_price
+        price = max(int(math.ceil(old_price * self.bump)), self.gas_price(deadline))
+        if price > self.max_price:
+            return None
+        return price
+
+    def replace_after(self, deadline=None, now=None):
+        # seconds to wait for transaction before replacing it, checked more often close to deadline
+        if deadline is None:
+            return self.replace_interval
+        left = deadline - (now or time.time())
+        if left <= 0:
+            return self.replace_interval
+        return max(self.block_time(), min(self.replace_interval, left / 3.0))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import json
+import threading
+
+import numpy as np
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+# fixed limits used until method has enough samples
+DEFAULT_GAS_CAPS = {'giveEther': 1000000,
+                    'giveTokens': 1000000,
+                    'voteCommit': 3000000,
+                    'voteReveal': 4000000,
+                    'finishVoting': 7300000,
+                    'unstake': 3000000}
+
+
+class GasModel(object):
+    # Per-method linear model of required gas over features [1, voters, movings] (voters in item's voting,
+    # active movings of item), fitted by least squares on estimateGas of our own transactions.
+    # gasUsed of receipt is not used: it is after storage refunds (voteCommit and finishVoting clear
+    # movings and voters), while limit must cover gas before refund. Estimates are taken for the first
+    # min_samples transactions of method and then for every sample_every-th one.
+    # Limit is prediction plus largest underestimate seen, times margin; margin of method
+    # grows after every out-of-gas failure. Samples are appended to JSON-lines file and reloaded on start
+
+    def __init__(self, path=None, margin=1.3, min_samples=5, max_gas=8000000, caps=DEFAULT_GAS_CAPS, sample_every=20):
+        self.path = path
+        self.margin = margin
+        self.min_samples = min_samples
+        self.sample_every = sample_every
+        self.max_gas = max_gas
+        self.caps = caps
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.margins = {}
+        self.models = {}
+        self.built = {}
+        if path is not None and os.path.isfile(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        s = json.loads(line)
+                    except ValueError:
+                        # last line may be cut by crash
+                        continue
+                    if 'gas' not in s:
+                        # older samples were post-refund gasUsed of receipts
+                        continue
+                    self.samples.setdefault(s['method'], []).append((s['features'], s['gas']))
+
+    def features(self, voters, movings):
+        return [1, int(voters), int(movings)]
+
+    def wants_sample(self, method):
+        # called once per built transaction, True if its gas should be estimated
+        with self.lock:
+            self.built[method] = self.built.get(method, 0) + 1
+            return len(self.samples.get(method, [])) < self.min_samples or self.built[method] % self.sample_every == 0
+
+    def record(self, method, features, gas):
+        # gas - estimateGas of transaction
+        with self.lock:
+            self.samples.setdefault(method, []).append((features, gas))
+            self.models.pop(method, None)
+            if self.path is not None:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps({'method': method, 'features': features, 'gas': gas}) + '\n')
+
+    def out_of_gas(self, method):
+        with self.lock:
+            self.margins[method] = self.margins.get(method, self.margin) * 1.25
+            logger.error("{}() ran out of gas, margin raised to {}".format(method, round(self.margins[method], 2)))
+
+    def fit(self, method):
+        # returns (coefficients, largest underestimate) or None if there are not enough samples
+        samples = self.samples.get(method, [])
+        if len(samples) < self.min_samples:
+            return None
+        if method not in self.models:
+            x = np.array([f for (f, g) in samples], dtype=np.float64)
+            y = np.array([g for (f, g) in samples], dtype=np.float64)
+            (coef, residuals, rank, sv) = np.linalg.lstsq(x, y, rcond=None)
+            self.models[method] = (coef, max(float(np.max(y - x.dot(coef))), 0.0))
+        return self.models[method]
+
+    def limit(self, method, features):
+        cap = self.caps.get(method, self.max_gas)
+        with self.lock:
+            model = self.fit(method)
+            margin = self.margins.get(method, self.margin)
+        if model is None:
+            return cap
+        (coef, underestimate) = model
+        predicted = float(np.dot(coef, features)) + underestimate
+        return int(min(max(predicted * margin, 21000), self.max_gas))
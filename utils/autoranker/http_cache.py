@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import re
+import json
+import time
+import zlib
+import codecs
+import random
+import hashlib
+import tempfile
+from email.utils import parsedate_to_datetime
+from urllib.request import urlopen, Request
+from urllib.error import HTTPError
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+CHUNK_SIZE = 64 * 1024
+JSON_WHITESPACE = ' \t\r\n'
+JSON_VALUE_START = '{["-0123456789tfnNI'
+# rest of buffer after decoded number which may be continuation of it
+NUMBER_TAIL = re.compile(r'[0-9.eE+\-]*\Z')
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/35.0.1916.47 Safari/537.36'
+
+
+def parse_json_stream(chunks):
+    # Parses JSON from iterable of text chunks. Top-level array is decoded element by element,
+    # so only one partially received element is buffered, other values are parsed at the end
+    chunks = iter(chunks)
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    result = None
+    # expected next token in array: 'value' (or ']' right after '['), 'comma' (',' or ']'), 'end' (only whitespace)
+    expect = 'value'
+    for chunk in chunks:
+        buf = buf[pos:] + chunk
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in JSON_WHITESPACE:
+                pos += 1
+            if pos >= len(buf):
+                break
+            if result is None:
+                if buf[pos] != '[':
+                    # not an array, nothing to stream
+                    return json.loads(buf[pos:] + ''.join(chunks))
+                result = []
+                pos += 1
+                continue
+            if expect == 'end':
+                raise ValueError("Extra data after JSON array at char {}".format(pos))
+            if expect == 'comma':
+                if buf[pos] not in ',]':
+                    raise ValueError("Expecting ',' delimiter at char {}".format(pos))
+                expect = 'value' if buf[pos] == ',' else 'end'
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                if len(result) > 0:
+                    raise ValueError("Expecting value after ',' at char {}".format(pos))
+                expect = 'end'
+                pos += 1
+                continue
+            try:
+                (value, end) = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if buf[pos] not in JSON_VALUE_START:
+                    raise ValueError("Expecting value at char {}".format(pos))
+                # element is not received completely yet
+                break
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and \
+                    (end == len(buf) or buf[end] not in JSON_WHITESPACE + ',]'):
+                # number is complete only when delimiter follows it, chunk may end after "3." or "3e"
+                if NUMBER_TAIL.match(buf, end) is None:
+                    raise ValueError("Invalid number at char {}".format(pos))
+                break
+            result.append(value)
+            expect = 'comma'
+            pos = end
+
+    if result is None or expect != 'end':
+        raise ValueError("Unexpected end of JSON data")
+    return result
+
+
+class JsonUrlCache(object):
+    # Downloads JSON documents with on-disk cache:
+    # - fresh (younger than ttl) cache file is used without request
+    # - stale cache is revalidated with ETag/If-Modified-Since, 304 reuses cached copy
+    # - body is requested gzipped, decompressed, written to temp file and parsed on the fly,
+    #   temp file atomically replaces cache file only after whole body is parsed
+    # - 429/5xx and network errors are retried with exponential backoff honoring Retry-After
+
+    def __init__(self, cache_dir='/tmp', prefix='autoranker_cache_json_', max_tries=4, backoff=2.0, max_backoff=300, timeout=60):
+        self.cache_dir = cache_dir
+        self.prefix = prefix
+        self.max_tries = max_tries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+    def cache_filename(self, url):
+        md5hasher = hashlib.md5()
+        md5hasher.update(url.encode('utf-8'))
+        return os.path.join(self.cache_dir, self.prefix + md5hasher.hexdigest())
+
+    def read_meta(self, filename):
+        try:
+            with open(filename + '.meta', 'r') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def write_atomic(self, filename, data):
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix=os.path.basename(filename) + '.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, filename)
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+    def read_cached(self, filename):
+        with open(filename, 'r') as f:
+            return parse_json_stream(iter(lambda: f.read(CHUNK_SIZE), ''))
+
+    def retry_delay(self, try_count, error=None):
+        delay = min(self.backoff * (2 ** (try_count - 1)), self.max_backoff)
+        retry_after = error.headers.get('Retry-After') if (error is not None and error.headers is not None) else None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except Exception:
+                    pass
+            return min(max(delay, 0), self.max_backoff)
+        # jitter, so several processes do not retry at the same moment
+        return delay * random.uniform(0.5, 1)
+
+    def download(self, res, filename):
+        # streams response body into temp file and parser at the same time
+        inflater = None
+        if (res.headers.get('Content-Encoding') or '').lower() == 'gzip':
+            inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        text_decoder = codecs.getincrementaldecoder('utf-8')()
+
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix=os.path.basename(filename) + '.')
+        try:
+            with os.fdopen(fd, 'w') as out:
+                def chunks():
+                    while True:
+                        data = res.read(CHUNK_SIZE)
+                        if not data:
+                            break
+                        if inflater is not None:
+                            data = inflater.decompress(data)
+                        text = text_decoder.decode(data)
+                        out.write(text)
+                        yield text
+                    tail = text_decoder.decode(inflater.flush() if inflater is not None else b'', final=True)
+                    out.write(tail)
+                    yield tail
+
+                result = parse_json_stream(chunks())
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, filename)
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+        self.write_atomic(filename + '.meta', json.dumps({'url': res.geturl(),
+                                                         'etag': res.headers.get('ETag'),
+                                                         'last_modified': res.headers.get('Last-Modified')}))
+        return result
+
+    def get(self, url, cache_ttl=86400):
+        filename = self.cache_filename(url)
+        cached = os.path.isfile(filename)
+
+        if cached and (time.time() - os.stat(filename).st_mtime) < cache_ttl:
+            try:
+                return self.read_cached(filename)
+            except Exception:
+                logger.error("cannot decode cached JSON from file: '{}'".format(filename))
+                cached = False
+
+        headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip'}
+        if cached:
+            meta = self.read_meta(filename)
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        try_count = 0
+        while (try_count < self.max_tries):
+            try_count = try_count + 1
+            error = None
+            try:
+                res = urlopen(Request(url, data=None, headers=headers), timeout=self.timeout)
+                with res:
+                    return self.download(res, filename)
+            except HTTPError as e:
+                if (e.code == 304 and cached):
+                    logger.debug("JSON from url '{}' not modified, using cached".format(url))
+                    os.utime(filename, None)
+                    return self.read_cached(filename)
+                if (e.code != 429 and e.code < 500):
+                    logger.error("cannot get JSON from url '{}': HTTP {}".format(url, e.code))
+                    break
+                error = e
+            except Exception as e:
+                logger.error("cannot get JSON from url '{}', try {}: {}".format(url, try_count, repr(e)))
+
+            if try_count < self.max_tries:
+                delay = self.retry_delay(try_count, error)
+                logger.debug("Retrying url: '{}' in {}s, try {}".format(url, round(delay, 1), try_count))
+                time.sleep(delay)
+
+        logger.error("no JSON from url '{}', tries: {}".format(url, try_count))
+        if cached:
+            # stale copy is better than nothing
+            try:
+                return self.read_cached(filename)
+            except Exception:
+                pass
+        return None
@@ -5,6 +5,7 @@ import os
 import sys
 import time
 import argparse
+import atexit
 from queue import Queue
 from urllib.request import urlopen, Request
 from urllib.error import HTTPError
@@ -27,12 +28,17 @@ import logging
 logger = logging.getLogger('autoranker')
 
 from autoranker import Autoranker, INIT_RANK
+from http_cache import JsonUrlCache
+from rate_limiter import LANE_BULK
 
 
 def get_config(args):
     config = {
-        "eth_http_node": "https://rinkeby.infura.io/v3/1474ceef2da44edbac41a2efd66ee882",
-        # "eth_http_node": "http://10.100.11.24:8545",
+        # first node is primary (transactions), all are used for reads with failover
+        "eth_http_nodes": [
+            "https://rinkeby.infura.io/v3/1474ceef2da44edbac41a2efd66ee882",
+            # "http://10.100.11.24:8545",
+        ],
 
 
         # "tcrank_address": "0x6a91ff9271406d421c75e6b6dd04fb1f7857cb30",
@@ -60,6 +66,24 @@ def get_config(args):
     with open("../../solidity/smartz/helper.abi") as json_data:
         config['helper_abi'] = json.load(json_data)
 
+    if (args.eth_nodes):
+        config['eth_http_nodes'] = [n.strip() for n in args.eth_nodes.split(',') if n.strip()]
+
+    if (args.rpc_rate):
+        config['rpc_rate'] = args.rpc_rate
+
+    if (args.metrics_file):
+        config['metrics_file'] = args.metrics_file
+
+    if (args.max_votings):
+        config['play_max_votings'] = args.max_votings
+
+    if (args.max_rpc):
+        config['play_max_rpc'] = args.max_rpc
+
+    if (args.stake_sizing):
+        config['play_stake_sizing'] = True
+
     if (args.keys_file):
         config['keys_file'] = args.keys_file.name
         config['accounts'] = json.load(args.keys_file)
@@ -95,12 +119,26 @@ def main(arguments):
 
     parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument('-k', '--keys-file', help="File with keys and addresses", type=argparse.FileType('r'))
+    parser.add_argument('--eth-nodes', action="store", type=str, help="comma separated list of Ethereum JSON-RPC nodes, first is primary")
+    parser.add_argument('--rpc-rate', action="store", type=float, help="max JSON-RPC requests per second, transactions and deadline reads are served before bulk reads")
+    parser.add_argument('--metrics-file', action="store", type=str, help="dumps RPC and transaction metrics at exit (*.json - JSON, otherwise Prometheus text format)")
     parser.add_argument('--dapp-id', action="store", type=int, help="performs operation for selected dapp id (randomplay or syncdapps)")
     parser.add_argument('--random-play', action="store_true", help="begins to push dapps randomly")
+    parser.add_argument('--max-votings', action="store", type=int, help="max number of votings played at once (randomplay)")
+    parser.add_argument('--max-rpc', action="store", type=int, help="max number of simultaneous RPC requests (randomplay)")
+    parser.add_argument('--stake-sizing', action="store_true", help="stakes with best expected profit by fee model instead of random stake (randomplay)")
+    parser.add_argument('--replay-reveals', action="store_true", help="reveals votes committed but not revealed (e.g. before crash) from commitment journal")
+    parser.add_argument('--finish-votings', action="store_true", help="finishes all votings with ended reveal phase, started by anyone")
+    parser.add_argument('--unstake', action="store_true", help="claims unlocked stakes of won votes of all accounts, when claimable amount reaches unstake_threshold CRN")
+    parser.add_argument('--watch', action="store_true", help="keeps running, repeats every keeper_interval seconds (finish-votings, unstake)")
     parser.add_argument('--generate-keys-pack', action="store_true", help="outputs pack of keypairs + eth addresses")
     parser.add_argument('--sync-dapps', action="store_true", help="begins to renew dapps in contract(if owner)")
+    parser.add_argument('--full-sync', action="store_true", help="checks all dapps against contract, not only changed since last sync (syncdapps)")
     parser.add_argument('--show-ranking', action="store_true", help="outputs ranking from contract")
+    parser.add_argument('--batched', action="store_true", help="read contract state with JSON-RPC batch requests (show-ranking)")
+    parser.add_argument('--benchmark-ranking', action="store_true", help="compares round trips and wall time of sequential and batched show-ranking")
     parser.add_argument('--ranking-history', action="store_true", help="outputs ranking history")
+    parser.add_argument('--sync-events', action="store_true", help="fetches new contract events into local event index")
     parser.add_argument('--ranking-history-output-png', type=str, action="store", help="outputs ranking history into PNG file ")
 
     args = parser.parse_args(arguments)
@@ -133,6 +171,8 @@ def main(arguments):
 
     # now create autoranker object and pass contract and account to it. Any further logic must be implemented in Autoranker class
     autoranker = Autoranker(config, dapps)
+    if (config.get('metrics_file')):
+        atexit.register(autoranker.metrics.dump, config['metrics_file'])
   
     max_rank = 0
 
@@ -155,7 +195,11 @@ def main(arguments):
 
 
     if (args.show_ranking == True):
-        autoranker.show_ranking()
+        autoranker.show_ranking(args.batched)
+        return
+
+    if (args.benchmark_ranking == True):
+        autoranker.benchmark_show_ranking()
         return
 
     single_dapp_id = int(args.dapp_id) if args.dapp_id is not None else None
@@ -164,8 +208,25 @@ def main(arguments):
         autoranker.ranking_history(single_dapp_id, output_file)
         return
 
+    if (args.sync_events == True):
+        with autoranker.rpc_limiter.lane(LANE_BULK):
+            print("New events indexed: {}".format(autoranker.get_event_index().sync()))
+        return
+
     if (args.sync_dapps == True):
-        autoranker.load_dapps_to_contract(single_dapp_id)
+        autoranker.sync_catalog(single_dapp_id, args.full_sync)
+        return
+
+    if (args.replay_reveals == True):
+        autoranker.replay_reveals()
+        return
+
+    if (args.finish_votings == True):
+        autoranker.finish_expired_votings(args.watch)
+        return
+
+    if (args.unstake == True):
+        autoranker.unstake_won_stakes(args.watch)
         return
 
     if (args.random_play == True):
@@ -188,63 +249,9 @@ def get_json_from_url(url,
     if (url is None or not isinstance(url, str)):
         logger.error("Wrong url param empty or not a string")
         return None
-    
-    md5hasher = hashlib.md5()
-    md5hasher.update(url.encode('utf-8'))
-    urlhash = md5hasher.hexdigest() # use global hasher if highloads
-
-    filename = '/tmp/' + 'autoranker_cache_json_' + urlhash
-
-    if (os.path.isfile(filename)):
-        st = os.stat(filename)
-        age = round(time.time() - st.st_mtime)
-        if (age < cache_ttl):
-            # logger.debug("file '{}' already exists, age: {} < {}, using cached".format(filename, age, cache_ttl))
-            file = open(filename, "r")
-            json_text = file.read()
-            file.close()
-            result = None
-            try:
-                result = json.loads(json_text)
-                return result
-            except:
-                logger.error("cannot decode cached JSON from file: '{}'".format(filename))
-
-    json_body = None
-    try_count = 0
-    max_tries=2
-    while (try_count <= max_tries):
-        try_count = try_count + 1
-        try:
-            req = Request(   url,
-                      data=None,
-                      headers={
-                         'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/35.0.1916.47 Safari/537.36'
-                      }
-            )
-            res = urlopen(req)
-            json_body = res.read()
-        except HTTPError as e:
-            if (e.code == 429): # too many requests
-                logger.debug("Too many requests for url: '{}', sleeping for {}s, try {}".format(url, sleep_when_429, try_count))
-                time.sleep(sleep_when_429)
-        except Exception as e:
-            logger.error("cannot get JSON from url '{}', try {}: {}".format(url, try_count, repr(e)))
-    
-    if (json_body is None):
-        logger.error("no JSON from url '{}', tries: {}".format(url, try_count))
-
-    # save cached copy
-    try:
-        result = json.loads(json_body)
-        with open(filename, 'w') as outfile:
-            json.dump(result, outfile)
-            # logger.debug("JSON contents saved to file: '{}'".format(filename))
-            return result
-    except Exception as e:
-        logger.error("cannot parse JSON from downloaded url '{}': {}".format(url, repr(e)))
-    
-    return None
+
+    # after TTL cached file is revalidated (ETag/If-Modified-Since), not downloaded again if not changed
+    return JsonUrlCache().get(url, cache_ttl)
 
 
 
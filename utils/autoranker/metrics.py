@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+from eth_utils import function_abi_to_4byte_selector
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+# seconds, from fast eth_call to slow confirmation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        result = []
+        for c in self.counts:
+            total += c
+            result.append(total)
+        return result
+
+
+class Metrics(object):
+    # Process-wide counters and latency histograms keyed by (name, labels), labels is a dict.
+    # Exported in Prometheus text format or as JSON
+
+    def __init__(self, prefix='autoranker_'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.selectors = {}
+
+    def key(self, name, labels):
+        return (name, tuple(sorted((labels or {}).items())))
+
+    def inc(self, name, labels=None, value=1):
+        with self.lock:
+            k = self.key(name, labels)
+            self.counters[k] = self.counters.get(k, 0) + value
+
+    def observe(self, name, value, labels=None):
+        with self.lock:
+            k = self.key(name, labels)
+            if k not in self.histograms:
+                self.histograms[k] = Histogram()
+            self.histograms[k].observe(value)
+
+    @contextmanager
+    def timer(self, name, labels=None):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, labels)
+
+    def add_abi(self, abi):
+        # 4-byte selectors of contract functions, to name eth_call's by contract method
+        for i in abi:
+            if i.get('type') == 'function':
+                self.selectors['0x' + function_abi_to_4byte_selector(i).hex()] = i['name']
+
+    def function_name(self, method, params):
+        if method in ('eth_call', 'eth_estimateGas') and params and isinstance(params[0], dict):
+            data = params[0].get('data') or ''
+            if not isinstance(data, str):
+                data = '0x' + bytes(data).hex()
+            return self.selectors.get(data[:10].lower(), data[:10] or 'unknown')
+        return ''
+
+    def middleware(self, make_request, web3):
+        # per method (and contract function) latency and JSON-RPC errors by code
+        def measure(method, params):
+            labels = {'method': method}
+            function = self.function_name(method, params)
+            if function:
+                labels['function'] = function
+            start = time.time()
+            try:
+                response = make_request(method, params)
+            except Exception as e:
+                self.inc('rpc_errors_total', dict(labels, code='exception', error=type(e).__name__))
+                raise
+            finally:
+                self.observe('rpc_duration_seconds', time.time() - start, labels)
+            if isinstance(response, dict) and response.get('error'):
+                error = response['error']
+                code = error.get('code') if isinstance(error, dict) else None
+                self.inc('rpc_errors_total', dict(labels, code=str(code)))
+            return response
+        return measure
+
+    def prometheus_labels(self, labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for (k, v) in items) + '}'
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            for name in sorted(set(k[0] for k in self.counters)):
+                lines.append("# TYPE {}{} counter".format(self.prefix, name))
+                for (n, labels), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append("{}{}{} {}".format(self.prefix, name, self.prometheus_labels(labels), value))
+            for name in sorted(set(k[0] for k in self.histograms)):
+                lines.append("# TYPE {}{} histogram".format(self.prefix, name))
+                for (n, labels), h in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    for bound, count in zip(h.buckets, h.cumulative()):
+                        lines.append("{}{}_bucket{} {}".format(self.prefix, name, self.prometheus_labels(labels, [('le', bound)]), count))
+                    lines.append("{}{}_bucket{} {}".format(self.prefix, name, self.prometheus_labels(labels, [('le', '+Inf')]), h.count))
+                    lines.append("{}{}_sum{} {}".format(self.prefix, name, self.prometheus_labels(labels), round(h.sum, 6)))
+                    lines.append("{}{}_count{} {}".format(self.prefix, name, self.prometheus_labels(labels), h.count))
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self):
+        with self.lock:
+            return {'counters': [{'name': n, 'labels': dict(labels), 'value': v}
+                                 for (n, labels), v in sorted(self.counters.items())],
+                    'histograms': [{'name': n, 'labels': dict(labels), 'count': h.count, 'sum': round(h.sum, 6),
+                                    'avg': round(h.sum / h.count, 6) if h.count else 0,
+                                    'buckets': dict(zip([str(b) for b in h.buckets], h.cumulative()))}
+                                   for (n, labels), h in sorted(self.histograms.items())]}
+
+    def dump(self, path):
+        # *.json - JSON, otherwise Prometheus text format (for node_exporter textfile collector)
+        data = json.dumps(self.to_json(), indent=4) if path.endswith('.json') else self.to_prometheus()
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        logger.debug("Metrics saved to '{}'".format(path))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import threading
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+# substrings of node errors meaning that our local nonce sequence is out of sync with the node
+NONCE_ERRORS = ('nonce too low', 'nonce is too low', 'invalid nonce', 'nonce too high')
+
+# node has other transaction with the same nonce and its price is not bumped enough to replace it
+UNDERPRICED_ERRORS = ('replacement transaction underpriced',)
+
+# same signed transaction is already in node's mempool (-32000 "already processing")
+KNOWN_TX_ERRORS = ('known transaction', 'already known', 'already processing', 'already imported')
+
+
+def rpc_error_message(e):
+    if e.args and isinstance(e.args[0], dict):
+        return str(e.args[0].get('message', '')).lower()
+    return str(e).lower()
+
+
+def is_nonce_error(e):
+    message = rpc_error_message(e)
+    return any(err in message for err in NONCE_ERRORS)
+
+
+def is_underpriced_error(e):
+    message = rpc_error_message(e)
+    return any(err in message for err in UNDERPRICED_ERRORS)
+
+
+def is_known_tx_error(e):
+    message = rpc_error_message(e)
+    return any(err in message for err in KNOWN_TX_ERRORS)
+
+
+class NonceManager(object):
+    # Hands out nonces locally, one counter per sender address.
+    # Node is asked only on first use of address and on resync (after nonce errors or failed broadcast),
+    # so independent transactions can be signed and sent back-to-back without waiting for receipts
+
+    def __init__(self, web3):
+        self.web3 = web3
+        self.lock = threading.Lock()
+        self.nonces = {}
+
+    def fetch(self, address):
+        # 'pending' includes our own transactions that are still in mempool
+        return self.web3.eth.getTransactionCount(address, 'pending')
+
+    def sync(self, address):
+        with self.lock:
+            self.nonces[address] = self.fetch(address)
+            logger.debug("Nonce for {} synced from node: {}".format(address, self.nonces[address]))
+            return self.nonces[address]
+
+    def allocate(self, address):
+        with self.lock:
+            if self.nonces.get(address) is None:
+                self.nonces[address] = self.fetch(address)
+            nonce = self.nonces[address]
+            self.nonces[address] = nonce + 1
+            return nonce
+
+    def release(self, address, nonce):
+        # transaction with allocated nonce was never broadcasted. If it was the last allocated nonce
+        # we can reuse it, otherwise there is a gap now and we need to ask the node
+        with self.lock:
+            if self.nonces.get(address) == nonce + 1:
+                self.nonces[address] = nonce
+                return
+        self.sync(address)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import time
+import random
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from receipt_tracker import ReceiptTimeout
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+class PlayEngine(object):
+    # Runs many voting lifecycles (commit -> reveal -> finish) of Autoranker at once.
+    # Each lifecycle is a coroutine that sleeps until its phase boundary, web3 calls are blocking,
+    # so they are executed in a thread pool, number of simultaneous RPC requests is capped by semaphore.
+    # Every lifecycle votes from the least busy account of keys pack, so votings are spread over
+    # accounts and their independent nonce streams
+
+    def __init__(self, autoranker, max_votings=200, max_rpc=16, phase_margin=2, retry_interval=3):
+        self.autoranker = autoranker
+        self.max_votings = max_votings
+        self.max_rpc = max_rpc
+        # seconds added to phase boundary, node's block timestamp and our clock are not the same
+        self.phase_margin = phase_margin
+        self.retry_interval = retry_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_rpc)
+        self.rpc_semaphore = None
+        self.active = set()
+        self.account_load = dict((a['address'], 0) for a in autoranker.config['accounts'])
+        self.stats = {'started': 0, 'completed': 0, 'failed': 0}
+
+    async def rpc(self, func, *args):
+        async with self.rpc_semaphore:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def sleep_until(self, ts):
+        delay = ts - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def confirm(self, tx_hashes, timeout=600):
+        # receipts come from shared block-driven tracker, no polling per lifecycle
+        tracker = self.autoranker.receipt_tracker
+        futures = [(tx_hash, tracker.track(tx_hash, timeout=timeout)) for tx_hash in tx_hashes]
+        receipts = {}
+        for tx_hash, future in futures:
+            try:
+                receipts[tx_hash] = await asyncio.wrap_future(future)
+            except ReceiptTimeout as e:
+                logger.error(repr(e))
+                receipts[tx_hash] = None
+        return receipts
+
+    async def phase_boundary(self, dapp_id, action, voting):
+        # voteReveal is allowed after commit phase, finishVoting after reveal phase
+        # v[4] - start, v[2] - commit phase length, v[3] - reveal phase length
+        if voting is None:
+            dapp = await self.rpc(self.autoranker.get_dapp_from_contract, dapp_id)
+            voting = dapp.get('voting') if dapp is not None else None
+            if voting is None:
+                return None, None
+        if action == 'voteReveal':
+            return voting, voting[4] + voting[2] + self.phase_margin
+        if action == 'finishVoting':
+            return voting, voting[4] + voting[2] + voting[3] + self.phase_margin
+        return voting, 0
+
+    async def lifecycle(self, dapp_id, account):
+        ar = self.autoranker
+        dapp = await self.rpc(ar.get_dapp_from_contract, dapp_id)
+        if dapp is None:
+            print("DApp [{}], not found in contract, skip".format(dapp_id))
+            return False
+
+        current_ts = int(time.time())
+        push_params = await self.rpc(ar.get_random_push_params, dapp['id'], current_ts, account, dapp)
+        actions = await self.rpc(ar.plan_actions, dapp, push_params, current_ts)
+        voting = dapp.get('voting')
+
+        in_flight = []
+        for a in actions:
+            if a['action'] in ('voteReveal', 'finishVoting'):
+                voting, boundary = await self.phase_boundary(dapp_id, a['action'], voting)
+                if voting is None:
+                    print("DApp [{}], error, no voting found before '{}' action".format(dapp_id, a['action']))
+                    return False
+                await self.sleep_until(boundary)
+
+            tx = await self.rpc(ar.build_action_tx, a)
+            if tx is None:
+                print("DApp [{}]. Error: unknown action '{}'".format(dapp_id, a['action']))
+                continue
+            try:
+                a['tx_hash'] = await self.rpc(ar.send_action, a, tx)
+            except Exception as e:
+                print("DApp [{}], error calling {}() function: {}".format(dapp_id, a['action'], repr(e)))
+                return False
+            print("DApp [{}], transaction {}() sent. tx_hash: {}".format(dapp_id, a['action'], a['tx_hash']))
+            in_flight.append(a)
+
+            if a.get('pipeline'):
+                continue
+
+            receipts = await self.confirm([x['tx_hash'] for x in in_flight])
+            for x in in_flight:
+                ar.action_done(x, receipts.get(x['tx_hash']))
+            failed = [x for x in in_flight
+                      if receipts.get(x['tx_hash']) is None or receipts[x['tx_hash']].get('status', 1) == 0]
+            in_flight = []
+            if failed:
+                print("DApp [{}], error, transactions ({}) were not executed, breakin action queue"
+                      .format(dapp_id, ', '.join(x['action'] for x in failed)))
+                return False
+
+        return True
+
+    def acquire_account(self):
+        load = min(self.account_load.values())
+        address = random.choice([a for a in self.account_load if self.account_load[a] == load])
+        self.account_load[address] += 1
+        return next(a for a in self.autoranker.config['accounts'] if a['address'] == address)
+
+    def release_account(self, account):
+        self.account_load[account['address']] -= 1
+
+    async def run_lifecycle(self, dapp_id, slots):
+        self.stats['started'] += 1
+        account = self.acquire_account()
+        try:
+            if await self.lifecycle(dapp_id, account):
+                self.stats['completed'] += 1
+            else:
+                self.stats['failed'] += 1
+        except Exception as e:
+            self.stats['failed'] += 1
+            logger.exception("DApp [{}], lifecycle failed: {}".format(dapp_id, repr(e)))
+        finally:
+            self.release_account(account)
+            self.active.discard(dapp_id)
+            slots.release()
+
+    async def play(self, dapp_ids, n_dapps):
+        self.rpc_semaphore = asyncio.Semaphore(self.max_rpc)
+        slots = asyncio.Semaphore(self.max_votings)
+        tasks = []
+        n = 0
+        while n < n_dapps:
+            await slots.acquire()
+            # one voting lifecycle per item at a time
+            candidates = [d for d in dapp_ids if d not in self.active]
+            if not candidates:
+                slots.release()
+                await asyncio.sleep(self.retry_interval)
+                continue
+            n += 1
+            chosen_id = random.choice(candidates)
+            self.active.add(chosen_id)
+            tasks.append(asyncio.ensure_future(self.run_lifecycle(chosen_id, slots)))
+
+        await asyncio.gather(*tasks)
+
+    def run(self, dapp_ids, n_dapps):
+        start = time.time()
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.play(dapp_ids, n_dapps))
+        finally:
+            loop.close()
+            self.executor.shutdown(wait=False)
+        print("Play finished in {}s, votings: {}, view cache: {}, RPC lanes: {}"
+              .format(round(time.time() - start), repr(self.stats), repr(self.autoranker.view_cache.stats()), repr(self.autoranker.rpc_limiter.stats())))
+        return self.stats
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+from functools import reduce
+from math import gcd
+
+import numpy as np
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+# ranks, distances and speeds are kept as int64 fixed-point numbers with 1 unit = RANK_SCALE wei
+# (1e-9 token), so 9.2e9 tokens fit into int64 and no float division by 1e18 is needed.
+# Unit is lowered to the largest divisor of RANK_SCALE all values are multiple of, so values are exact,
+# if they do not fit into int64 in that unit Python ints (object arrays) are used
+RANK_SCALE = 10 ** 9
+INT64_LIMIT = 2 ** 62
+
+# max number of (moving x timestamp) cells evaluated at once
+MAX_CELLS = 4 * 1024 * 1024
+
+
+class RankTrajectories(object):
+    # Struct-of-arrays storage of all movings and vectorized evaluation of Ranking.getRankForTimestamp:
+    #   rank(t) = lastRank + sum over movings of (direction ? +1 : -1) * min((t - start) * speed, distance)
+    # Removed movings are already added into item's lastRank by contract, for history they are
+    # subtracted back from lastRank to get base rank, and then evaluated as usual movings
+
+    def __init__(self, scale=RANK_SCALE):
+        # scale - largest unit in wei, actual one is chosen by load()
+        self.max_scale = scale
+        self.scale = scale
+        self.dtype = np.int64
+        self.item_ids = np.zeros(0, dtype=np.int64)
+        self.moving_item = np.zeros(0, dtype=np.int64)
+        self.start = np.zeros(0, dtype=np.int64)
+        self.speed = np.zeros(0, dtype=np.int64)
+        self.distance = np.zeros(0, dtype=np.int64)
+        self.direction = np.zeros(0, dtype=np.int8)
+        self.finish_offset = np.zeros(0, dtype=np.int64)
+        self.base_rank = np.zeros(0, dtype=np.int64)
+
+    def to_fixed(self, wei):
+        # exact, wei is multiple of scale
+        return int(wei) // self.scale
+
+    def fixed_array(self, values):
+        return np.array([self.to_fixed(v) for v in values], dtype=self.dtype)
+
+    def load(self, movings, last_ranks, removed_ids=()):
+        # movings - MovingStarted event args, last_ranks - {item_id: lastRank from getItem() in wei},
+        # removed_ids - ids of movings with MovingRemoved event
+        removed_ids = set(int(m) for m in removed_ids)
+        movings = [m for m in movings if int(m['speed']) != 0 and int(m['distance']) != 0]
+        movings.sort(key=lambda m: (int(m['itemId']), int(m['startTime'])))
+
+        n = len(movings)
+        self.moving_item = np.fromiter((int(m['itemId']) for m in movings), dtype=np.int64, count=n)
+        self.start = np.fromiter((int(m['startTime']) for m in movings), dtype=np.int64, count=n)
+        self.direction = np.fromiter((1 if int(m['direction']) != 0 else 0 for m in movings), dtype=np.int8, count=n)
+        # exact in wei: moving is finished when (t - start) * speed >= distance, i.e. t - start >= ceil(distance / speed)
+        self.finish_offset = np.fromiter((min(-(-int(m['distance']) // int(m['speed'])), INT64_LIMIT) for m in movings), dtype=np.int64, count=n)
+
+        self.item_ids = np.array(sorted(set(int(i) for i in last_ranks) | set(self.moving_item.tolist())), dtype=np.int64)
+        base = {}
+        for item_id in self.item_ids.tolist():
+            base[item_id] = int(last_ranks.get(item_id, last_ranks.get(str(item_id), 0)))
+        for m in movings:
+            if int(m['movingId']) in removed_ids:
+                signed = int(m['distance']) if int(m['direction']) != 0 else -int(m['distance'])
+                base[int(m['itemId'])] -= signed
+
+        speeds = [int(m['speed']) for m in movings]
+        distances = [int(m['distance']) for m in movings]
+        base_ranks = [base[i] for i in self.item_ids.tolist()]
+        self.scale = reduce(gcd, speeds + distances + base_ranks, self.max_scale)
+        # evaluated cell is at most distance + speed (elapsed is clamped to finish_offset), rank of item
+        # is at most |base rank| + sum of its distances
+        totals = dict((i, abs(base[i])) for i in base)
+        for m in movings:
+            totals[int(m['itemId'])] += int(m['distance'])
+        bound = max([d + s for (d, s) in zip(distances, speeds)] + list(totals.values()) + [0]) // self.scale
+        self.dtype = np.int64 if bound < INT64_LIMIT else object
+        if self.scale != self.max_scale or self.dtype is object:
+            logger.debug("Rank trajectories unit: {} wei, {}".format(self.scale, 'int64' if self.dtype is np.int64 else 'Python ints'))
+
+        self.speed = self.fixed_array(speeds)
+        self.distance = self.fixed_array(distances)
+        self.base_rank = self.fixed_array(base_ranks)
+        return self
+
+    def time_range(self):
+        if len(self.start) == 0:
+            return None, None
+        return int(self.start.min()), int((self.start + self.finish_offset).max())
+
+    def evaluate(self, grid):
+        # returns (len(item_ids), len(grid)) array of fixed-point ranks (in `scale` wei units) for every
+        # item at every timestamp, int64 or object array of Python ints (see load())
+        grid = np.asarray(grid, dtype=np.int64)
+        ranks = np.repeat(self.base_rank[:, None], len(grid), axis=1)
+        if len(self.start) == 0 or len(grid) == 0:
+            return ranks
+
+        # movings are sorted by item, so sums per item are reduceat over contiguous row blocks
+        item_rows = np.searchsorted(self.item_ids, self.moving_item)
+        block_starts = np.flatnonzero(np.r_[True, item_rows[1:] != item_rows[:-1]])
+        block_items = item_rows[block_starts]
+        sign = np.where(self.direction != 0, 1, -1).astype(np.int64)
+
+        step = max(1, MAX_CELLS // len(self.start))
+        for offset in range(0, len(grid), step):
+            t = grid[offset:offset + step]
+            # clamped to finish offset, so elapsed * speed does not overflow for finished movings
+            elapsed = np.minimum(np.clip(t[None, :] - self.start[:, None], 0, None), self.finish_offset[:, None])
+            moved = np.where(elapsed >= self.finish_offset[:, None],
+                             self.distance[:, None],
+                             elapsed * self.speed[:, None])
+            moved *= sign[:, None]
+            ranks[block_items, offset:offset + step] += np.add.reduceat(moved, block_starts, axis=0)
+
+        return ranks
+
+    def to_tokens(self, ranks):
+        return np.asarray(ranks, dtype=np.float64) / float(10 ** 18 // self.scale)
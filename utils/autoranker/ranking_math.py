@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+# Python ports of Ranking.sol view math, all values are integers in wei like in contract
+
+
+def moved_distance(moving, timestamp):
+    # contract reverts on timestamp < startTime (SafeMath sub), here moving is just not started yet
+    elapsed = max(int(timestamp) - int(moving['start']), 0)
+    moved = elapsed * int(moving['speed'])
+    if moved >= int(moving['distance']):
+        return int(moving['distance'])
+    return moved
+
+
+def get_rank_for_timestamp(last_rank, movings, timestamp):
+    # Ranking.getRankForTimestamp(): lastRank + all active movings of item at timestamp
+    rank = int(last_rank)
+    for moving in movings:
+        if int(moving['direction']) != 0:
+            rank += moved_distance(moving, timestamp)
+        else:
+            rank -= moved_distance(moving, timestamp)
+    return rank
+
+
+def unstake_amount(stake, unstaked, moving, timestamp):
+    # Ranking.unstake(): tokens sent to winner for one moving, stake unlocks linearly with moved distance
+    stake = int(stake)
+    unstaked = int(unstaked)
+    if stake <= unstaked:
+        return 0
+    moved = moved_distance(moving, timestamp)
+    if moved >= int(moving['distance']):
+        return stake - unstaked
+    for_unstake = stake * moved // int(moving['distance'])
+    return max(for_unstake - unstaked, 0)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+from ranking_math import get_rank_for_timestamp
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+MIRROR_EVENTS = ('VotingStarted', 'VotingFinished', 'MovingStarted', 'MovingRemoved')
+
+
+class RankingMirror(object):
+    # Local materialized view of items (lastRank, active movings, current voting) kept current
+    # from indexed contract events. Items are read from contract only once (bootstrap), pinned to
+    # the block of event index checkpoint, after that every refresh applies only new events.
+    # Note: newItemsWithRanks() and setItemLastRank() emit no events, new items are bootstrapped
+    # when their ids are passed to refresh(), changed lastRank is picked up only by forget()
+
+    def __init__(self, tcrank, batch_caller, event_index):
+        self.tcrank = tcrank
+        self.batch_caller = batch_caller
+        self.event_index = event_index
+        self.items = {}
+        # ids checked and not found in contract, not rechecked on every refresh
+        self.absent = set()
+        self.block = None
+
+    def bootstrap(self, item_ids, block):
+        item_ids = [int(i) for i in item_ids]
+        items = self.batch_caller.call_many(self.tcrank, 'getItem', [[i] for i in item_ids], block)
+
+        moving_ids = []
+        for item_id, item in zip(item_ids, items):
+            if item is None:
+                self.absent.add(item_id)
+                continue
+            moving_ids += list(item[4])
+        movings = dict(zip(moving_ids, self.batch_caller.call_many(self.tcrank, 'getMoving', [[m] for m in moving_ids], block)))
+
+        for item_id, item in zip(item_ids, items):
+            if item is None:
+                continue
+            self.items[item_id] = {'last_rank': item[1],
+                                   'voting_id': item[3],
+                                   'movings': {}}
+            for moving_id in item[4]:
+                m = movings.get(moving_id)
+                if m is not None:
+                    self.items[item_id]['movings'][moving_id] = {'start': m[0], 'speed': m[1], 'distance': m[2], 'direction': m[3]}
+
+        logger.debug("Ranking mirror bootstrapped {} items at block {}".format(len(item_ids), block))
+
+    def apply(self, event):
+        # returns False for event of not bootstrapped item
+        args = event['args']
+        item = self.items.get(int(args.get('itemId', args.get('_itemId'))))
+        if item is None:
+            return False
+
+        if event['event'] == 'VotingStarted':
+            item['voting_id'] = args['votingId']
+        elif event['event'] == 'VotingFinished':
+            item['voting_id'] = 0
+        elif event['event'] == 'MovingStarted':
+            item['movings'][args['movingId']] = {'start': args['startTime'],
+                                                 'speed': args['speed'],
+                                                 'distance': args['distance'],
+                                                 'direction': args['direction']}
+        elif event['event'] == 'MovingRemoved':
+            # contract moves finished distance into lastRank (removeOldMovings)
+            m = item['movings'].pop(args['movingId'], None)
+            if m is not None:
+                item['last_rank'] += m['distance'] if int(m['direction']) != 0 else -m['distance']
+        return True
+
+    def refresh(self, item_ids=()):
+        # costs O(new events) + one batched read for never seen items
+        self.event_index.sync()
+        (checkpoint, _) = self.event_index.checkpoint()
+
+        if self.block is not None and checkpoint < self.block:
+            # event index was rewound after reorg, state of known items may include orphaned events
+            item_ids = list(item_ids) + list(self.items)
+            self.forget()
+        elif self.block is not None and checkpoint > self.block:
+            item_ids = list(item_ids)
+            for event in self.event_index.get_events(MIRROR_EVENTS, from_block=self.block + 1):
+                if not self.apply(event):
+                    # item appeared in contract after we saw it absent
+                    item_id = int(event['args'].get('itemId', event['args'].get('_itemId')))
+                    self.absent.discard(item_id)
+                    item_ids.append(item_id)
+
+        unknown = sorted(set(int(i) for i in item_ids if int(i) not in self.items and int(i) not in self.absent))
+        if unknown:
+            # read at checkpoint block, so state already includes all indexed events
+            self.bootstrap(unknown, checkpoint)
+
+        self.block = checkpoint
+        return self.block
+
+    def forget(self, item_ids=None):
+        if item_ids is None:
+            self.items = {}
+            self.absent = set()
+            return
+        for i in item_ids:
+            self.items.pop(int(i), None)
+            self.absent.discard(int(i))
+
+    def get_rank(self, item_id, timestamp):
+        item = self.items[int(item_id)]
+        return get_rank_for_timestamp(item['last_rank'], item['movings'].values(), timestamp)
+
+    def current_ranks(self, timestamp):
+        return dict((item_id, self.get_rank(item_id, timestamp)) for item_id in self.items)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+# lower lane is served first
+LANE_TX = 0        # transaction broadcast
+LANE_DEADLINE = 1  # reads gating phase deadlines (voting state, receipts, nonces)
+LANE_BULK = 2      # ranking tables, history, logs, catalog sync
+LANE_NAMES = {LANE_TX: 'tx', LANE_DEADLINE: 'deadline', LANE_BULK: 'bulk'}
+
+
+class RateLimiter(object):
+    # Token bucket shared by all JSON-RPC calls of the process: `rate` tokens per second, up to `burst`
+    # tokens saved up. Waiting calls are served strictly by lane, then in arrival order, so bulk reads
+    # can not delay transaction sends or deadline reads. A call costs one token per request
+    # (batch of N requests costs N). Lane of a call is taken from lane() context of calling thread.
+    # rate=None disables limiting, queue metrics are still collected
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate or 1, 1)
+        self.tokens = self.burst
+        self.updated = time.time()
+        self.cond = threading.Condition()
+        self.waiting = []
+        self.seq = itertools.count()
+        self.local = threading.local()
+        self.lanes = dict((lane, {'depth': 0, 'max_depth': 0, 'granted': 0, 'tokens': 0, 'wait_time': 0.0})
+                          for lane in LANE_NAMES)
+
+    @contextmanager
+    def lane(self, lane):
+        prev = getattr(self.local, 'lane', None)
+        self.local.lane = lane
+        try:
+            yield
+        finally:
+            self.local.lane = prev
+
+    def current_lane(self, default=LANE_DEADLINE):
+        lane = getattr(self.local, 'lane', None)
+        return default if lane is None else lane
+
+    def refill(self):
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, cost=1, lane=None):
+        lane = self.current_lane() if lane is None else lane
+        start = time.time()
+        with self.cond:
+            stats = self.lanes[lane]
+            if self.rate:
+                # request bigger than bucket waits for full bucket
+                cost = min(cost, self.burst)
+                entry = (lane, next(self.seq))
+                heapq.heappush(self.waiting, entry)
+                stats['depth'] += 1
+                stats['max_depth'] = max(stats['max_depth'], stats['depth'])
+                # waiter with higher priority may become first in queue
+                self.cond.notify_all()
+                try:
+                    while True:
+                        self.refill()
+                        if self.waiting[0] is entry:
+                            if self.tokens >= cost:
+                                self.tokens -= cost
+                                break
+                            self.cond.wait((cost - self.tokens) / self.rate)
+                        else:
+                            self.cond.wait()
+                finally:
+                    self.waiting.remove(entry)
+                    heapq.heapify(self.waiting)
+                    stats['depth'] -= 1
+                    self.cond.notify_all()
+            stats['granted'] += 1
+            stats['tokens'] += cost
+            stats['wait_time'] += time.time() - start
+
+    def stats(self):
+        with self.cond:
+            return dict((LANE_NAMES[lane], {'depth': s['depth'],
+                                            'max_depth': s['max_depth'],
+                                            'granted': s['granted'],
+                                            'tokens': s['tokens'],
+                                            'avg_wait': round(s['wait_time'] / s['granted'], 3) if s['granted'] else 0})
+                        for (lane, s) in self.lanes.items())
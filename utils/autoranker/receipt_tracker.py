@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import time
+import threading
+from concurrent.futures import Future
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+def hash_key(web3, tx_hash):
+    # lowercase hex string of hash given as hex string or bytes (toHex of web3 4 rejects str)
+    if isinstance(tx_hash, str):
+        return tx_hash.lower()
+    return web3.toHex(tx_hash).lower()
+
+
+class ReceiptTimeout(Exception):
+    pass
+
+
+class ReceiptTracker(object):
+    # Shared confirmation tracker: one background thread watches new blocks and resolves futures of
+    # all pending transactions from block transaction lists. Receipt is requested only for our
+    # transactions found in block, so polling costs O(blocks), not O(pending txs * poll rate).
+    # Future is resolved with receipt when transaction has `confirmations` blocks on top of it.
+    # On timeout on_timeout(tx_hash) callback is called, if it returns new timeout in seconds
+    # transaction stays tracked, otherwise future fails with ReceiptTimeout.
+    # Same-nonce replacement is tracked under the same future (see replace()), whichever is mined resolves it
+
+    def __init__(self, web3, confirmations=0, poll_interval=2, timeout=600):
+        self.web3 = web3
+        self.confirmations = confirmations
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.last_block = None
+        self.thread = None
+        self.stopped = False
+        self.stats = {'blocks': 0, 'receipts': 0, 'resolved': 0, 'timeouts': 0}
+
+    def track(self, tx_hash, confirmations=None, timeout=None, on_timeout=None, check_mined=True):
+        # register transaction before broadcasting it with check_mined=False, otherwise it may be
+        # mined in a block processed before registration, then its receipt is requested once
+        tx_hash = hash_key(self.web3, tx_hash)
+        with self.lock:
+            entry = self.pending.get(tx_hash)
+            if entry is None:
+                entry = {'future': Future(),
+                         'confirmations': self.confirmations if confirmations is None else confirmations,
+                         'deadline': time.time() + (self.timeout if timeout is None else timeout),
+                         'on_timeout': on_timeout,
+                         'receipt': None,
+                         'checked': not check_mined,
+                         'hashes': [tx_hash]}
+                self.pending[tx_hash] = entry
+            else:
+                if timeout is not None:
+                    # waiter can not postpone earlier timeout callback (e.g. stuck transaction replacement)
+                    entry['deadline'] = min(entry['deadline'], time.time() + timeout) if entry['on_timeout'] else time.time() + timeout
+                if on_timeout is not None:
+                    entry['on_timeout'] = on_timeout
+            self.start()
+            return entry['future']
+
+    def untrack(self, tx_hash):
+        # transaction was not broadcasted
+        with self.lock:
+            entry = self.pending.pop(hash_key(self.web3, tx_hash), None)
+            if entry is not None:
+                entry['hashes'].remove(hash_key(self.web3, tx_hash))
+        if entry is not None and not entry['hashes']:
+            entry['future'].cancel()
+
+    def replace(self, tx_hash, new_tx_hash):
+        # new_tx_hash replaces tx_hash (same nonce), both are watched until one of them is mined
+        new_tx_hash = hash_key(self.web3, new_tx_hash)
+        with self.lock:
+            entry = self.pending.get(hash_key(self.web3, tx_hash))
+            if entry is None:
+                return None
+            entry['hashes'].append(new_tx_hash)
+            self.pending[new_tx_hash] = entry
+            return entry['future']
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stopped = False
+            self.thread = threading.Thread(target=self.run, name='receipt-tracker', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+
+    def fetch_receipt(self, tx_hash, entry):
+        self.stats['receipts'] += 1
+        receipt = self.web3.eth.getTransactionReceipt(tx_hash)
+        if receipt is not None and receipt.get('blockNumber') is not None:
+            entry['receipt'] = receipt
+
+    def poll(self):
+        head = self.web3.eth.blockNumber
+        with self.lock:
+            pending = dict(self.pending)
+
+        if not pending:
+            self.last_block = head
+            return
+
+        # replaced transactions share one entry
+        entries = dict((id(entry), (tx_hash, entry)) for (tx_hash, entry) in pending.items())
+        for tx_hash, entry in entries.values():
+            if not entry['checked']:
+                entry['checked'] = True
+                for h in entry['hashes']:
+                    if entry['receipt'] is None:
+                        self.fetch_receipt(h, entry)
+
+        first = head if self.last_block is None else self.last_block + 1
+        for block_number in range(first, head + 1):
+            block = self.web3.eth.getBlock(block_number)
+            self.stats['blocks'] += 1
+            if block is None:
+                break
+            for tx in block['transactions']:
+                tx_hash = hash_key(self.web3, tx)
+                entry = pending.get(tx_hash)
+                if entry is not None and entry['receipt'] is None:
+                    self.fetch_receipt(tx_hash, entry)
+            self.last_block = block_number
+
+        now = time.time()
+        for tx_hash, entry in entries.values():
+            receipt = entry['receipt']
+            if receipt is not None and head - receipt['blockNumber'] >= entry['confirmations']:
+                if entry['confirmations'] > 0:
+                    # receipt block may be orphaned while we were waiting for confirmations
+                    block = self.web3.eth.getBlock(receipt['blockNumber'])
+                    if block is None or block['hash'] != receipt['blockHash']:
+                        entry['receipt'] = None
+                        entry['checked'] = False
+                        continue
+                self.resolve(tx_hash, receipt)
+            elif now > entry['deadline']:
+                self.expire(tx_hash, entry)
+
+    def resolve(self, tx_hash, receipt):
+        with self.lock:
+            entry = self.pending.pop(tx_hash, None)
+            for h in (entry['hashes'] if entry is not None else []):
+                self.pending.pop(h, None)
+        if entry is not None:
+            self.stats['resolved'] += 1
+            entry['future'].set_result(receipt)
+
+    def expire(self, tx_hash, entry):
+        extend = None
+        if entry['on_timeout'] is not None:
+            try:
+                extend = entry['on_timeout'](tx_hash)
+            except Exception as e:
+                logger.error("Timeout callback for transaction {} failed: {}".format(tx_hash, repr(e)))
+        if extend:
+            entry['deadline'] = time.time() + extend
+            return
+        with self.lock:
+            for h in entry['hashes']:
+                self.pending.pop(h, None)
+        self.stats['timeouts'] += 1
+        entry['future'].set_exception(ReceiptTimeout("No receipt for transaction {}".format(tx_hash)))
+
+    def run(self):
+        while not self.stopped:
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error("Receipt tracker poll failed: {}".format(repr(e)))
+            time.sleep(self.poll_interval)
+
+    def wait(self, tx_hashes, timeout=None):
+        # returns {tx_hash: receipt or None}
+        futures = dict((tx_hash, self.track(tx_hash, timeout=timeout)) for tx_hash in tx_hashes)
+        receipts = {}
+        for tx_hash, future in futures.items():
+            try:
+                receipts[tx_hash] = future.result()
+            except ReceiptTimeout as e:
+                logger.error(repr(e))
+                receipts[tx_hash] = None
+        return receipts
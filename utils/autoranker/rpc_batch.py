@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import time
+import itertools
+
+from eth_abi import decode_abi
+from hexbytes import HexBytes
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+DEFAULT_BATCH_SIZE = 100
+
+
+class RpcCounter(object):
+    # web3 middleware counting every JSON-RPC round trip made through the provider
+
+    def __init__(self):
+        self.requests = 0
+        self.by_method = {}
+
+    def reset(self):
+        self.requests = 0
+        self.by_method = {}
+
+    def middleware(self, make_request, web3):
+        def count_requests(method, params):
+            self.requests += 1
+            self.by_method[method] = self.by_method.get(method, 0) + 1
+            return make_request(method, params)
+        return count_requests
+
+
+class BatchCaller(object):
+    # Packs many eth_call's into JSON-RPC batch requests (one HTTP round trip per batch)
+    # all calls of one snapshot are pinned to the same block to get consistent state.
+    # Requests are sent through FailoverHTTPProvider, sharing its session pool and endpoint failover
+
+    def __init__(self, provider, batch_size=DEFAULT_BATCH_SIZE, metrics=None):
+        self.provider = provider
+        self.batch_size = batch_size
+        self.metrics = metrics
+        self.round_trips = 0
+        self.ids = itertools.count(1)
+
+    def fn_abi(self, contract, fn_name):
+        for i in contract.abi:
+            if i.get('type') == 'function' and i.get('name') == fn_name:
+                return i
+        raise KeyError("No abi for function '{}' was found in contract abi".format(fn_name))
+
+    def post(self, payload):
+        self.round_trips += 1
+        return self.provider.post(payload)
+
+    def block_number(self):
+        res = self.post({'jsonrpc': '2.0', 'id': next(self.ids), 'method': 'eth_blockNumber', 'params': []})
+        return int(res['result'], 16)
+
+    def call_many(self, contract, fn_name, args_list, block='latest'):
+        # returns list of decoded outputs in same order as args_list, None for reverted/empty calls
+        return self.call_each(contract, [(fn_name, args) for args in args_list], block)
+
+    def call_each(self, contract, calls, block='latest'):
+        # calls of different functions, [(fn_name, args)], batched together
+        output_types = {}
+        for (fn_name, args) in calls:
+            if fn_name not in output_types:
+                output_types[fn_name] = [o['type'] for o in self.fn_abi(contract, fn_name)['outputs']]
+        block_id = hex(block) if isinstance(block, int) else block
+
+        results = [None] * len(calls)
+        for offset in range(0, len(calls), self.batch_size):
+            chunk = calls[offset:offset + self.batch_size]
+            payload = []
+            req_index = {}
+            for n, (fn_name, args) in enumerate(chunk):
+                req_id = next(self.ids)
+                req_index[req_id] = offset + n
+                payload.append({'jsonrpc': '2.0',
+                                'id': req_id,
+                                'method': 'eth_call',
+                                'params': [{'to': contract.address,
+                                            'data': contract.encodeABI(fn_name=fn_name, args=list(args))},
+                                           block_id]})
+            # batch is labeled by its first function
+            fn_name = chunk[0][0]
+            start = time.time()
+            response = self.post(payload)
+            if self.metrics is not None:
+                # batches bypass web3 middlewares
+                self.metrics.observe('rpc_duration_seconds', time.time() - start, {'method': 'eth_call_batch', 'function': fn_name})
+                self.metrics.inc('rpc_batched_calls_total', {'function': fn_name}, len(payload))
+            if isinstance(response, dict):
+                # node does not support batches or rejected whole batch
+                raise ValueError("Batch request rejected by {}: {}".format(self.provider, response.get('error')))
+
+            for r in response:
+                i = req_index.get(r.get('id'))
+                if i is None:
+                    continue
+                (fn_name, args) = calls[i]
+                if r.get('error') is not None:
+                    if self.metrics is not None:
+                        self.metrics.inc('rpc_errors_total', {'method': 'eth_call_batch', 'function': fn_name, 'code': str(r['error'].get('code'))})
+                    logger.debug("{}({}) failed in batch: {}".format(fn_name, args, r['error']))
+                    continue
+                data = HexBytes(r.get('result') or '0x')
+                if len(data) == 0:
+                    # same as BadFunctionCallOutput for single call (reverted on onlyExist... modifiers)
+                    continue
+                decoded = decode_abi(output_types[fn_name], data)
+                results[i] = decoded[0] if len(output_types[fn_name]) == 1 else list(decoded)
+
+        return results
@@ -0,0 +1,51 @@
+import json
+import types
+
+import pytest
+
+try:
+    import benchmark
+    from rpc_batch import RpcCounter
+except ImportError as e:
+    # web3 4.x of requirements.txt does not import on Python 3.10+
+    pytest.skip("web3 is not importable: {}".format(e), allow_module_level=True)
+
+
+def test_link_bytecode():
+    placeholder = '__' + 'Helper'.ljust(36, '_') + '__'
+    linked = benchmark.link_bytecode('6060' + placeholder + '00', {'Helper': '0x' + 'AB' * 20})
+    assert linked == '6060' + 'ab' * 20 + '00'
+    with pytest.raises(KeyError):
+        benchmark.link_bytecode('6060' + placeholder, {})
+
+
+def fake_autoranker():
+    return types.SimpleNamespace(rpc_counter=RpcCounter(), batch_caller=types.SimpleNamespace(round_trips=0))
+
+
+def test_measure_counts_requests_and_failures():
+    autoranker = fake_autoranker()
+
+    def command():
+        autoranker.rpc_counter.requests += 3
+        autoranker.batch_caller.round_trips += 2
+        [0] * 100000
+
+    result = benchmark.measure(autoranker, 'show_ranking', command)
+    assert result['rpc_requests'] == 5 and result['error'] is None
+    assert result['peak_memory_bytes'] >= 800000
+
+    def failing():
+        raise ValueError('node is gone')
+
+    assert 'node is gone' in benchmark.measure(autoranker, 'show_ranking', failing)['error']
+
+
+def test_compare_prints_ratios(tmp_path, capsys):
+    baseline = {'command': 'show_ranking', 'items': 100, 'wall_time': 2.0, 'rpc_requests': 100, 'peak_memory_bytes': 1000}
+    path = str(tmp_path / 'baseline.json')
+    with open(path, 'w') as f:
+        json.dump({'results': [baseline]}, f)
+    benchmark.compare([dict(baseline, wall_time=1.0, rpc_requests=300), dict(baseline, items=1000)], path)
+    lines = [l.split() for l in capsys.readouterr().out.strip().splitlines()]
+    assert lines[-1] == ['show_ranking', '100', '0.50x', '3.00x', '1.00x']
@@ -0,0 +1,33 @@
+from commit_journal import CommitJournal, commit_hash
+
+
+WEI = 10**18
+# same vectors as solidity/test/Helper.test.js, checked there against Helper.getCommitHash
+VECTORS = [
+    (0, 100 * WEI, 1, '0xc0d6d13f20541242e91f0c659f5eea80bbdd2195ba50707f4849bb3f46e2a171'),
+    (1, 183 * WEI, 2, '0xb7e2e1dcb21ee58d491cfccf4da1529f0a6c17af8b0527af5b996e9c93bb4188'),
+    (1, 20 * WEI, 99999999, '0xf756fe663c429f80e01ba577bb6d045124ecfac35c8164fd7ec94d6a83ca9560'),
+]
+
+
+def test_commit_hash_matches_contract():
+    for (direction, stake, salt, expected) in VECTORS:
+        assert commit_hash(direction, stake, salt) == expected
+
+
+def test_pending_commitments_survive_reopen(tmp_path):
+    path = str(tmp_path / 'journal')
+    journal = CommitJournal(path)
+    keys = [journal.commit(i, None, '0xAbC', d, s, salt, h) for (i, (d, s, salt, h)) in enumerate(VECTORS)]
+    journal.close(keys[1], 'revealed')
+    with open(path, 'a') as f:
+        # crash in the middle of write
+        f.write('{"event": "commit", "key"')
+
+    journal = CommitJournal(path)
+    assert sorted(c['key'] for c in journal.pending()) == sorted([keys[0], keys[2]])
+    assert journal.pending()[0]['commit_hash'] == commit_hash(journal.pending()[0]['direction'],
+                                                             journal.pending()[0]['stake'],
+                                                             journal.pending()[0]['salt'])
+    with open(path, 'r') as f:
+        assert len(f.readlines()) == 2
@@ -0,0 +1,117 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import http_cache
+from http_cache import JsonUrlCache, parse_json_stream
+
+
+DAPPS = [{'id': i, 'name': 'dapp {}'.format(i), 'rank': 1.5e10 + i, 'ok': i % 2 == 0} for i in range(50)]
+ETAG = '"v1"'
+
+
+class StandIn(BaseHTTPRequestHandler):
+    # local stand-in for dapps export: gzip, ETag and throttling
+    requests = []
+    throttle = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        StandIn.requests.append(dict(self.headers))
+        if StandIn.throttle > 0:
+            StandIn.throttle -= 1
+            self.send_response(429)
+            self.send_header('Retry-After', '7')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(DAPPS).encode('utf-8')
+        gzipped = 'gzip' in (self.headers.get('Accept-Encoding') or '')
+        if gzipped:
+            body = gzip.compress(body)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(body)))
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    StandIn.requests = []
+    StandIn.throttle = 0
+    httpd = HTTPServer(('127.0.0.1', 0), StandIn)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}/dapps.json'.format(httpd.server_port)
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(http_cache.time, 'sleep', delays.append)
+    return delays
+
+
+def test_gzip_download_in_small_chunks(server, tmp_path, monkeypatch):
+    # every read splits numbers, strings and gzip stream
+    monkeypatch.setattr(http_cache, 'CHUNK_SIZE', 7)
+    cache = JsonUrlCache(cache_dir=str(tmp_path))
+    assert cache.get(server) == DAPPS
+    assert StandIn.requests[0]['Accept-Encoding'] == 'gzip'
+    with open(cache.cache_filename(server), 'r') as f:
+        assert json.load(f) == DAPPS
+
+
+def test_stale_cache_is_revalidated_with_etag(server, tmp_path):
+    cache = JsonUrlCache(cache_dir=str(tmp_path))
+    assert cache.get(server) == DAPPS
+    assert cache.get(server, cache_ttl=3600) == DAPPS
+    assert len(StandIn.requests) == 1
+
+    assert cache.get(server, cache_ttl=0) == DAPPS
+    assert len(StandIn.requests) == 2
+    assert StandIn.requests[1]['If-None-Match'] == ETAG
+
+
+def test_throttling_honors_retry_after(server, tmp_path, sleeps):
+    StandIn.throttle = 2
+    cache = JsonUrlCache(cache_dir=str(tmp_path))
+    assert cache.get(server) == DAPPS
+    assert len(StandIn.requests) == 3
+    assert sleeps == [7.0, 7.0]
+
+
+def test_throttled_out_gives_none(server, tmp_path, sleeps):
+    StandIn.throttle = 10
+    cache = JsonUrlCache(cache_dir=str(tmp_path), max_tries=3)
+    assert cache.get(server) is None
+    assert len(StandIn.requests) == 3
+
+
+@pytest.mark.parametrize('text', ['[1,2,3.5e10]', '[-1.5E-3, true, null, "a,]b", {"x": [1, 2]}, [], -0]', ' [ ] ', '{"a": [1]}', '3'])
+def test_parse_json_stream_any_split(text):
+    expected = json.loads(text)
+    for size in range(1, len(text) + 1):
+        assert parse_json_stream(text[i:i + size] for i in range(0, len(text), size)) == expected
+
+
+@pytest.mark.parametrize('text', ['[1 2]', '[1,]', '[,1]', '[1,,2]', '[1]x', '[1', '[1,2', '[3x]', '[1.2.3]', '[1]]'])
+def test_parse_json_stream_rejects_invalid(text):
+    for size in (1, len(text)):
+        with pytest.raises(ValueError):
+            parse_json_stream(text[i:i + size] for i in range(0, len(text), size))
@@ -0,0 +1,52 @@
+import random
+
+import numpy as np
+
+from rank_trajectory import RankTrajectories
+
+
+def rank_for_timestamp(last_rank, movings, timestamp):
+    # Ranking.getRankForTimestamp in Python ints
+    rank = last_rank
+    for m in movings:
+        moved = min(max(timestamp - m['startTime'], 0) * m['speed'], m['distance'])
+        rank = rank + moved if m['direction'] != 0 else rank - moved
+    return rank
+
+
+def random_movings(rng, aligned, huge):
+    unit = 10**9 if aligned else 1
+    last_ranks = {}
+    movings = []
+    for item_id in range(4):
+        last_ranks[item_id] = rng.randint(10**20, 10**21) // unit * unit * (10**30 if huge else 1)
+        for n in range(rng.randint(0, 5)):
+            movings.append({'itemId': item_id,
+                            'movingId': len(movings),
+                            'startTime': 1000 + rng.randint(0, 5000),
+                            'speed': (rng.randint(1, 10**17) // unit + 1) * unit,
+                            'distance': (rng.randint(1, 10**20) // unit + 1) * unit * (10**30 if huge else 1),
+                            'direction': rng.randint(0, 1)})
+    return last_ranks, movings
+
+
+def test_ranks_are_exact():
+    rng = random.Random(3)
+    grid = np.arange(0, 10**7, 997, dtype=np.int64)
+    for case in range(30):
+        (aligned, huge) = (case % 3 == 0, case % 3 == 2)
+        last_ranks, movings = random_movings(rng, aligned, huge)
+        trajectories = RankTrajectories().load(movings, last_ranks)
+        assert (trajectories.dtype is np.int64) == (not huge and aligned)
+        ranks = trajectories.evaluate(grid)
+        for row, item_id in enumerate(trajectories.item_ids.tolist()):
+            own = [m for m in movings if m['itemId'] == item_id]
+            for col in range(0, len(grid), 250):
+                expected = rank_for_timestamp(last_ranks[item_id], own, int(grid[col]))
+                assert int(ranks[row, col]) * trajectories.scale == expected
+
+
+def test_removed_moving_is_taken_out_of_last_rank():
+    moving = {'itemId': 1, 'movingId': 7, 'startTime': 0, 'speed': 10**18, 'distance': 5 * 10**18, 'direction': 1}
+    trajectories = RankTrajectories().load([moving], {1: 105 * 10**18}, removed_ids=[7])
+    assert trajectories.to_tokens(trajectories.evaluate([0, 2, 10])).tolist() == [[100.0, 102.0, 105.0]]
@@ -0,0 +1,22 @@
+import pytest
+
+try:
+    from web3 import Web3
+    from receipt_tracker import ReceiptTracker
+except ImportError as e:
+    # web3 4.x of requirements.txt does not import on Python 3.10+
+    pytest.skip("web3 is not importable: {}".format(e), allow_module_level=True)
+
+
+def test_hashes_as_str_and_bytes():
+    tracker = ReceiptTracker(Web3())
+    tracker.start = lambda: None
+    tx_hash = '0x' + 'AB' * 32
+    future = tracker.track(tx_hash, check_mined=False)
+    assert tracker.track(bytes.fromhex('ab' * 32)) is future
+    assert tracker.replace(tx_hash, bytes.fromhex('cd' * 32)) is future
+    tracker.untrack('0x' + 'cd' * 32)
+    assert list(tracker.pending) == ['0x' + 'ab' * 32]
+    assert not future.cancelled()
+    tracker.untrack(tx_hash)
+    assert future.cancelled()
@@ -0,0 +1,65 @@
+import time
+import types
+
+import pytest
+
+try:
+    import rlp
+    from web3 import Web3
+    from autoranker import Autoranker
+    from fee_engine import FeeEngine
+    from metrics import Metrics
+    from receipt_tracker import ReceiptTracker
+except ImportError as e:
+    # web3 4.x of requirements.txt does not import on Python 3.10+
+    pytest.skip("web3 is not importable: {}".format(e), allow_module_level=True)
+
+
+PRIVATE_KEY = '0x' + '11' * 32
+UNDERPRICED = {'code': -32000, 'message': 'replacement transaction underpriced'}
+
+
+def gas_price(raw):
+    # legacy signed transaction: [nonce, gasPrice, gas, to, value, data, v, r, s]
+    return int.from_bytes(rlp.decode(bytes(raw))[1], 'big')
+
+
+def make_autoranker(sent):
+    web3 = Web3()
+
+    def send_raw_transaction(raw):
+        sent.append(raw)
+        raise ValueError(UNDERPRICED)
+
+    web3.eth.sendRawTransaction = send_raw_transaction
+    fee_engine = FeeEngine(web3, min_price=Web3.toWei(1, 'gwei'), max_price=Web3.toWei(50, 'gwei'))
+    # price history is fresh: no node requests
+    fee_engine.blocks = {1: (0, Web3.toWei(1, 'gwei'))}
+    fee_engine.refreshed_at = time.time() + 3600
+    receipt_tracker = ReceiptTracker(web3)
+    receipt_tracker.start = lambda: None
+    return types.SimpleNamespace(web3=web3, fee_engine=fee_engine, receipt_tracker=receipt_tracker,
+                                 metrics=Metrics(), max_replacements=3)
+
+
+def test_underpriced_replacement_bumps_price_and_gives_up():
+    sent = []
+    ar = make_autoranker(sent)
+    tx = {'to': '0x' + '22' * 20, 'value': 0, 'gas': 21000, 'gasPrice': Web3.toWei(2, 'gwei'), 'nonce': 7, 'chainId': 1}
+    tx_hash = ar.web3.toHex(ar.web3.eth.account.signTransaction(tx, private_key=PRIVATE_KEY).get('hash'))
+    future = ar.receipt_tracker.track(tx_hash, check_mined=False)
+    replace = Autoranker.stuck_tx_replacer(ar, tx, PRIVATE_KEY, None, None, {})
+
+    assert replace(tx_hash) is not None
+    assert replace(tx_hash) is not None
+    # second bump starts from rejected attempt, not from original price
+    assert len(sent) == 2
+    assert tx['gasPrice'] < gas_price(sent[0]) < gas_price(sent[1])
+    # attempts which were not broadcast are not tracked
+    assert list(ar.receipt_tracker.pending) == [tx_hash.lower()]
+    assert not future.done()
+
+    assert replace(tx_hash) is not None
+    assert replace(tx_hash) is None
+    assert len(sent) == 3
+    assert gas_price(sent[1]) < gas_price(sent[2])
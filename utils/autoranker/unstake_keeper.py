@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import time
+import threading
+import functools
+
+from ranking_math import unstake_amount
+from rate_limiter import LANE_BULK
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+UNSTAKE_EVENTS = ('VotingStarted', 'VoteReveal', 'MovingStarted', 'MovingRemoved')
+
+
+class UnstakeKeeper(object):
+    # Claims stakes of our winning votes back as they unlock (Ranking.unstake), they are never returned otherwise
+    # until moving is removed by next voting on the item.
+    # Positions (stake of our account in moving of voting it won) are rebuilt from indexed events: MovingStarted
+    # emits votingId 0, so moving belongs to the last VotingStarted of its item, winners are voters whose revealed
+    # direction is direction of moving, MovingRemoved means contract already unstaked everything.
+    # Already unstaked part of position is read once with batched getVoterInfo, after that it is advanced
+    # locally from our unstake receipts. Claimable amounts are computed with contract's math and unstake(itemId)
+    # is sent only for (item, account) pairs where it reaches threshold
+
+    def __init__(self, autoranker, threshold, max_in_flight=16):
+        self.autoranker = autoranker
+        self.threshold = threshold
+        self.max_in_flight = max_in_flight
+        self.accounts = dict((a['address'].lower(), a) for a in autoranker.config['accounts'])
+        # (voting_id, account) -> unstaked wei
+        self.unstaked = {}
+        self.block_timestamps = {}
+        self.stats = {'unstaked': 0, 'reverted': 0, 'failed': 0, 'claimed_wei': 0}
+
+    def positions(self):
+        # open winning positions of our accounts
+        event_index = self.autoranker.get_event_index()
+        event_index.sync()
+        item_votings = {}
+        reveals = {}
+        positions = {}
+        for e in event_index.get_events(UNSTAKE_EVENTS):
+            args = e['args']
+            if e['event'] == 'VotingStarted':
+                item_votings[int(args['itemId'])] = int(args['votingId'])
+            elif e['event'] == 'VoteReveal':
+                if args['voter'].lower() in self.accounts:
+                    reveals.setdefault(int(args['votingId']), {})[args['voter'].lower()] = (int(args['direction']), int(args['stake']))
+            elif e['event'] == 'MovingStarted':
+                voting_id = item_votings.pop(int(args['itemId']), None)
+                moving = {'start': args['startTime'], 'speed': args['speed'], 'distance': args['distance'], 'direction': args['direction']}
+                for account, (direction, stake) in reveals.pop(voting_id, {}).items():
+                    # Voting.isWinner(): vote option 1 is up, anything else is down
+                    if (1 if direction == 1 else 0) != int(args['direction']) or stake == 0:
+                        continue
+                    positions[(int(args['movingId']), account)] = {'item_id': int(args['itemId']),
+                                                                   'voting_id': voting_id,
+                                                                   'account': account,
+                                                                   'stake': stake,
+                                                                   'moving': moving}
+            elif e['event'] == 'MovingRemoved':
+                for key in [k for k in positions if k[0] == int(args['movingId'])]:
+                    del positions[key]
+        return list(positions.values())
+
+    def bootstrap(self, positions):
+        # unstaked part of positions seen first time, one batch
+        ar = self.autoranker
+        unknown = sorted(set((p['voting_id'], p['account']) for p in positions) - set(self.unstaked))
+        if not unknown:
+            return
+        infos = ar.batch_caller.call_many(ar.tcrank, 'getVoterInfo',
+                                          [[voting_id, ar.web3.toChecksumAddress(account)] for (voting_id, account) in unknown])
+        stakes = dict(((p['voting_id'], p['account']), p['stake']) for p in positions)
+        for key, info in zip(unknown, infos):
+            # voting is deleted when its moving is removed in block not indexed yet
+            self.unstaked[key] = info[2] if info is not None else stakes[key]
+
+    def claimable(self, positions, now=None):
+        # {(item_id, account): wei sent by unstake(item_id) from account at now}
+        now = now or time.time()
+        claims = {}
+        for p in positions:
+            amount = unstake_amount(p['stake'], self.unstaked[(p['voting_id'], p['account'])], p['moving'], now)
+            if amount > 0:
+                claims[(p['item_id'], p['account'])] = claims.get((p['item_id'], p['account']), 0) + amount
+        return claims
+
+    def block_timestamp(self, block_number):
+        if block_number not in self.block_timestamps:
+            self.block_timestamps[block_number] = self.autoranker.web3.eth.getBlock(block_number)['timestamp']
+        return self.block_timestamps[block_number]
+
+    def confirmed(self, a, positions, slots, results, future):
+        # receipt tracker callback, unstaked parts are advanced as contract did it in receipt's block
+        receipt = None
+        if not future.cancelled() and future.exception() is None:
+            receipt = future.result()
+        key = (a['params'][0], a['account']['address'].lower())
+        try:
+            self.autoranker.action_done(a, receipt)
+            if receipt is not None and receipt.get('status', 1) != 0:
+                timestamp = self.block_timestamp(receipt['blockNumber'])
+                for p in positions:
+                    k = (p['voting_id'], p['account'])
+                    self.unstaked[k] += unstake_amount(p['stake'], self.unstaked[k], p['moving'], timestamp)
+        finally:
+            if receipt is None:
+                results[key] = 'failed'
+            elif receipt.get('status', 1) == 0:
+                results[key] = 'reverted'
+            else:
+                results[key] = 'unstaked'
+                self.stats['claimed_wei'] += a['claimable']
+            slots.release()
+
+    def unstake(self, positions, claims):
+        ar = self.autoranker
+        slots = threading.Semaphore(self.max_in_flight)
+        results = {}
+        # largest claims first, capital comes back sooner
+        for (item_id, account), amount in sorted(claims.items(), key=lambda c: -c[1]):
+            slots.acquire()
+            own = [p for p in positions if p['item_id'] == item_id and p['account'] == account]
+            a = {'action': 'unstake',
+                 'params': [item_id],
+                 'account': self.accounts[account],
+                 'claimable': amount,
+                 'features': ar.gas_model.features(0, len(own)),
+                 'wait': 0}
+            try:
+                a['tx_hash'] = ar.send_action(a, ar.build_action_tx(a))
+            except Exception as e:
+                logger.error("DApp [{}], error calling unstake() from {}: {}".format(item_id, account, repr(e)))
+                results[(item_id, account)] = 'failed'
+                slots.release()
+                continue
+            logger.debug("DApp [{}], unstake() of {} CRN sent from {}, tx_hash: {}"
+                         .format(item_id, ar.web3.fromWei(amount, 'ether'), account, a['tx_hash']))
+            ar.receipt_tracker.track(a['tx_hash']).add_done_callback(functools.partial(self.confirmed, a, own, slots, results))
+
+        # wait for last transactions in flight
+        for n in range(self.max_in_flight):
+            slots.acquire()
+
+        for status in results.values():
+            self.stats[status] += 1
+        return results
+
+    def run(self, watch=False, interval=60):
+        ar = self.autoranker
+        while True:
+            start = time.time()
+            with ar.rpc_limiter.lane(LANE_BULK):
+                positions = self.positions()
+                self.bootstrap(positions)
+            claims = self.claimable(positions)
+            locked = sum(p['stake'] - self.unstaked[(p['voting_id'], p['account'])] for p in positions)
+            selected = dict((k, v) for (k, v) in claims.items() if v >= self.threshold)
+            print("Open positions: {}, locked: {} CRN, claimable: {} CRN, unstake() calls: {}"
+                  .format(len(positions), ar.web3.fromWei(locked, 'ether'),
+                          ar.web3.fromWei(sum(claims.values()), 'ether'), len(selected)))
+            if selected:
+                results = self.unstake(positions, selected)
+                print("unstake() results: {}, {}s"
+                      .format(', '.join("{} {}: {}".format(k[0], k[1], v) for (k, v) in sorted(results.items())), round(time.time() - start, 2)))
+            if not watch:
+                return self.stats
+            time.sleep(max(interval - (time.time() - start), 0))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import time
+import threading
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+class ViewCache(object):
+    # Read-through cache of contract view calls keyed by (contract, method, args, block number).
+    # Calls are pinned to the cached block number, which is rechecked at most every block_poll_interval
+    # seconds; all entries are dropped when new block arrives. Entries can be tagged (e.g. ('item', id),
+    # ('address', addr)) and invalidated by tag when our own transaction touches that state
+
+    def __init__(self, web3, block_poll_interval=1.0):
+        self.web3 = web3
+        self.block_poll_interval = block_poll_interval
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.tags = {}
+        self.block = None
+        self.block_checked_at = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def current_block(self):
+        if time.time() - self.block_checked_at < self.block_poll_interval and self.block is not None:
+            return self.block
+
+        block = self.web3.eth.blockNumber
+        with self.lock:
+            self.block_checked_at = time.time()
+            if block != self.block:
+                self.block = block
+                self.entries = {}
+                self.tags = {}
+        return block
+
+    def get(self, key, fetch, tags=()):
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        value = fetch()
+
+        with self.lock:
+            # block may be changed while fetching, then value belongs to old block and is not stored
+            if key[-1] == self.block:
+                self.entries[key] = value
+                for tag in tags:
+                    self.tags.setdefault(tag, set()).add(key)
+        return value
+
+    def call(self, contract_function, tags=()):
+        block = self.current_block()
+        key = (contract_function.address, contract_function.fn_name, tuple(contract_function.args or ()), block)
+        return self.get(key, lambda: contract_function.call(block_identifier=block), tags)
+
+    def get_balance(self, address):
+        block = self.current_block()
+        key = ('eth', 'getBalance', (address,), block)
+        return self.get(key, lambda: self.web3.eth.getBalance(address, block), [('address', address)])
+
+    def invalidate(self, tag):
+        with self.lock:
+            for key in self.tags.pop(tag, ()):
+                if key in self.entries:
+                    del self.entries[key]
+                    self.invalidations += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / total, 3) if total else 0}
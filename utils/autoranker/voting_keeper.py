@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import time
+import threading
+import functools
+
+from rate_limiter import LANE_BULK
+
+import logging
+logger = logging.getLogger('autoranker')
+
+
+class VotingKeeper(object):
+    # Finishes every voting whose reveal phase is over, not only votings started by this process.
+    # Open votings are taken from event index (last VotingStarted of item without later VotingFinished),
+    # then checked against current item state with one batched getItem/getVoting read, because index
+    # lags head by `confirmations` blocks. finishVoting transactions are sent in deadline order (oldest
+    # first), at most max_in_flight of them are unconfirmed at once
+
+    def __init__(self, autoranker, max_in_flight=16, phase_margin=2):
+        self.autoranker = autoranker
+        self.max_in_flight = max_in_flight
+        # seconds added to reveal deadline, contract requires block timestamp to be after it
+        self.phase_margin = phase_margin
+        self.stats = {'finished': 0, 'reverted': 0, 'failed': 0}
+
+    def open_votings(self):
+        # {item_id: voting_id} of indexed votings that are not finished
+        event_index = self.autoranker.get_event_index()
+        event_index.sync()
+        votings = {}
+        for e in event_index.get_events(['VotingStarted', 'VotingFinished']):
+            item_id = int(e['args']['itemId'])
+            if e['event'] == 'VotingStarted':
+                votings[item_id] = int(e['args']['votingId'])
+            else:
+                votings.pop(item_id, None)
+        return votings
+
+    def expired(self, now=None):
+        # votings allowed to be finished, sorted by reveal deadline
+        ar = self.autoranker
+        with ar.rpc_limiter.lane(LANE_BULK):
+            item_ids = sorted(self.open_votings())
+            if not item_ids:
+                return []
+            block = ar.batch_caller.block_number()
+            items = ar.batch_caller.call_many(ar.tcrank, 'getItem', [[i] for i in item_ids], block)
+            # voting may be finished or replaced by new one in blocks not indexed yet
+            current = [(item_id, item) for (item_id, item) in zip(item_ids, items) if item is not None and int(item[3]) != 0]
+            votings = ar.batch_caller.call_many(ar.tcrank, 'getVoting', [[int(item[3])] for (item_id, item) in current], block)
+
+        now = now or time.time()
+        result = []
+        for (item_id, item), v in zip(current, votings):
+            if v is None:
+                continue
+            # v[4] - start, v[2] - commit phase length, v[3] - reveal phase length
+            deadline = v[4] + v[2] + v[3]
+            if deadline + self.phase_margin >= now:
+                continue
+            result.append({'item_id': item_id,
+                           'voting_id': int(item[3]),
+                           'deadline': deadline,
+                           'voters': len(v[7]),
+                           'movings': len(item[4])})
+        return sorted(result, key=lambda v: (v['deadline'], v['item_id']))
+
+    def confirmed(self, a, slots, results, future):
+        # receipt tracker callback, frees in-flight slot
+        receipt = None
+        if not future.cancelled() and future.exception() is None:
+            receipt = future.result()
+        try:
+            self.autoranker.action_done(a, receipt)
+        finally:
+            if receipt is None:
+                results[a['params'][0]] = 'failed'
+            elif receipt.get('status', 1) == 0:
+                # other keeper or voting owner was faster
+                results[a['params'][0]] = 'reverted'
+            else:
+                results[a['params'][0]] = 'finished'
+            slots.release()
+
+    def finish(self, votings):
+        ar = self.autoranker
+        slots = threading.Semaphore(self.max_in_flight)
+        results = {}
+        for v in votings:
+            slots.acquire()
+            # gas model features are known from batched read, no per-item state calls
+            a = {'action': 'finishVoting',
+                 'params': [v['item_id']],
+                 'features': ar.gas_model.features(v['voters'], v['movings']),
+                 'wait': 0}
+            try:
+                a['tx_hash'] = ar.send_action(a, ar.build_action_tx(a))
+            except Exception as e:
+                logger.error("DApp [{}], error calling finishVoting() function: {}".format(v['item_id'], repr(e)))
+                results[v['item_id']] = 'failed'
+                slots.release()
+                continue
+            logger.debug("DApp [{}], finishVoting() of voting {} sent {}s after deadline, tx_hash: {}"
+                         .format(v['item_id'], v['voting_id'], int(time.time() - v['deadline']), a['tx_hash']))
+            ar.receipt_tracker.track(a['tx_hash']).add_done_callback(functools.partial(self.confirmed, a, slots, results))
+
+        # wait for last transactions in flight
+        for n in range(self.max_in_flight):
+            slots.acquire()
+
+        for status in results.values():
+            self.stats[status] += 1
+        return results
+
+    def run(self, watch=False, interval=60):
+        while True:
+            start = time.time()
+            votings = self.expired()
+            if votings:
+                results = self.finish(votings)
+                print("Expired votings: {}, finishVoting() results: {}, {}s"
+                      .format(len(votings), ', '.join("{}: {}".format(k, v) for (k, v) in sorted(results.items())), round(time.time() - start, 2)))
+            else:
+                print("No expired votings")
+            if not watch:
+                return self.stats
+            time.sleep(max(interval - (time.time() - start), 0))
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import json
+import shutil
+
+import numpy as np
+
+
+CURATOR_TYPES = ('user', 'whale')
+
+
+class ColumnarState(object):
+    # Struct-of-arrays state of RegistryModel population, for 100k+ curators and 10k+ dapps.
+    # One NumPy array per field instead of Curator/Dapp objects with dicts. Open votes are kept
+    # CSR-style grouped by dapp: votes of dapp d are vote_curator/vote_impulse[vote_indptr[d]:vote_indptr[d + 1]].
+    # New votes are appended to pending buffer and merged into CSR by compact(), later vote of
+    # curator on the same dapp replaces earlier one (as RegistryModel.vote_on_dapp does).
+    # Checkpoint is .npz file or directory of .npy files, the latter is opened memory-mapped
+
+    CURATOR_ARRAYS = ('curator_type', 'curator_balance', 'curator_profit', 'curator_stake')
+    DAPP_ARRAYS = ('dapp_rank', 'dapp_beauty', 'dapp_voting')
+    VOTE_ARRAYS = ('vote_indptr', 'vote_curator', 'vote_impulse')
+
+    def __init__(self, n_curators, n_dapps, arrays=None):
+        self.n_curators = int(n_curators)
+        self.n_dapps = int(n_dapps)
+        if arrays is not None:
+            for name in self.CURATOR_ARRAYS + self.DAPP_ARRAYS + self.VOTE_ARRAYS:
+                setattr(self, name, arrays[name])
+        else:
+            # curator_type - index in CURATOR_TYPES, money in CRN
+            self.curator_type = np.zeros(self.n_curators, dtype=np.int8)
+            self.curator_balance = np.zeros(self.n_curators, dtype=np.float64)
+            self.curator_profit = np.zeros(self.n_curators, dtype=np.float64)
+            # sum of |impulse| of curator's open votes
+            self.curator_stake = np.zeros(self.n_curators, dtype=np.float64)
+            self.dapp_rank = np.zeros(self.n_dapps, dtype=np.float64)
+            self.dapp_beauty = np.zeros(self.n_dapps, dtype=np.float64)
+            self.dapp_voting = np.zeros(self.n_dapps, dtype=np.bool_)
+            self.vote_indptr = np.zeros(self.n_dapps + 1, dtype=np.int64)
+            self.vote_curator = np.zeros(0, dtype=np.int32)
+            self.vote_impulse = np.zeros(0, dtype=np.float64)
+        self.pending = []
+
+    @classmethod
+    def random(cls, n_curators, n_dapps, rng, curator_types):
+        # rng - numpy.random.Generator, curator_types - {type: probability} like RegistryModel config
+        state = cls(n_curators, n_dapps)
+        p = np.array([curator_types.get(t, 0) for t in CURATOR_TYPES], dtype=np.float64)
+        state.curator_type[:] = rng.choice(len(CURATOR_TYPES), size=n_curators, p=p / p.sum())
+        state.dapp_rank[:] = np.round(rng.random(n_dapps))
+        state.dapp_beauty[:] = rng.random(n_dapps)
+        return state
+
+    @classmethod
+    def from_model(cls, model):
+        # ids of RegistryModel are 0..n-1
+        state = cls(len(model.users), len(model.dapps))
+        for i, curator in model.users.items():
+            state.curator_type[i] = CURATOR_TYPES.index(curator.type)
+            state.curator_balance[i] = curator.balance
+            state.curator_profit[i] = curator.stats['profit']
+        for i, dapp in model.dapps.items():
+            state.dapp_rank[i] = dapp.rank
+            state.dapp_beauty[i] = dapp.beauty
+            if isinstance(dapp.voting, dict) and dapp.voting:
+                user_ids = sorted(dapp.voting)
+                state.vote(user_ids, [i] * len(user_ids), [dapp.voting[u] for u in user_ids])
+        state.compact()
+        return state
+
+    def vote(self, curator_ids, dapp_ids, impulses):
+        curator_ids = np.asarray(curator_ids, dtype=np.int32)
+        dapp_ids = np.asarray(dapp_ids, dtype=np.int64)
+        impulses = np.asarray(impulses, dtype=np.float64)
+        self.pending.append((dapp_ids, curator_ids, impulses))
+
+    def vote_dapps(self):
+        # dapp id of every vote in CSR arrays
+        return np.repeat(np.arange(self.n_dapps, dtype=np.int64), np.diff(self.vote_indptr))
+
+    def compact(self):
+        if not self.pending:
+            return
+        dapps = np.concatenate([self.vote_dapps()] + [p[0] for p in self.pending])
+        curators = np.concatenate([self.vote_curator] + [p[1] for p in self.pending])
+        impulses = np.concatenate([self.vote_impulse] + [p[2] for p in self.pending])
+        self.pending = []
+
+        # stable sort by (dapp, curator) keeps arrival order inside group, last vote wins
+        order = np.lexsort((curators, dapps))
+        dapps, curators, impulses = dapps[order], curators[order], impulses[order]
+        last = np.ones(len(dapps), dtype=np.bool_)
+        last[:-1] = (dapps[1:] != dapps[:-1]) | (curators[1:] != curators[:-1])
+        dapps, curators, impulses = dapps[last], curators[last], impulses[last]
+
+        self.vote_indptr = np.zeros(self.n_dapps + 1, dtype=np.int64)
+        np.cumsum(np.bincount(dapps, minlength=self.n_dapps), out=self.vote_indptr[1:])
+        self.vote_curator = curators.astype(np.int32)
+        self.vote_impulse = impulses
+        self.dapp_voting = np.diff(self.vote_indptr) > 0
+        self.curator_stake = np.bincount(curators, weights=np.abs(impulses), minlength=self.n_curators)
+
+    def votes_of(self, dapp_id):
+        self.compact()
+        (start, end) = (self.vote_indptr[dapp_id], self.vote_indptr[dapp_id + 1])
+        return self.vote_curator[start:end], self.vote_impulse[start:end]
+
+    def finish_votings(self, dapp_ids=None):
+        # final impulse (sum of votes) of every dapp, votes of finished dapps are dropped
+        self.compact()
+        final = np.add.reduceat(np.append(self.vote_impulse, 0.0), self.vote_indptr[:-1]) * self.dapp_voting
+        finished = np.ones(self.n_dapps, dtype=np.bool_) if dapp_ids is None else np.isin(np.arange(self.n_dapps), dapp_ids)
+        keep = ~np.repeat(finished, np.diff(self.vote_indptr))
+        if dapp_ids is not None:
+            final = np.where(finished, final, 0.0)
+        self.pending.append((self.vote_dapps()[keep], self.vote_curator[keep], self.vote_impulse[keep]))
+        self.vote_indptr = np.zeros(self.n_dapps + 1, dtype=np.int64)
+        self.vote_curator = np.zeros(0, dtype=np.int32)
+        self.vote_impulse = np.zeros(0, dtype=np.float64)
+        self.compact()
+        return final
+
+    def random_round(self, rng, vote_power=50):
+        # RegistryModel.user_decide_and_vote() for every curator at once
+        dapp_ids = rng.integers(0, self.n_dapps, size=self.n_curators)
+        impulses = np.floor(rng.random(self.n_curators) * 2 * vote_power) - vote_power
+        self.vote(np.arange(self.n_curators), dapp_ids, impulses)
+
+    def nbytes(self):
+        self.compact()
+        return sum(getattr(self, name).nbytes for name in self.CURATOR_ARRAYS + self.DAPP_ARRAYS + self.VOTE_ARRAYS)
+
+    def save(self, path, meta=None):
+        # path *.npz - one file, otherwise directory with .npy per array (memory-mappable on load).
+        # Written next to target and renamed, interrupted save leaves previous checkpoint intact
+        self.compact()
+        arrays = dict((name, getattr(self, name)) for name in self.CURATOR_ARRAYS + self.DAPP_ARRAYS + self.VOTE_ARRAYS)
+        meta = dict(meta or {}, n_curators=self.n_curators, n_dapps=self.n_dapps)
+        tmp = path + '.tmp'
+        if path.endswith('.npz'):
+            with open(tmp, 'wb') as f:
+                np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+            os.replace(tmp, path)
+            return
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + '.npy'), array)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        if os.path.isdir(path):
+            old = path + '.old'
+            os.rename(path, old)
+            os.rename(tmp, path)
+            shutil.rmtree(old)
+        else:
+            os.rename(tmp, path)
+
+    @classmethod
+    def load(cls, path, mmap_mode='c'):
+        # returns (state, meta). Directory arrays are memory-mapped: 'r' to inspect, 'c' (copy-on-write)
+        # to resume without touching checkpoint, .npz is always read into memory
+        if path.endswith('.npz'):
+            with np.load(path) as data:
+                arrays = dict((name, data[name]) for name in data.files if name != 'meta')
+                meta = json.loads(str(data['meta']))
+        else:
+            names = cls.CURATOR_ARRAYS + cls.DAPP_ARRAYS + cls.VOTE_ARRAYS
+            arrays = dict((name, np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)) for name in names)
+            with open(os.path.join(path, 'meta.json'), 'r') as f:
+                meta = json.load(f)
+        return cls(meta['n_curators'], meta['n_dapps'], arrays), meta
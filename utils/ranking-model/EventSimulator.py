@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import time
+import heapq
+import itertools
+
+from RankingContract import RankingContract, Revert, get_commit_hash
+
+
+WEI = 10**18
+
+
+class EventSimulator(object):
+    # Discrete-event simulation of curation on RankingContract (Python port of Ranking.sol),
+    # curators and dapps are taken from RegistryModel. Time is virtual: events are kept in heap
+    # ordered by (timestamp, sequence number) and clock jumps to next event, so months of curation
+    # run in seconds. Every curator decides to vote at exponentially distributed intervals, then its
+    # reveal is scheduled inside reveal phase, keeper finishes every voting right after reveal phase and
+    # winners unstake periodically while their stakes are locked. All randomness comes from injected rng,
+    # same seed gives same run
+
+    def __init__(self, model, rng, config):
+        self.model = model
+        self.rng = rng
+        self.config = config
+        self.now = config.get('start_time', 1538000000)
+        self.queue = []
+        self.seq = itertools.count()
+        self.stats = {'events': 0, 'decisions': 0, 'busy': 0, 'commits': 0, 'reveals': 0,
+                      'finishes': 0, 'unstakes': 0, 'unstaked': 0, 'reverts': {}}
+
+        self.owner = 'owner'
+        self.keeper = 'keeper'
+        self.contract = RankingContract(self.owner, config.get('contract_params'))
+        ids = sorted(model.dapps)
+        ranks = [int(model.dapps[i].beauty * config.get('initial_rank', 300) * WEI) for i in ids]
+        self.contract.new_items_with_ranks(self.now, self.owner, ids, ranks)
+
+        types = sorted(config['curator_types'])
+        weights = [config['curator_types'][t] for t in types]
+        self.initial_balance = config.get('initial_balance', 1000) * WEI
+        for curator in model.users.values():
+            curator.type = rng.choices(types, weights)[0]
+            self.contract.transfer(self.now, self.owner, curator.address, self.initial_balance)
+        self.sync()
+
+    def schedule(self, timestamp, action, *args):
+        heapq.heappush(self.queue, (int(timestamp), next(self.seq), action, args))
+
+    def call(self, name, fn, *args):
+        # contract transaction at current virtual time, None if it reverted
+        try:
+            return fn(self.now, *args)
+        except Revert as e:
+            key = "{}: {}".format(name, e)
+            self.stats['reverts'][key] = self.stats['reverts'].get(key, 0) + 1
+            return None
+
+    def next_decision(self, curator):
+        interval = self.rng.expovariate(1.0 / self.config.get('vote_interval', 3600))
+        self.schedule(self.now + 1 + interval, self.decide, curator)
+
+    def stake_for(self, curator):
+        # whales vote with 10x power
+        power = self.config['vote_power'] * (10 if curator.type == 'whale' else 1)
+        return max(int(self.rng.uniform(0, 1) * power * WEI), 1)
+
+    def decide(self, curator):
+        self.stats['decisions'] += 1
+        self.next_decision(curator)
+        dapp = self.model.dapps[self.rng.choice(sorted(self.model.dapps))]
+        item = self.contract.items[dapp.id]
+        if item['voting_id'] != 0 and self.contract.get_voting_state(self.now, item['voting_id']) != 'commiting':
+            self.stats['busy'] += 1
+            return
+
+        # curator pushes up dapps it likes
+        direction = 1 if self.rng.uniform(0, 1) < dapp.beauty else 0
+        stake = self.stake_for(curator)
+        salt = self.rng.getrandbits(64)
+        started = item['voting_id'] == 0
+        voting_id = self.call('voteCommit', self.contract.vote_commit, curator.address, dapp.id, get_commit_hash(direction, stake, salt))
+        if voting_id is None:
+            return
+        self.stats['commits'] += 1
+
+        v = self.contract.votings[voting_id]
+        commit_end = v['start_time'] + v['commit_ttl']
+        reveal_end = commit_end + v['reveal_ttl']
+        self.schedule(self.rng.randint(commit_end + 1, reveal_end), self.reveal, curator, dapp.id, direction, stake, salt)
+        if started:
+            self.schedule(reveal_end + 1, self.finish, dapp.id)
+
+    def reveal(self, curator, item_id, direction, stake, salt):
+        if self.call('voteReveal', self.contract.vote_reveal, curator.address, item_id, direction, stake, salt) is not None:
+            self.stats['reveals'] += 1
+
+    def finish(self, item_id):
+        voting_id = self.contract.items[item_id]['voting_id']
+        if self.call('finishVoting', self.contract.finish_voting, self.keeper, item_id) is None:
+            return
+        self.stats['finishes'] += 1
+        for address, info in self.contract.votings[voting_id]['voters'].items():
+            if info['is_winner']:
+                self.schedule(self.now + self.config.get('unstake_interval', 86400), self.unstake, address, item_id)
+
+    def locked(self, address, item_id):
+        # stake of address still locked in movings of item
+        total = 0
+        for moving_id in self.contract.items[item_id]['movings_ids']:
+            info = self.contract.votings[self.contract.movings[moving_id]['voting_id']]['voters'].get(address)
+            if info is not None:
+                total += info['stake'] - info['unstaked']
+        return total
+
+    def unstake(self, address, item_id):
+        amount = self.call('unstake', self.contract.unstake, address, item_id)
+        if amount:
+            self.stats['unstakes'] += 1
+            self.stats['unstaked'] += amount
+        if self.locked(address, item_id) > 0:
+            self.schedule(self.now + self.config.get('unstake_interval', 86400), self.unstake, address, item_id)
+
+    def current_rank(self, item_id):
+        # getCurrentRank() reverts once downward moving passes rank 0 (SafeMath underflow),
+        # revert is counted and rank is evaluated with every moving clamped at 0
+        rank = self.call('getCurrentRank', self.contract.get_current_rank, item_id)
+        if rank is not None:
+            return rank
+        item = self.contract.items[item_id]
+        rank = item['last_rank']
+        for moving_id in item['movings_ids']:
+            m = self.contract.movings[moving_id]
+            moved = min(max(self.now - m['start_time'], 0) * m['speed'], m['distance'])
+            rank = rank + moved if m['direction'] != 0 else max(rank - moved, 0)
+        return rank
+
+    def sync(self):
+        # contract state into RegistryModel objects, tokens in CRN
+        for curator in self.model.users.values():
+            balance = self.contract.balance_of(curator.address)
+            locked = sum(self.locked(curator.address, item_id) for item_id in self.contract.items)
+            curator.balance = balance / WEI
+            curator.stats['profit'] = (balance + locked - self.initial_balance) / WEI
+        for dapp in self.model.dapps.values():
+            dapp.rank = self.current_rank(dapp.id) / WEI
+            dapp.voting = self.contract.items[dapp.id]['voting_id'] or None
+
+    def run(self, duration):
+        # simulates `duration` seconds, can be called again to continue
+        start = time.time()
+        end = self.now + int(duration)
+        if self.stats['decisions'] == 0 and not self.queue:
+            for curator in self.model.users.values():
+                self.next_decision(curator)
+        while self.queue and self.queue[0][0] <= end:
+            (timestamp, seq, action, args) = heapq.heappop(self.queue)
+            self.now = timestamp
+            action(*args)
+            self.stats['events'] += 1
+        self.now = end
+        self.sync()
+        self.stats['wall_time'] = round(time.time() - start, 3)
+        return self.stats
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import csv
+import time
+import random
+import itertools
+import multiprocessing
+
+import numpy as np
+
+from RegistryModel import RegistryModel
+from EventSimulator import EventSimulator
+from RankingContract import DEFAULT_PARAMS
+
+
+# parameters of design: contract init() parameters, simulator config and run size
+CONTRACT_PARAMS = tuple(sorted(DEFAULT_PARAMS))
+SIMULATOR_PARAMS = ('vote_interval', 'vote_power', 'unstake_interval', 'initial_balance', 'initial_rank')
+# whale_share - share of whales in curator_types mix
+RUN_PARAMS = ('days', 'curators', 'dapps', 'whale_share')
+
+METRICS = ('events', 'commits', 'reveals', 'finishes', 'unstakes', 'reverts',
+           'whales', 'whale_profit_mean', 'user_profit_mean', 'whale_advantage',
+           'rank_beauty_corr', 'contract_balance', 'avg_stake', 'error')
+
+
+def is_int(value):
+    return isinstance(value, (int, np.integer)) and not isinstance(value, bool)
+
+
+def random_int(rng, low, high):
+    # uniform integer in [low, high], wei-sized bounds do not fit int64 of rng.integers()
+    span = high - low + 1
+    if span <= 2**62:
+        return low + int(rng.integers(0, span))
+    return low + int(rng.integers(0, 2**62)) * span // 2**62
+
+
+def make_design(spec, rng):
+    # list of parameter dicts: every grid point x `samples` random draws x `repeats`.
+    # spec = {'grid': {name: [values]}, 'random': {name: [low, high]}, 'samples': n, 'repeats': k, 'fixed': {name: value}}
+    names = set(spec.get('grid', {})) | set(spec.get('random', {})) | set(spec.get('fixed', {}))
+    unknown = names - set(CONTRACT_PARAMS + SIMULATOR_PARAMS + RUN_PARAMS)
+    if unknown:
+        raise KeyError("Unknown sweep parameters: {}".format(', '.join(sorted(unknown))))
+
+    # contract parameters are uint256 in wei or precision units, float values would be truncated
+    given = [(name, [v]) for (name, v) in spec.get('fixed', {}).items()] + \
+        list(spec.get('random', {}).items()) + list(spec.get('grid', {}).items())
+    floats = set(name for (name, v) in given if name in CONTRACT_PARAMS and not all(is_int(x) for x in v))
+    if floats:
+        raise ValueError("Contract parameters must be integers: {}".format(', '.join(sorted(floats))))
+
+    grid = sorted(spec.get('grid', {}).items())
+    points = [dict(zip([n for (n, v) in grid], values)) for values in itertools.product(*[v for (n, v) in grid])]
+    bounds = sorted(spec.get('random', {}).items())
+    samples = spec.get('samples', 1) if bounds else 1
+
+    design = []
+    for point in points:
+        for n in range(samples):
+            params = dict(spec.get('fixed', {}), **point)
+            for name, (low, high) in bounds:
+                if is_int(low) and is_int(high):
+                    params[name] = random_int(rng, low, high)
+                else:
+                    params[name] = float(rng.uniform(low, high))
+            design += [params] * spec.get('repeats', 1)
+    return design
+
+
+def run_config(base_config, params):
+    config = dict(base_config)
+    config['contract_params'] = dict(base_config.get('contract_params', {}),
+                                     **dict((name, int(params[name])) for name in CONTRACT_PARAMS if name in params))
+    for name in SIMULATOR_PARAMS:
+        if name in params:
+            config[name] = params[name]
+    if 'whale_share' in params:
+        config['curator_types'] = {'whale': params['whale_share'], 'user': 1.0 - params['whale_share']}
+    config['n_dapps'] = int(params.get('dapps', 5))
+    # simulated curators need only addresses, keypairs are not generated
+    config['accounts'] = [{'address': '0x{:040x}'.format(i + 1), 'public_key': '', 'private_key': ''}
+                          for i in range(int(params.get('curators', 20)))]
+    return config
+
+
+def summarize(simulator, model):
+    stats = simulator.stats
+    profits = dict((t, [c.stats['profit'] for c in model.users.values() if c.type == t]) for t in ('whale', 'user'))
+    whale = np.mean(profits['whale']) if profits['whale'] else float('nan')
+    user = np.mean(profits['user']) if profits['user'] else float('nan')
+    ids = sorted(model.dapps)
+    ranks = np.array([model.dapps[i].rank for i in ids])
+    beauty = np.array([model.dapps[i].beauty for i in ids])
+    # Spearman correlation: does ranking follow what curators like
+    corr = float('nan')
+    if len(ids) > 1 and np.ptp(ranks) > 0:
+        corr = np.corrcoef(np.argsort(np.argsort(ranks)), np.argsort(np.argsort(beauty)))[0, 1]
+    return {'events': stats['events'],
+            'commits': stats['commits'],
+            'reveals': stats['reveals'],
+            'finishes': stats['finishes'],
+            'unstakes': stats['unstakes'],
+            'reverts': sum(stats['reverts'].values()),
+            'whales': len(profits['whale']),
+            'whale_profit_mean': float(whale),
+            'user_profit_mean': float(user),
+            'whale_advantage': float(whale - user),
+            'rank_beauty_corr': float(corr),
+            'contract_balance': simulator.contract.balance_of(simulator.contract) / 10**18,
+            'avg_stake': simulator.contract.avg_stake / 10**18}
+
+
+def run_one(task):
+    # pool worker, run is fully determined by its parameters and seed sequence.
+    # Failed run gives row with empty metrics and `error`, one bad run must not stop the sweep
+    (run_id, base_config, params, seed_sequence) = task
+    rng = random.Random(int.from_bytes(seed_sequence.generate_state(4, np.uint64).tobytes(), 'little'))
+    try:
+        config = run_config(base_config, params)
+        model = RegistryModel(config, rng)
+        simulator = EventSimulator(model, rng, config)
+        simulator.run(float(params.get('days', 30)) * 86400)
+        metrics = summarize(simulator, model)
+    except Exception as e:
+        metrics = {'error': "{}: {}".format(type(e).__name__, e)}
+    return dict(metrics, run_id=run_id, **params)
+
+
+class ParameterSweep(object):
+    # Monte Carlo sweep of EventSimulator runs over grid and/or random design of parameters.
+    # Runs are fanned out over process pool, every run gets its own child of SeedSequence(seed) by its
+    # run id, so results do not depend on number of workers or scheduling. Rows are written to CSV in
+    # run id order as soon as they are ready, same spec and seed give byte-identical results file
+
+    def __init__(self, base_config, spec, seed, workers=None):
+        self.base_config = base_config
+        self.spec = spec
+        self.seed = seed
+        self.workers = workers or os.cpu_count()
+        (design_seq, runs_seq) = np.random.SeedSequence(seed).spawn(2)
+        self.design = make_design(spec, np.random.default_rng(design_seq))
+        self.seed_sequences = runs_seq.spawn(len(self.design))
+
+    def tasks(self):
+        for run_id, (params, seed_sequence) in enumerate(zip(self.design, self.seed_sequences)):
+            yield (run_id, self.base_config, params, seed_sequence)
+
+    def columns(self):
+        names = sorted(set(itertools.chain.from_iterable(self.design)))
+        return ['run_id'] + names + list(METRICS)
+
+    def run(self, output_path):
+        start = time.time()
+        errors = 0
+        chunksize = max(1, min(16, len(self.design) // (self.workers * 4)))
+        with open(output_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns())
+            writer.writeheader()
+            pool = multiprocessing.Pool(self.workers)
+            try:
+                for n, row in enumerate(pool.imap(run_one, self.tasks(), chunksize), 1):
+                    writer.writerow(row)
+                    f.flush()
+                    errors += 1 if row.get('error') else 0
+                    if n % 100 == 0 or n == len(self.design):
+                        print("Runs done: {}/{}, failed: {}, {}s".format(n, len(self.design), errors, round(time.time() - start, 1)))
+            finally:
+                pool.terminate()
+                pool.join()
+        return len(self.design)
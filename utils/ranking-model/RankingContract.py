@@ -0,0 +1,418 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+import sha3
+
+
+# Ranking.init() parameters of solidity/migrations/3_deploy.js
+DEFAULT_PARAMS = {
+    'dynamic_fee_linear_rate': 1,
+    'dynamic_fee_linear_precision': 100,
+    'max_over_stake_factor': 100,
+    'max_fixed_fee_rate': 1,
+    'max_fixed_fee_precision': 10,
+    'unstake_speed': 5 * 10**16,
+    'commit_ttl': 30,
+    'reveal_ttl': 30,
+    'initial_avg_stake': 300 * 10**18,
+    'total_supply': 1000000 * 10**18,
+}
+
+
+class Revert(Exception):
+    # failed require() of contract, state is not changed
+    pass
+
+
+def require(condition, message=''):
+    if not condition:
+        raise Revert(message)
+
+
+def sqrt(x):
+    # Helper.sqrt()
+    if x == 0:
+        return 0
+    if x <= 3:
+        return 1
+    z = (x + 1) // 2
+    y = x
+    while z < y:
+        y = z
+        z = (x // z + z) // 2
+    return y
+
+
+def get_commit_hash(direction, stake, salt):
+    # Helper.getCommitHash(): keccak256(abi.encodePacked(uint, uint, uint))
+    keccak = sha3.keccak_256()
+    keccak.update(b''.join(int(x).to_bytes(32, 'big') for x in (direction, stake, salt)))
+    return '0x' + keccak.hexdigest()
+
+
+def sub(a, b):
+    # SafeMath.sub()
+    require(b <= a, 'SafeMath: subtraction underflow')
+    return a - b
+
+
+class RankingContract(object):
+    # Python port of Ranking.sol (with Voting.sol poll it uses) for simulations without chain.
+    # All amounts are integers in wei with the same rounding as contract. Block timestamp is passed
+    # as `now`, caller address as `sender`. Every transaction either completes or raises Revert before
+    # changing state, so state is never left half-updated. Events are appended to self.events
+
+    def __init__(self, owner, params=None):
+        p = dict(DEFAULT_PARAMS, **(params or {}))
+        self.owner = owner
+        self.dynamic_fee_linear_rate = p['dynamic_fee_linear_rate']
+        self.dynamic_fee_linear_precision = p['dynamic_fee_linear_precision']
+        self.max_over_stake_factor = p['max_over_stake_factor']
+        self.max_fixed_fee_rate = p['max_fixed_fee_rate']
+        self.max_fixed_fee_precision = p['max_fixed_fee_precision']
+        self.initial_unstake_speed = p['unstake_speed']
+        self.current_commit_ttl = p['commit_ttl']
+        self.current_reveal_ttl = p['reveal_ttl']
+        self.avg_stake = p['initial_avg_stake']
+        self.total_supply = p['total_supply']
+
+        self.balances = {owner: self.total_supply, self: 0}
+        self.items = {}
+        self.items_ids = []
+        self.votings = {}
+        self.movings = {}
+        self.polls = {}
+        self.votings_last_id = 1
+        self.movings_last_id = 1
+        self.poll_nonce = 0
+        self.stakes_counter = 1
+        self.max_rank = 0
+        self.events = []
+
+    def emit(self, name, **args):
+        self.events.append((name, args))
+
+    # tokens
+
+    def balance_of(self, address):
+        return self.balances.get(address, 0)
+
+    def transfer(self, now, sender, to, value):
+        self.balances[sender] = sub(self.balance_of(sender), value)
+        self.balances[to] = self.balance_of(to) + value
+
+    def send(self, to, value):
+        self.balances[self] = sub(self.balances[self], value)
+        self.balances[to] = self.balance_of(to) + value
+
+    def pay(self, sender, value):
+        self.balances[sender] = sub(self.balance_of(sender), value)
+        self.balances[self] += value
+
+    # view functions
+
+    def get_voting_state(self, now, voting_id):
+        require(voting_id in self.votings, 'onlyExistVoting')
+        v = self.votings[voting_id]
+        if v['start_time'] + v['commit_ttl'] + v['reveal_ttl'] < now:
+            return 'finished'
+        if v['start_time'] + v['commit_ttl'] < now:
+            return 'revealing'
+        return 'commiting'
+
+    def get_fixed_commission(self, now, item_id):
+        require(item_id in self.items, 'onlyExistItem')
+        max_fee = self.avg_stake * self.max_fixed_fee_rate // self.max_fixed_fee_precision
+        item_rank = self.get_current_rank(now, item_id)
+        if item_rank >= self.max_rank:
+            return max_fee
+        d_rank = self.max_rank - item_rank
+        return max_fee - max_fee * d_rank // self.max_rank
+
+    def get_dynamic_commission(self, stake, avg_stake):
+        if stake <= avg_stake:
+            return stake * self.dynamic_fee_linear_rate // self.dynamic_fee_linear_precision
+        over_stake = stake - avg_stake
+        fee = avg_stake * self.dynamic_fee_linear_rate // self.dynamic_fee_linear_precision
+        k = 1
+        k_precision = 1
+        max_k = sqrt(sub(self.total_supply, avg_stake))
+        x = self.max_over_stake_factor * avg_stake
+        if max_k > x:
+            k = max_k // x
+        else:
+            k_precision = x // max_k
+        return fee + (k * over_stake // k_precision) ** 2
+
+    def get_rank_for_timestamp(self, item_id, timestamp):
+        require(item_id in self.items, 'onlyExistItem')
+        item = self.items[item_id]
+        rank = item['last_rank']
+        for moving_id in item['movings_ids']:
+            m = self.movings[moving_id]
+            moved = sub(timestamp, m['start_time']) * m['speed']
+            if moved >= m['distance']:
+                moved = m['distance']
+            rank = rank + moved if m['direction'] != 0 else sub(rank, moved)
+        return rank
+
+    def get_current_rank(self, now, item_id):
+        return self.get_rank_for_timestamp(item_id, now)
+
+    def get_items_with_rank(self, now):
+        return (list(self.items_ids), [self.get_current_rank(now, i) for i in self.items_ids])
+
+    # listing
+
+    def new_items_with_ranks(self, now, sender, ids, ranks):
+        require(sender == self.owner, 'onlySuperuser')
+        require(len(ids) == len(ranks))
+        for (item_id, rank) in zip(ids, ranks):
+            require(item_id not in self.items)
+        for (item_id, rank) in zip(ids, ranks):
+            self.items_ids.append(item_id)
+            self.items[item_id] = {'owner': sender, 'last_rank': rank, 'balance': 0, 'voting_id': 0, 'movings_ids': []}
+            self.avg_stake = self.calculate_new_avg_stake(self.avg_stake, rank, self.stakes_counter)
+            self.stakes_counter += 1
+
+    def charge_balance(self, now, sender, item_id, num_tokens):
+        require(item_id in self.items and self.items[item_id]['owner'] == sender, 'onlyItemOwner')
+        require(self.items[item_id]['voting_id'] == 0)
+        self.pay(sender, num_tokens)
+        self.items[item_id]['balance'] += num_tokens
+
+    # voting
+
+    def vote_commit(self, now, sender, item_id, commitment):
+        require(item_id in self.items, 'onlyExistItem')
+        item = self.items[item_id]
+        started = item['voting_id'] == 0
+        if started:
+            voting_id = self.new_voting(now, item_id)
+        else:
+            voting_id = item['voting_id']
+        try:
+            require(self.get_voting_state(now, voting_id) == 'commiting', 'voting is not in commit phase')
+            v = self.votings[voting_id]
+            poll = self.polls[v['poll_id']]
+            require(now <= poll['commit_end_date'] and commitment != 0, 'commitVote')
+            self.pay(sender, v['fixed_fee'])
+        except Revert:
+            if started:
+                self.drop_voting(item_id, voting_id)
+            raise
+        if started:
+            self.emit('VotingStarted', itemId=item_id, votingId=voting_id, startTime=now)
+
+        v['total_prize'] += v['fixed_fee']
+        v['voters_addresses'].append(sender)
+        poll['commits'][sender] = commitment
+        self.remove_old_movings(now, item_id)
+        self.emit('VoteCommit', itemId=item_id, votingId=voting_id, voter=sender)
+        return voting_id
+
+    def vote_reveal(self, now, sender, item_id, direction, stake, salt):
+        # returns dynamic fee paid
+        require(item_id in self.items, 'onlyExistItem')
+        item = self.items[item_id]
+        require(item['voting_id'] != 0, 'item has no voting')
+        voting_id = item['voting_id']
+        require(self.get_voting_state(now, voting_id) == 'revealing', 'voting is not in reveal phase')
+        v = self.votings[voting_id]
+        poll = self.polls[v['poll_id']]
+
+        fee = self.get_dynamic_commission(stake, v['avg_stake'])
+        require(self.balance_of(sender) >= fee + stake, 'not enough tokens for stake and fee')
+        # Voting.revealVote()
+        require(poll['commit_end_date'] < now <= poll['reveal_end_date'], 'revealPeriodActive')
+        require(sender in poll['commits'], 'didCommit')
+        require(sender not in poll['reveals'], 'didReveal')
+        require(get_commit_hash(direction, stake, salt) == poll['commits'][sender], 'commit hash mismatch')
+
+        self.pay(sender, fee + stake)
+        v['total_prize'] += fee
+        v['voters'][sender] = {'direction': direction, 'stake': stake, 'unstaked': 0, 'prize': 0, 'is_winner': False}
+        if direction == 1:
+            poll['votes_for'] += stake
+        else:
+            poll['votes_against'] += stake
+        poll['reveals'][sender] = direction
+
+        self.avg_stake = self.calculate_new_avg_stake(self.avg_stake, stake, self.stakes_counter)
+        self.stakes_counter += 1
+        self.emit('VoteReveal', itemId=item_id, votingId=voting_id, voter=sender, direction=direction, stake=stake)
+        return fee
+
+    def finish_voting(self, now, sender, item_id):
+        require(item_id in self.items, 'onlyExistItem')
+        item = self.items[item_id]
+        require(item['voting_id'] != 0, 'item has no voting')
+        voting_id = item['voting_id']
+        require(self.get_voting_state(now, voting_id) == 'finished', 'voting is not finished')
+        v = self.votings[voting_id]
+        poll = self.polls[v['poll_id']]
+
+        (votes_up, votes_down) = (poll['votes_for'], poll['votes_against'])
+        direction = 1 if votes_up > votes_down else 0
+        distance = abs(votes_up - votes_down)
+        if direction == 0:
+            distance = self.distance_with_check_under_zero(now, item_id, distance, v['unstake_speed'])
+        # calculatePrize() divides by overall stake, contract fails there if only zero stakes were revealed
+        require(votes_up + votes_down > 0 or not poll['reveals'], 'division by zero overall stake')
+
+        self.send_prizes_or_unstake(voting_id)
+
+        moving_id = self.new_moving(now, v['unstake_speed'], distance, direction, voting_id)
+        item['movings_ids'].append(moving_id)
+        item['voting_id'] = 0
+        self.emit('MovingStarted', itemId=item_id, votingId=0, movingId=moving_id, startTime=now,
+                  distance=distance, direction=direction, speed=v['unstake_speed'])
+        self.emit('VotingFinished', itemId=item_id, votingId=0)
+        return moving_id
+
+    def unstake(self, now, sender, item_id):
+        # returns unstaked amount
+        total = 0
+        for moving_id in self.items.get(item_id, {}).get('movings_ids', []):
+            m = self.movings[moving_id]
+            info = self.votings[m['voting_id']]['voters'].get(sender)
+            if info is None or info['stake'] == 0 or info['stake'] <= info['unstaked']:
+                continue
+            moved = sub(now, m['start_time']) * m['speed']
+            if moved >= m['distance']:
+                amount = info['stake'] - info['unstaked']
+                info['unstaked'] = info['stake']
+            else:
+                for_unstake = info['stake'] * moved // m['distance']
+                if for_unstake <= info['unstaked']:
+                    continue
+                amount = for_unstake - info['unstaked']
+                info['unstaked'] = for_unstake
+            self.send(sender, amount)
+            total += amount
+        return total
+
+    # internal functions
+
+    def new_voting(self, now, item_id):
+        fixed_fee = self.get_fixed_commission(now, item_id)
+        voting_id = self.votings_last_id
+        self.votings_last_id += 1
+        item = self.items[item_id]
+        self.poll_nonce += 1
+        self.polls[self.poll_nonce] = {'commit_end_date': now + self.current_commit_ttl,
+                                       'reveal_end_date': now + self.current_commit_ttl + self.current_reveal_ttl,
+                                       'votes_for': 0,
+                                       'votes_against': 0,
+                                       'commits': {},
+                                       'reveals': {}}
+        self.votings[voting_id] = {'fixed_fee': fixed_fee,
+                                   'unstake_speed': self.initial_unstake_speed,
+                                   'commit_ttl': self.current_commit_ttl,
+                                   'reveal_ttl': self.current_reveal_ttl,
+                                   'start_time': now,
+                                   'total_prize': item['balance'],
+                                   'poll_id': self.poll_nonce,
+                                   'avg_stake': self.avg_stake,
+                                   'voters_addresses': [],
+                                   'voters': {}}
+        item['balance'] = 0
+        item['voting_id'] = voting_id
+        return voting_id
+
+    def drop_voting(self, item_id, voting_id):
+        # undo new_voting() of reverted voteCommit
+        v = self.votings.pop(voting_id)
+        del self.polls[v['poll_id']]
+        self.poll_nonce -= 1
+        self.votings_last_id -= 1
+        self.items[item_id]['balance'] = v['total_prize']
+        self.items[item_id]['voting_id'] = 0
+
+    def new_moving(self, start_time, speed, distance, direction, voting_id):
+        moving_id = self.movings_last_id
+        self.movings_last_id += 1
+        self.movings[moving_id] = {'start_time': start_time, 'speed': speed, 'distance': distance,
+                                   'direction': direction, 'voting_id': voting_id}
+        return moving_id
+
+    def remove_old_movings(self, now, item_id):
+        item = self.items[item_id]
+        i = 0
+        while i < len(item['movings_ids']):
+            moving_id = item['movings_ids'][i]
+            m = self.movings[moving_id]
+            if sub(now, m['start_time']) * m['speed'] < m['distance']:
+                i += 1
+                continue
+            self.unstake_for_all_voters(m['voting_id'])
+            if m['direction'] != 0:
+                item['last_rank'] += m['distance']
+            else:
+                item['last_rank'] = sub(item['last_rank'], m['distance'])
+            if self.max_rank < item['last_rank']:
+                self.max_rank = item['last_rank']
+            self.emit('MovingRemoved', _itemId=item_id, votingId=m['voting_id'], movingId=moving_id)
+            del self.polls[self.votings[m['voting_id']]['poll_id']]
+            del self.votings[m['voting_id']]
+            del self.movings[moving_id]
+            # contract moves last id into freed slot and checks it again
+            item['movings_ids'][i] = item['movings_ids'][-1]
+            item['movings_ids'].pop()
+
+    def unstake_for_all_voters(self, voting_id):
+        v = self.votings[voting_id]
+        for address in v['voters_addresses']:
+            info = v['voters'].get(address)
+            if info is not None and info['stake'] > info['unstaked']:
+                self.send(address, info['stake'] - info['unstaked'])
+                info['unstaked'] = info['stake']
+
+    def is_winner(self, poll, voter):
+        # Voting.isWinner()
+        if voter not in poll['reveals']:
+            return False
+        result = 1 if poll['votes_for'] > poll['votes_against'] else 0
+        return (1 if poll['reveals'][voter] == 1 else 0) == result
+
+    def send_prizes_or_unstake(self, voting_id):
+        v = self.votings[voting_id]
+        poll = self.polls[v['poll_id']]
+        overall_stake = poll['votes_for'] + poll['votes_against']
+        for address in v['voters_addresses']:
+            info = v['voters'].get(address)
+            if self.is_winner(poll, address):
+                # Helper.calculatePrize(), sent once per entry in votersAddresses like in contract
+                prize = v['total_prize'] * info['stake'] // overall_stake
+                info['is_winner'] = True
+                self.send(address, prize)
+            elif info is not None and info['stake'] > 0:
+                self.send(address, info['stake'])
+                info['unstaked'] = info['stake']
+
+    def distance_with_check_under_zero(self, now, item_id, distance, speed):
+        # down moving is cut so rank does not go below zero, finish_time keeps value of last
+        # loop iteration like function-scoped variable of Solidity 0.4
+        item = self.items[item_id]
+        min_expected_time = distance // speed
+        has_active_moving = False
+        finish_time = 0
+        for moving_id in item['movings_ids']:
+            m = self.movings[moving_id]
+            finish_time = m['start_time'] + m['distance'] // m['speed']
+            if finish_time > now:
+                has_active_moving = True
+                t = self.get_rank_for_timestamp(item_id, finish_time) // speed
+                if t < min_expected_time:
+                    min_expected_time = t
+        if not has_active_moving:
+            t = self.get_rank_for_timestamp(item_id, finish_time) // speed
+            if t < min_expected_time:
+                min_expected_time = t
+        return min_expected_time * speed
+
+    def calculate_new_avg_stake(self, old_avg_stake, stake, stakes_count):
+        # Helper.calculateNewAvgStake()
+        new_stakes_count = stakes_count + 1
+        return old_avg_stake // new_stakes_count * stakes_count + stake // new_stakes_count
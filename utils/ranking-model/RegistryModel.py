@@ -42,16 +42,16 @@ class Curator(object):
 
 
 class Dapp(object):
-     def __init__(self, id):
+     def __init__(self, id, rng=random):
         self.id = id
-        self.name = 'dapp' + str(round(random.random()))
-        self.rank = round(random.random())
+        self.name = 'dapp' + str(round(rng.random()))
+        self.rank = round(rng.random())
         self.voting = None
 
-        self.beauty = random.uniform(0,1)
+        self.beauty = rng.uniform(0,1)
 
      def __repr__(self):
-        return "(DApp[{}], {}, rank: {}, beauty: {}, voting: {})".format(self.id, self.name, self.rank, self.beauty, self.voting_state)
+        return "(DApp[{}], {}, rank: {}, beauty: {}, voting: {})".format(self.id, self.name, self.rank, self.beauty, self.voting)
 
 
 def log_subprocess_output(process_name, pipe):
@@ -60,8 +60,10 @@ def log_subprocess_output(process_name, pipe):
 
 class RegistryModel(object):
 
-    def __init__(self, config):
+    def __init__(self, config, rng=random):
         self.config = config
+        # random.Random(seed) for reproducible runs
+        self.rng = rng
 
         self.users = {}
         i = 0
@@ -69,10 +71,10 @@ class RegistryModel(object):
             self.users[i] = Curator(i, creds)
             i += 1  
 
-        N_dapps = 5
+        N_dapps = self.config.get('n_dapps', 5)
         self.dapps = {}
         for i in range(N_dapps):
-            self.dapps[i] = Dapp(i)
+            self.dapps[i] = Dapp(i, rng)
 
         self.ganache_proc = None
         self.ganache_pid = None
@@ -152,10 +154,10 @@ class RegistryModel(object):
         pass
 
     def get_random_user_id(self):
-        return random.choice(range(5))
+        return self.rng.choice(range(len(self.users)))
 
     def get_random_dapp_id(self):
-        return random.choice(range(5))
+        return self.rng.choice(range(len(self.dapps)))
 
 
     def vote_on_dapp(self, user_id, dapp_id, impulse):
@@ -186,7 +188,7 @@ class RegistryModel(object):
         dapp_id = self.get_random_dapp_id()
 
         # choose impulse
-        impulse = int(random.uniform(0,1) * 100) - 50
+        impulse = int(self.rng.uniform(0,1) * 100) - 50
 
         self.vote_on_dapp(user_id, dapp_id, impulse)
 
@@ -17,6 +17,11 @@ import os.path
 import random
 
 from RegistryModel import RegistryModel, Curator, Dapp
+from EventSimulator import EventSimulator
+from ColumnarState import ColumnarState, CURATOR_TYPES
+from ParameterSweep import ParameterSweep
+
+import numpy as np
 
 
 def dd(data):
@@ -58,20 +63,105 @@ def get_config(args):
         
     if (args.keys_file):
         config['accounts'] = json.load(args.keys_file)
+    elif (args.simulate):
+        # simulated curators need only addresses
+        config['accounts'] = [generate_keypair_and_address() for i in range(args.curators)]
+
+    if (args.dapps):
+        config['n_dapps'] = args.dapps
+
+    if (args.commit_ttl):
+        config.setdefault('contract_params', {})['commit_ttl'] = args.commit_ttl
+    if (args.reveal_ttl):
+        config.setdefault('contract_params', {})['reveal_ttl'] = args.reveal_ttl
 
     return config
 
 
+def simulate(config, args):
+    # no chain: Ranking.sol lifecycle is replayed on contract port with virtual clock
+    rng = random.Random(args.seed)
+    model = RegistryModel(config, rng)
+    simulator = EventSimulator(model, rng, config)
+    stats = simulator.run(args.days * 86400)
+    dd(stats)
+    for dapp_id in sorted(model.dapps, key=lambda i: -model.dapps[i].rank):
+        print(model.dapps[dapp_id])
+    for user_id in sorted(model.users):
+        print(model.users[user_id])
+
+
+def columnar_run(config, args):
+    # vectorized random voting rounds on struct-of-arrays state, resumable from checkpoint
+    if (args.resume):
+        state, meta = ColumnarState.load(args.resume)
+        rng = np.random.default_rng()
+        rng.bit_generator.state = meta['rng_state']
+        first_round = meta['round']
+        print("Resumed from '{}' at round {}".format(args.resume, first_round))
+    else:
+        rng = np.random.default_rng(args.seed)
+        state = ColumnarState.random(args.curators, args.dapps or 5, rng, config['curator_types'])
+        first_round = 0
+
+    start = time.time()
+    for n in range(first_round, first_round + args.rounds):
+        state.random_round(rng)
+        state.dapp_rank += state.finish_votings()
+        if (args.checkpoint and (n + 1) % args.checkpoint_every == 0):
+            state.save(args.checkpoint, {'round': n + 1, 'rng_state': rng.bit_generator.state})
+
+    if (args.checkpoint):
+        state.save(args.checkpoint, {'round': first_round + args.rounds, 'rng_state': rng.bit_generator.state})
+    print("Rounds: {}, curators: {}, dapps: {}, state size: {} MB, {}s"
+          .format(args.rounds, state.n_curators, state.n_dapps, round(state.nbytes() / 2**20, 1), round(time.time() - start, 2)))
+    top = np.argsort(-state.dapp_rank)[:10]
+    for dapp_id in top:
+        print("DApp[{}], rank: {}, beauty: {}".format(dapp_id, state.dapp_rank[dapp_id], state.dapp_beauty[dapp_id]))
+    print("Curator types: {}".format(dict(zip(CURATOR_TYPES, np.bincount(state.curator_type, minlength=len(CURATOR_TYPES)).tolist()))))
+
+
 def main(arguments):
 
     parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
-    parser.add_argument('--migrate-cmd', required=True, help="Ranking contract migration command", type=str)
-    parser.add_argument('--migrate-cwd', required=True, help="Ranking contract migration command working directory", type=str)
-    parser.add_argument('-k', '--keys-file', required=True, help="File with keys and addresses", type=argparse.FileType('r'))
+    parser.add_argument('--migrate-cmd', help="Ranking contract migration command", type=str)
+    parser.add_argument('--migrate-cwd', help="Ranking contract migration command working directory", type=str)
+    parser.add_argument('-k', '--keys-file', help="File with keys and addresses", type=argparse.FileType('r'))
+    parser.add_argument('--simulate', action="store_true", help="runs discrete-event simulation on Python port of Ranking contract, without ganache")
+    parser.add_argument('--days', default=30, help="simulated time in days (simulate)", type=float)
+    parser.add_argument('--curators', default=20, help="number of generated curators if no keys file is given (simulate, columnar)", type=int)
+    parser.add_argument('--dapps', help="number of dapps (default 5)", type=int)
+    parser.add_argument('--columnar', action="store_true", help="runs vectorized random voting rounds on columnar state, scales to 100k curators")
+    parser.add_argument('--rounds', default=100, help="number of voting rounds (columnar)", type=int)
+    parser.add_argument('--checkpoint', help="saves state to .npz file or directory of memory-mappable .npy files (columnar)", type=str)
+    parser.add_argument('--checkpoint-every', default=10, help="rounds between checkpoints (columnar)", type=int)
+    parser.add_argument('--resume', help="continues run from checkpoint (columnar)", type=str)
+    parser.add_argument('--sweep', help="JSON spec of parameter sweep: grid, random, samples, repeats, fixed", type=argparse.FileType('r'))
+    parser.add_argument('--workers', help="sweep processes (default: number of CPUs)", type=int)
+    parser.add_argument('--output', default='sweep_results.csv', help="CSV file with per-run results (sweep)", type=str)
+    parser.add_argument('--seed', default=1, help="random seed, same seed gives same run (simulate, columnar, sweep)", type=int)
+    parser.add_argument('--commit-ttl', help="commit phase length in seconds (simulate)", type=int)
+    parser.add_argument('--reveal-ttl', help="reveal phase length in seconds (simulate)", type=int)
     # parser.add_argument('--gen-deploy-command', help="generate ganache cli command", type=bool)
 
     args = parser.parse_args(arguments)
+    if (not args.simulate and not args.columnar and not args.sweep and not (args.migrate_cmd and args.migrate_cwd and args.keys_file)):
+        parser.error("--migrate-cmd, --migrate-cwd and --keys-file are required without --simulate, --columnar or --sweep")
     config = get_config(args)
+
+    if (args.simulate):
+        simulate(config, args)
+        return 0
+
+    if (args.columnar):
+        columnar_run(config, args)
+        return 0
+
+    if (args.sweep):
+        sweep = ParameterSweep(config, json.load(args.sweep), args.seed, args.workers)
+        print("Sweep of {} runs on {} processes into '{}'".format(len(sweep.design), sweep.workers, args.output))
+        sweep.run(args.output)
+        return 0
     
     # can be a long array (because we add all accounts from file with keys
     config['ganache_cmd'] = ["ganache-cli"]
@@ -0,0 +1,50 @@
+import csv
+
+import pytest
+
+from ParameterSweep import ParameterSweep
+
+
+SPEC = {'grid': {'dapps': [0, 3]},
+        'random': {'whale_share': [0.0, 0.5]},
+        'samples': 2,
+        'repeats': 2,
+        'fixed': {'days': 2, 'curators': 5}}
+BASE_CONFIG = {'curator_types': {'whale': 0.1, 'user': 0.9}, 'vote_power': 10}
+
+
+def read_rows(path):
+    with open(path, 'r', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def test_failed_runs_do_not_stop_sweep(tmp_path):
+    # no dapps to vote on: every such run fails
+    path = str(tmp_path / 'results.csv')
+    assert ParameterSweep(BASE_CONFIG, SPEC, seed=3, workers=2).run(path) == 8
+    rows = read_rows(path)
+    assert [int(r['run_id']) for r in rows] == list(range(8))
+    for row in rows:
+        if row['dapps'] == '0':
+            assert row['error'] and row['events'] == ''
+        else:
+            assert row['error'] == '' and int(row['events']) > 0
+
+
+def test_results_do_not_depend_on_workers(tmp_path):
+    paths = [str(tmp_path / 'results{}.csv'.format(workers)) for workers in (1, 3)]
+    for workers, path in zip((1, 3), paths):
+        ParameterSweep(BASE_CONFIG, SPEC, seed=5, workers=workers).run(path)
+    with open(paths[0], 'rb') as a, open(paths[1], 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_contract_params_are_integers():
+    spec = {'random': {'max_fixed_fee_rate': [0.0, 1.0]}, 'samples': 3}
+    with pytest.raises(ValueError, match='max_fixed_fee_rate'):
+        ParameterSweep(BASE_CONFIG, spec, seed=1)
+
+    spec = {'random': {'max_fixed_fee_rate': [1, 5], 'unstake_speed': [10**18, 10**24]}, 'samples': 20}
+    for params in ParameterSweep(BASE_CONFIG, spec, seed=1).design:
+        assert isinstance(params['unstake_speed'], int) and 10**18 <= params['unstake_speed'] <= 10**24
+        assert isinstance(params['max_fixed_fee_rate'], int) and 1 <= params['max_fixed_fee_rate'] <= 5
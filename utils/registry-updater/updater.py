@@ -19,6 +19,10 @@ from web3 import Web3, HTTPProvider, TestRPCProvider
 from solc import compile_source
 # from web3.contract import ConciseContract
 
+# receipt tracker is shared with autoranker
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'autoranker'))
+from receipt_tracker import ReceiptTracker
+
 
 def main(arguments):
 
@@ -35,12 +39,14 @@ def main(arguments):
         return 1
 
     owner_account = web3.eth.accounts[0]
-    registry = deploy_contract_and_get_instance(web3, owner_account)
+    receipt_tracker = ReceiptTracker(web3, poll_interval=1)
+    registry = deploy_contract_and_get_instance(web3, owner_account, receipt_tracker)
 
     dapps_crawler = {}
     dapps_registry = {}
     c1 = 0
     MAX_DAPPS = 50
+    uploads = {}
     with open('/tmp/dapps_dict_all', 'r') as json_file:
         dapps_crawler = json.load(json_file)
         for d in dapps_crawler:
@@ -62,7 +68,14 @@ def main(arguments):
 
             print("[DEBUG] Uploading Dapp '{}', data size: {}".format(dapp['name'], len(dapp_json)))
             tx_hash = registry.functions.addDappMetaTemp(dapp['name'], 1, dapp_json).transact({'from': owner_account})
-            web3.eth.waitForTransactionReceipt(tx_hash)
+            # uploads are independent, receipts are awaited all at once
+            uploads[tx_hash] = dapp['name']
+
+    receipts = receipt_tracker.wait(list(uploads))
+    for tx_hash, name in uploads.items():
+        if receipts.get(tx_hash) is None or receipts[tx_hash].get('status', 1) == 0:
+            print("[ERROR] Uploading Dapp '{}' failed, tx_hash: {}".format(name, web3.toHex(tx_hash)))
+    receipt_tracker.stop()
 
     print("[DEBUG] {} dapps uploaded to contract".format(c1))
     # now lets check that all dapps are uploaded correctly
@@ -120,7 +133,7 @@ def process_smartz_dapp(dapp):
 def to_32byte_hex(val):
     return Web3.toHex(Web3.toBytes(val).rjust(32, b'\0'))
 
-def deploy_contract_and_get_instance(web3, account): # web3 - web3 instance
+def deploy_contract_and_get_instance(web3, account, receipt_tracker): # web3 - web3 instance
 
 
     ################################################################
@@ -244,7 +257,7 @@ def deploy_contract_and_get_instance(web3, account): # web3 - web3 instance
     RankedRegistry = web3.eth.contract(abi=contract_interface['abi'], bytecode=contract_interface['bin'])
 
     tx_hash = RankedRegistry.constructor().transact({'from': account})
-    tx_receipt = web3.eth.waitForTransactionReceipt(tx_hash)
+    tx_receipt = receipt_tracker.track(tx_hash).result()
 
     # Get tx receipt to get contract address
     contract_address = tx_receipt['contractAddress']